@@ -37,3 +37,31 @@ class DayCountConvention(Enum):
     ACTUAL_360 = "Actual/360"
     ACTUAL_365 = "Actual/365"
     ACTUAL_ACTUAL = "Actual/Actual"
+
+
+class LotMethod(Enum):
+    """Tax lot relief methods applied when a position is reduced"""
+    FIFO = "First In First Out"
+    LIFO = "Last In First Out"
+    HIFO = "Highest In First Out"
+    SPECIFIC_ID = "Specific Identification"
+
+
+class HistoricalSimulationMethod(Enum):
+    """Historical simulation variants used for value at risk"""
+    FULL = "Full Revaluation"
+    FILTERED = "Filtered Historical Simulation"
+    AGE_WEIGHTED = "Age-Weighted Historical Simulation"
+
+
+class ShockType(Enum):
+    """Market factors shocked by stress scenarios"""
+    PRICE = "Relative Price Change"
+    FX = "Relative Change of the Currency against the Base Currency"
+    CURVE = "Parallel Yield Shift"
+
+
+class CorporateActionType(Enum):
+    """Corporate actions adjusting historical prices"""
+    SPLIT = "Stock Split"
+    CASH_DIVIDEND = "Cash Dividend"
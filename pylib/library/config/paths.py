@@ -2,3 +2,5 @@
 PROJECT_TOOLS_DIR = r"C:\Projects\PortfolioManagement\tools"
 
 XL_IMPORT_TOOL_PATH = PROJECT_TOOLS_DIR + r"\data_loader.xlsx"
+
+RETURNS_CACHE_DIR = PROJECT_TOOLS_DIR + r"\returns_cache"
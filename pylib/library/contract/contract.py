@@ -5,9 +5,10 @@ from decimal import Decimal
 from dataclasses import dataclass
 
 from pylib.library.instrument.instrument import Instrument
+from pylib.library.utils.fixed_point import to_fixed, from_fixed, date_to_ordinal, ordinal_to_date
 
 
-@dataclass
+@dataclass(eq=False)
 class Contract(Instrument):
     """Represents a specific tradable contract"""
     multiplier: Optional[Decimal] = None
@@ -18,3 +19,57 @@ class Contract(Instrument):
         """Check if the contract has expired"""
         return self.expiration_date and self.expiration_date < date.today()
 
+
+class CompactContract:
+    """
+    Slotted counterpart of Contract, storing the multiplier and strike as fixed point int64 and the expiration date
+    as an ordinal. Converts to and from Contract, the multiplier and strike rounded to PRICE_DECIMALS decimal places.
+    """
+    __slots__ = (
+        'instrument_id', 'instrument_desc', 'symbol', 'currency_code', 'issuer_sk',
+        'classification_level_1', 'classification_level_2', 'classification_level_3',
+        'multiplier', 'expiration_date', 'strike_price'
+    )
+
+    def __init__(self, instrument_id: str, instrument_desc: Optional[str] = None, symbol: Optional[str] = None,
+                 currency_code: Optional[str] = None, issuer_sk: Optional[int] = None,
+                 classification_level_1: Optional[str] = None, classification_level_2: Optional[str] = None,
+                 classification_level_3: Optional[str] = None, multiplier: Optional[int] = None,
+                 expiration_date: Optional[int] = None, strike_price: Optional[int] = None):
+        self.instrument_id = instrument_id
+        self.instrument_desc = instrument_desc
+        self.symbol = symbol
+        self.currency_code = currency_code
+        self.issuer_sk = issuer_sk
+        self.classification_level_1 = classification_level_1
+        self.classification_level_2 = classification_level_2
+        self.classification_level_3 = classification_level_3
+        self.multiplier = multiplier
+        self.expiration_date = expiration_date
+        self.strike_price = strike_price
+
+    @classmethod
+    def from_contract(cls, contract: Contract) -> 'CompactContract':
+        """Build the compact representation of a Contract"""
+        return cls(
+            contract.instrument_id, contract.instrument_desc, contract.symbol, contract.currency_code,
+            contract.issuer_sk, contract.classification_level_1, contract.classification_level_2,
+            contract.classification_level_3, to_fixed(contract.multiplier),
+            date_to_ordinal(contract.expiration_date), to_fixed(contract.strike_price)
+        )
+
+    def to_contract(self) -> Contract:
+        """Rebuild the Contract dataclass"""
+        return Contract(
+            instrument_id=self.instrument_id,
+            instrument_desc=self.instrument_desc,
+            symbol=self.symbol,
+            currency_code=self.currency_code,
+            issuer_sk=self.issuer_sk,
+            classification_level_1=self.classification_level_1,
+            classification_level_2=self.classification_level_2,
+            classification_level_3=self.classification_level_3,
+            multiplier=from_fixed(self.multiplier),
+            expiration_date=ordinal_to_date(self.expiration_date),
+            strike_price=from_fixed(self.strike_price)
+        )
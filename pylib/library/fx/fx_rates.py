@@ -0,0 +1,240 @@
+import json
+import os
+from datetime import date, datetime
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+
+from pylib.library.market_data.historical_data import HistoricalBar
+
+PIVOT_CURRENCY = 'USD'
+FX_RATES_FORMAT = "fx_rates"
+FX_RATES_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+DateLike = Union[date, datetime, np.datetime64, str]
+
+
+class FxRates:
+    """
+    Date-indexed cross rates between currencies, triangulated through USD
+
+    Only one USD pair per currency is needed: the rates are stored as a dates x currencies matrix of USD per unit of
+    each currency, forward filled over the dates. The full dates x currencies x currencies cube of cross rates,
+    rate[t, i, j] = units of currency j per unit of currency i, is triangulated once on first use. A conversion of a
+    whole vector of values then costs one gather of conversion factors, whatever the number of currencies.
+
+    The matrices are saved as uncompressed .npy files with a JSON manifest, so that a multi-year history is
+    memory-mapped on load rather than read from the database.
+    """
+    def __init__(self, dates: np.ndarray, currencies: Sequence[str], usd_rates: np.ndarray,
+                 cross_rates: Optional[np.ndarray] = None):
+        """
+        Args:
+            dates: Increasing datetime64[D] dates
+            currencies: Currency codes, including USD
+            usd_rates: USD per unit of each currency, dates x currencies, forward filled
+            cross_rates: Triangulated cross rates, dates x currencies x currencies, computed on first use if None
+        """
+        self.dates = np.asarray(dates, dtype='datetime64[D]')
+        self.currencies = list(currencies)
+        self.usd_rates = usd_rates
+        self._cross_rates = cross_rates
+        self._code_by_currency = {currency: code for code, currency in enumerate(self.currencies)}
+
+    @classmethod
+    def from_usd_rates(cls, rates: pd.DataFrame) -> 'FxRates':
+        """
+        Build the rates from USD quotes
+
+        Args:
+            rates: USD per unit of each currency, indexed by date with one column per currency code, missing dates
+                and NaN are forward filled, USD is added if missing
+
+        Returns:
+            FX rates
+
+        Raises:
+            ValueError: If a currency has no rate on the first date
+        """
+        rates = rates.sort_index().ffill()
+        rates = rates.groupby(pd.DatetimeIndex(rates.index).normalize()).last()
+        if PIVOT_CURRENCY not in rates.columns:
+            rates[PIVOT_CURRENCY] = 1.0
+        missing = rates.columns[rates.iloc[0].isna()].tolist()
+        if missing:
+            raise ValueError(f"No rate on the first date {rates.index[0].date()} for {missing}")
+        return cls(rates.index.to_numpy(dtype='datetime64[D]'), [str(column) for column in rates.columns],
+                   np.ascontiguousarray(rates.to_numpy(dtype=np.float64)))
+
+    @classmethod
+    def from_bars(cls, bars_by_pair: Dict[str, List[HistoricalBar]]) -> 'FxRates':
+        """
+        Build the rates from the daily bars of USD pairs, e.g. IBAPIClient.historical_data of CASH contracts
+
+        Args:
+            bars_by_pair: Bars of each pair named by its two currency codes, e.g. EURUSD or USD.JPY, the close being
+                units of the second currency per unit of the first
+
+        Returns:
+            FX rates
+
+        Raises:
+            ValueError: If a pair does not have USD on one side
+        """
+        columns = {}
+        for pair, bars in bars_by_pair.items():
+            codes = pair.replace('.', '').replace('/', '').upper()
+            base, quote = codes[:3], codes[3:]
+            closes = pd.Series(
+                np.fromiter((float(bar.close_price) for bar in bars), dtype=np.float64),
+                index=pd.DatetimeIndex([bar.timestamp for bar in bars]))
+            if quote == PIVOT_CURRENCY:
+                columns[base] = closes
+            elif base == PIVOT_CURRENCY:
+                columns[quote] = 1.0 / closes
+            else:
+                raise ValueError(f"{pair} is not a USD pair")
+        return cls.from_usd_rates(pd.DataFrame(columns).dropna(how='all'))
+
+    @property
+    def cross_rates(self) -> np.ndarray:
+        """Units of currency j per unit of currency i on each date, dates x currencies x currencies"""
+        if self._cross_rates is None:
+            self._cross_rates = self.usd_rates[:, :, None] / self.usd_rates[:, None, :]
+        return self._cross_rates
+
+    def date_index(self, rate_date: Optional[DateLike] = None) -> int:
+        """
+        Index of the last date on or before a date, the last date by default
+
+        Raises:
+            ValueError: If the date is before the first rate
+        """
+        if rate_date is None:
+            return len(self.dates) - 1
+        index = int(np.searchsorted(self.dates, np.datetime64(rate_date, 'D'), side='right')) - 1
+        if index < 0:
+            raise ValueError(f"No FX rate on or before {rate_date}")
+        return index
+
+    def codes(self, currencies: Sequence[Optional[str]], default: Optional[str] = None) -> np.ndarray:
+        """
+        Currency codes of a sequence of currencies
+
+        Args:
+            currencies: Currency of each value
+            default: Currency of the values without one, e.g. the base currency
+
+        Raises:
+            ValueError: If a currency has no rate
+        """
+        code_by_currency = self._code_by_currency
+        try:
+            return np.fromiter((code_by_currency[currency or default] for currency in currencies), dtype=np.int64,
+                               count=len(currencies))
+        except KeyError as e:
+            raise ValueError(f"No FX rate for currency {e.args[0]}") from None
+
+    def rate(self, from_currency: str, to_currency: str, rate_date: Optional[DateLike] = None) -> float:
+        """Units of to_currency per unit of from_currency on a date, the last date by default"""
+        codes = self.codes([from_currency, to_currency])
+        return float(self.cross_rates[self.date_index(rate_date), codes[0], codes[1]])
+
+    def conversion_factors(
+            self,
+            currencies: Union[Sequence[Optional[str]], np.ndarray],
+            to_currency: str,
+            rate_date: Optional[DateLike] = None
+    ) -> np.ndarray:
+        """
+        Factor converting each value to a currency on a date
+
+        Args:
+            currencies: Currency of each value, or currency codes from codes()
+            to_currency: Target currency, also the currency of the values without one
+            rate_date: Date of the rates, the last date by default
+
+        Returns:
+            Array of conversion factors
+        """
+        if not isinstance(currencies, np.ndarray):
+            currencies = self.codes(currencies, to_currency)
+        to_code = self.codes([to_currency])[0]
+        return self.cross_rates[self.date_index(rate_date), :, to_code][currencies]
+
+    def conversion_history(
+            self,
+            currencies: Union[Sequence[Optional[str]], np.ndarray],
+            to_currency: str,
+            dates: Sequence[DateLike]
+    ) -> np.ndarray:
+        """Factors converting each value to a currency on each of several dates, dates x values"""
+        if not isinstance(currencies, np.ndarray):
+            currencies = self.codes(currencies, to_currency)
+        to_code = self.codes([to_currency])[0]
+        indexes = np.searchsorted(self.dates, np.asarray(dates, dtype='datetime64[D]'), side='right') - 1
+        if len(indexes) and indexes.min() < 0:
+            raise ValueError(f"No FX rate on or before {self.dates[0] if len(self.dates) else dates[0]}")
+        return self.cross_rates[indexes[:, None], currencies[None, :], to_code]
+
+    def convert(
+            self,
+            values: np.ndarray,
+            currencies: Union[Sequence[Optional[str]], np.ndarray],
+            to_currency: str,
+            rate_date: Optional[DateLike] = None
+    ) -> np.ndarray:
+        """Convert a vector of values, each in its own currency, to a currency"""
+        return np.asarray(values, dtype=np.float64) * self.conversion_factors(currencies, to_currency, rate_date)
+
+    def save(self, path: str):
+        """
+        Write the rates and the triangulated cross rates to a directory, created if needed
+
+        Args:
+            path: Directory
+        """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'dates.npy'), self.dates, allow_pickle=False)
+        np.save(os.path.join(path, 'usd_rates.npy'), self.usd_rates, allow_pickle=False)
+        np.save(os.path.join(path, 'cross_rates.npy'), self.cross_rates, allow_pickle=False)
+        manifest = {
+            'format': FX_RATES_FORMAT,
+            'version': FX_RATES_VERSION,
+            'created': datetime.now().isoformat(),
+            'currencies': self.currencies,
+        }
+        with open(os.path.join(path, MANIFEST_FILE), 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> 'FxRates':
+        """
+        Read rates written by save
+
+        Args:
+            path: Directory
+            mmap: Memory-map the matrices read-only instead of reading them
+
+        Returns:
+            FX rates
+
+        Raises:
+            ValueError: If the directory does not hold FX rates or was written by a newer version
+        """
+        with open(os.path.join(path, MANIFEST_FILE)) as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest.get('format') != FX_RATES_FORMAT:
+            raise ValueError(f"{path} does not hold FX rates")
+        if manifest.get('version', 0) > FX_RATES_VERSION:
+            raise ValueError(f"FX rates version {manifest['version']} is newer than supported {FX_RATES_VERSION}")
+
+        mmap_mode = 'r' if mmap else None
+        return cls(
+            np.load(os.path.join(path, 'dates.npy'), allow_pickle=False),
+            manifest['currencies'],
+            np.load(os.path.join(path, 'usd_rates.npy'), mmap_mode=mmap_mode, allow_pickle=False),
+            np.load(os.path.join(path, 'cross_rates.npy'), mmap_mode=mmap_mode, allow_pickle=False)
+        )
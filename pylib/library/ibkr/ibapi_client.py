@@ -4,14 +4,24 @@ from ibapi.wrapper import EWrapper
 from ibapi.contract import Contract
 from ibapi.order import Order
 from threading import Thread, Event
-from typing import Dict, Optional, List
+from typing import Callable, Dict, Optional, List, Sequence, Set
 from decimal import Decimal
 from functools import wraps
 import time
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+
+import numpy as np
 
 from pylib.library.market_data.market_data_manager import MarketDataManager
-from pylib.library.market_data.historical_data import HistoricalBar
+from pylib.library.market_data.historical_data import HistoricalBar, HistoricalBarSeries, parse_bar_date
+from pylib.library.market_data.bar_cache import BarCache, BarSeriesKey, EPOCH_DATE, US_PER_DAY, array_to_bars, \
+    bars_to_array, last_final_day
+from pylib.library.config.enumerations import OrderStatus, OrderType
+from pylib.library.order.order import ORDER_STATUS_TRANSITIONS, Order as PortfolioOrder
+from pylib.library.order.order_book import OrderBook
+from pylib.library.contract.contract import Contract as PortfolioContract
+from pylib.library.position.position import Position
+from pylib.library.portfolio.portfolio import Portfolio
 
 TICK_TYPES = {
     4: 'last',
@@ -19,6 +29,48 @@ TICK_TYPES = {
     2: 'ask'
 }
 
+# Longest duration of a single historical data request by bar size setting, the IBKR limits
+MAX_REQUEST_DURATION = {
+    '1 secs': timedelta(minutes=30),
+    '5 secs': timedelta(hours=1),
+    '10 secs': timedelta(hours=4),
+    '15 secs': timedelta(hours=4),
+    '30 secs': timedelta(hours=8),
+    '1 min': timedelta(days=1),
+    '2 mins': timedelta(days=2),
+    '3 mins': timedelta(weeks=1),
+    '5 mins': timedelta(weeks=1),
+    '10 mins': timedelta(weeks=1),
+    '15 mins': timedelta(weeks=2),
+    '20 mins': timedelta(weeks=2),
+    '30 mins': timedelta(days=30),
+    '1 hour': timedelta(days=30),
+    '2 hours': timedelta(days=30),
+    '3 hours': timedelta(days=30),
+    '4 hours': timedelta(days=30),
+    '8 hours': timedelta(days=30),
+    '1 day': timedelta(days=365),
+    '1 week': timedelta(days=365),
+    '1 month': timedelta(days=365),
+}
+
+# IBKR error code of historical data requests that failed or returned no bars, told apart by the message
+HISTORICAL_DATA_ERROR_CODE = 162
+
+# Calendar days requested per trading day wanted: weekends plus a margin for holidays
+CALENDAR_DAYS_PER_TRADING_DAY = 1.5
+
+# IBKR size tick type ids, by tick type of the price they size
+SIZE_TICK_TYPES = {
+    0: 'bid',
+    3: 'ask',
+    5: 'last'
+}
+
+
+class HistoricalDataError(Exception):
+    """Raised when a historical data request times out or is rejected by IBKR"""
+
 
 def require_connection(f):                                             # f is the original function being decorated
     """
@@ -33,7 +85,7 @@ def require_connection(f):                                             # f is th
 
 
 class IBAPIClient(EWrapper, EClient):
-    def __init__(self, host='127.0.0.1', port=7497, client_id=1):
+    def __init__(self, host='127.0.0.1', port=7497, client_id=1, bar_cache: Optional[BarCache] = None):
         """
         Initialize the IBKR API client
 
@@ -41,6 +93,7 @@ class IBAPIClient(EWrapper, EClient):
             host (str): IBKR TWS/Gateway host
             port (int): Connection port (7496 for live, 7497 for paper trading)
             client_id (int): Unique client identifier
+            bar_cache (Optional[BarCache]): Local cache of historical bars, only the missing days are requested
         """
         EWrapper.__init__(self)  # lookup utility
         EClient.__init__(self, self)  # lookup utility
@@ -62,16 +115,24 @@ class IBAPIClient(EWrapper, EClient):
         # Initialize tracking attributes
         self.connected = False
         self.next_req_id = 0
+        self.next_order_id: Optional[int] = None  # set by nextValidId on connection
         self.portfolio_positions = {}
         self.market_data_manager = MarketDataManager()
 
+        # Account positions valued incrementally by the price ticks, see _enrich_portfolio_with_market_data
+        self.account_portfolio = Portfolio(name='ibkr_account')
+        self.account_contracts: Dict[str, PortfolioContract] = {}  # symbol: contract of the account portfolio
+        self.market_data_manager.attach_portfolio(self.account_portfolio)
+
         # Threading events for synchronization
         self.portfolio_update_complete = Event()
-        self.market_data_complete = Event()
         self.req_id_to_symbol = {}  # dict to map request IDs to corresponding symbols ({reqId: symbol})
 
         self.historical_data = {}
         self.historical_data_complete = Event()
+        self.historical_request_ids: Set[int] = set()  # historical data requests waiting for their end
+        self.historical_data_errors: Dict[int, str] = {}  # error of each failed historical data request
+        self.bar_cache = bar_cache
 
     def connect_and_run(self):
         """
@@ -118,6 +179,7 @@ class IBAPIClient(EWrapper, EClient):
         Callback when connection is established
         """
         self.connected = True
+        self.next_order_id = orderId
         self.logger.info(f"Connected. Next Valid Order ID: {orderId}")
 
     def _get_next_req_id(self) -> int:
@@ -125,11 +187,25 @@ class IBAPIClient(EWrapper, EClient):
         self.next_req_id += 1
         return self.next_req_id
 
+    def _get_next_order_id(self) -> int:
+        """Get next order ID"""
+        order_id = self.next_order_id
+        self.next_order_id += 1
+        return order_id
+
     def error(self, reqId, errorCode, errorString, advancedOrderRejectJson=''):
         """
-        Error handling method
+        Error handling method, an error of a pending historical data request ends it
+
+        IBKR reports a historical request returning no bars (e.g. over holidays only) as an error, it ends the request
+        with an empty, complete series.
         """
         self.logger.error(f"Error {errorCode} for request {reqId}: {errorString}")
+        if reqId in self.historical_request_ids:
+            if not (errorCode == HISTORICAL_DATA_ERROR_CODE and 'returned no data' in errorString):
+                self.historical_data_errors[reqId] = f"Error {errorCode}: {errorString}"
+            self.historical_request_ids.discard(reqId)
+            self.historical_data_complete.set()
 
     @staticmethod
     def create_contract(
@@ -181,6 +257,92 @@ class IBAPIClient(EWrapper, EClient):
         order.orderType = "MKT"
         return order
 
+    @staticmethod
+    def create_limit_order(
+            action: str,
+            quantity: float,
+            limit_price: float
+    ):
+        """
+        Create a limit order
+
+        Args:
+            action (str): 'BUY' or 'SELL'
+            quantity (int): Number of shares
+            limit_price (float): Limit price
+
+        Returns:
+            Order: IBKR Order object
+        """
+        order = Order()
+        order.action = action
+        order.totalQuantity = quantity
+        order.orderType = "LMT"
+        order.lmtPrice = limit_price
+        return order
+
+    @require_connection
+    def submit_order(
+            self,
+            order: PortfolioOrder,
+            price: Optional[float] = None,
+            pre_trade_check: Optional[Callable[[PortfolioOrder, float], None]] = None,
+            order_book: Optional[OrderBook] = None
+    ) -> int:
+        """
+        Submit a portfolio order to IBKR, after an optional pre-trade check
+
+        Args:
+            order: Market or limit order, its instrument symbol and currency identify the IBKR contract
+            price: Expected execution price given to the check, the limit price or the last stored price by default
+            pre_trade_check: Called with the order and price before submission, raises to block the order, e.g.
+                PortfolioCompliance.enforce
+            order_book: Book holding the order, e.g. Portfolio.orders, moved to SUBMITTED through it so that its
+                status index follows. Required when the order is in a book
+
+        Returns:
+            IBKR order ID
+
+        Raises:
+            ValueError: If the order type is not supported, the order cannot be submitted from its status, the order is
+                not in the book, or no price is available for the check
+        """
+        instrument = order.instrument
+        if order.order_type not in (OrderType.MARKET, OrderType.LIMIT):
+            raise ValueError(f"Cannot submit {order.order_type.name} orders")
+        if order.order_type == OrderType.LIMIT and order.limit_price is None:
+            raise ValueError(f"Limit order {order.unique_id} has no limit price")
+        if OrderStatus.SUBMITTED not in ORDER_STATUS_TRANSITIONS[order.status]:
+            raise ValueError(f"Order {order.unique_id} cannot be submitted from {order.status.name}")
+        if order_book is not None and order_book.get(order.unique_id) is not order:
+            raise ValueError(f"Order {order.unique_id} is not in the order book")
+
+        if pre_trade_check is not None:
+            if price is None and order.limit_price is not None:
+                price = float(order.limit_price)
+            if price is None:
+                price = (self.market_data_manager.get_stored_market_data(instrument.symbol) or {}).get('last')
+            if price is None:
+                raise ValueError(f"No price to check the order on {instrument.symbol} against")
+            pre_trade_check(order, price)
+
+        contract = self.create_contract(instrument.symbol, currency=instrument.currency_code or "USD")
+        if order.order_type == OrderType.LIMIT:
+            ib_order = self.create_limit_order(order.side, float(order.quantity), float(order.limit_price))
+        else:
+            ib_order = self.create_market_order(order.side, float(order.quantity), contract)
+        if order.time_in_force:
+            ib_order.tif = order.time_in_force
+
+        order_id = self._get_next_order_id()
+        self.placeOrder(order_id, contract, ib_order)
+        if order_book is not None:
+            order_book.update_status(order.unique_id, OrderStatus.SUBMITTED)
+        else:
+            order.update_status(OrderStatus.SUBMITTED)
+        self.logger.info(f"Submitted order {order_id}: {order.side} {order.quantity} {instrument.symbol}")
+        return order_id
+
     def position(
             self,
             account: str,
@@ -213,26 +375,19 @@ class IBAPIClient(EWrapper, EClient):
         Inherited from EWrapper, called by IBKR API for each historical data bar.
         """
         symbol = self.req_id_to_symbol.get(reqId)
-        if symbol not in self.historical_data:
-            self.historical_data[symbol] = []
-
-        historical_bar = HistoricalBar(
-            timestamp=datetime.strptime(bar.date, '%Y%m%d %H:%M:%S' if len(bar.date) > 8 else '%Y%m%d'),
-            open_price=Decimal(str(bar.open)),
-            high_price=Decimal(str(bar.high)),
-            low_price=Decimal(str(bar.low)),
-            close_price=Decimal(str(bar.close)),
-            volume=bar.volume,
-            weighted_avg_price=Decimal(str(bar.wap)),
-            bar_count=bar.barCount
-        )
+        series = self.historical_data.get(symbol)
+        if series is None:
+            series = self.historical_data[symbol] = HistoricalBarSeries()
 
-        self.historical_data[symbol].append(historical_bar)
+        # Columnar append, the HistoricalBar objects are only built if the series is read bar by bar
+        series.append(parse_bar_date(bar.date), bar.open, bar.high, bar.low, bar.close, int(bar.volume),
+                      float(bar.wap), bar.barCount)
 
     def historicalDataEnd(self, reqId: int, start: str, end: str) -> None:
         """
         Callback indicating end of historical data transmission
         """
+        self.historical_request_ids.discard(reqId)
         self.historical_data_complete.set()
         symbol = self.req_id_to_symbol.get(reqId)
         self.logger.info(f"Historical data complete for {symbol} from {start} to {end}")
@@ -259,7 +414,19 @@ class IBAPIClient(EWrapper, EClient):
             if tickType in TICK_TYPES:
                 self.market_data_manager.store_market_data(
                     symbol, tick_types[tickType], price)
-            self.market_data_complete.set()  # set the event of data
+
+    def tickSize(
+            self,
+            reqId: int,
+            tickType: int,
+            size: Decimal
+    ):
+        """
+        Handle incoming market data size updates, kept in the tick history of the market data manager
+        """
+        symbol = self.req_id_to_symbol.get(reqId)
+        if symbol and tickType in SIZE_TICK_TYPES:
+            self.market_data_manager.store_tick_size(symbol, SIZE_TICK_TYPES[tickType], float(size))
 
     @require_connection
     def request_market_data(
@@ -267,14 +434,18 @@ class IBAPIClient(EWrapper, EClient):
             symbols: List[str],
             timeout: int = 10,  # timeout feature, to consider
             print_requested_data: bool = False,
-    ) -> None:
-        """
-        Request market data for specified symbols
+    ) -> List[str]:
         """
+        Request market data for specified symbols and wait for the first quote of each
 
-        # Reset event
-        self.market_data_complete.clear()
+        Args:
+            symbols (List[str]): Stock symbols
+            timeout (int): Maximum wait time in seconds for all the symbols
+            print_requested_data (bool): Print the stored market data of the symbols once received
 
+        Returns:
+            List[str]: Symbols without a quote at the timeout
+        """
         try:
             for symbol in symbols:
                 contract = self.create_contract(symbol)
@@ -285,12 +456,15 @@ class IBAPIClient(EWrapper, EClient):
                 # canceled by cancelMktData(req_id) (in disconnect_and_stop)
                 self.reqMktData(req_id, contract, '', False, False, [])
 
-                # Wait for completion
-                if not self.market_data_complete.wait(timeout):
-                    self.logger.warning("Timeout waiting for market data")
+            # Wait for the first quote of every symbol, returning as soon as the last one arrives
+            missing = self.market_data_manager.wait_for_symbols(symbols, timeout)
+            if missing:
+                self.logger.warning(f"Timeout waiting for market data of {len(missing)} symbols: {missing}")
 
-                if print_requested_data:
-                    print({symbol: self.market_data_manager.get_stored_market_data(symbol) for symbol in symbols})
+            if print_requested_data:
+                print({symbol: self.market_data_manager.get_stored_market_data(symbol) for symbol in symbols})
+
+            return missing
 
         except Exception as e:
             self.logger.error(f"Error fetching market data: {str(e)}")
@@ -341,30 +515,51 @@ class IBAPIClient(EWrapper, EClient):
         if not positions:
             return {}
 
-        # Request market data for all positions
-        self.market_data_complete.clear()
-        self.request_market_data(list(positions.keys()))
-
-        # Wait for market data
-        if not self.market_data_complete.wait(timeout):
-            self.logger.warning("Timeout waiting for market data")
+        # Request market data for all positions, waiting for the first quote of each
+        self.request_market_data(list(positions.keys()), timeout)
 
         # Combine position and market data
         return self._enrich_portfolio_with_market_data(positions)
 
     def _enrich_portfolio_with_market_data(self, positions: Dict[str, Dict]) -> Dict[str, Dict]:
-        """Combine portfolio positions with market data"""
+        """
+        Combine portfolio positions with market data
+
+        The positions are synced into account_portfolio, attached to the market data manager, and their current value
+        is read from its live market values, kept up to date by each price tick instead of re-summed here. Positions
+        without a last price yet are valued at 0.
+        """
+        self._sync_account_portfolio(positions)
         enriched_portfolio = {}
         for symbol, position in positions.items():
             market_data = self.market_data_manager.get_stored_market_data(symbol)
             if market_data:
                 position['market_data'] = market_data
-                last_price = Decimal(str(market_data.get('last', 0)))
-                position_size = Decimal(str(position['position']))
-                position['current_value'] = last_price * position_size
+                value = self.account_portfolio.position_market_value(self.account_contracts[symbol])
+                position['current_value'] = Decimal(repr(value)) if value is not None else Decimal(0)
                 enriched_portfolio[symbol] = position
         return enriched_portfolio
 
+    def _sync_account_portfolio(self, positions: Dict[str, Dict]):
+        """Update account_portfolio to the positions reported by IBKR, only the changed positions are touched"""
+        portfolio = self.account_portfolio
+        for symbol, position in positions.items():
+            contract = self.account_contracts.get(symbol)
+            if contract is None:
+                contract = self.account_contracts[symbol] = PortfolioContract(
+                    instrument_id=symbol, symbol=symbol, currency_code=position['contract'].currency)
+            quantity = Decimal(str(position['position']))
+            average_cost = Decimal(str(position['avgCost']))
+            held = portfolio.positions.get(contract)
+            if held is not None and (held.quantity != quantity or held.average_cost != average_cost):
+                portfolio.remove_position(contract, held.quantity)
+                held = None
+            if held is None and quantity != 0:
+                portfolio.add_position(Position(contract, quantity, average_cost))
+
+        for contract in [contract for contract in portfolio.positions if contract.symbol not in positions]:
+            portfolio.remove_position(contract, portfolio.positions[contract].quantity)
+
     @require_connection
     def request_historical_data(
             self,
@@ -398,7 +593,7 @@ class IBAPIClient(EWrapper, EClient):
             format_date: bool = True,
             keep_up_to_date: bool = False,
             timeout: int = 60
-    ) -> List[HistoricalBar]:
+    ) -> HistoricalBarSeries:
         """
         Request historical data for a symbol
 
@@ -409,17 +604,19 @@ class IBAPIClient(EWrapper, EClient):
             bar_size: Size of data bars. Examples: "1 min", "1 hour", "1 day"
             what_to_show: Type of data to retrieve (TRADES, MIDPOINT, BID, ASK, etc.)
             use_rth: True for regular trading hours only
-            format_date: Format dates as strings
+            format_date: Format dates as strings, else as UTC epoch seconds
             keep_up_to_date: Keep updating data in real-time after initial history
             timeout: Maximum wait time in seconds
 
         Returns:
-            List of HistoricalBar objects
+            Columnar series of the bars, a sequence of HistoricalBar objects built on access
+
+        Raises:
+            HistoricalDataError: If the request is rejected by IBKR or times out before its end
         """
         try:
-            # Clear previous data and reset event
-            if symbol in self.historical_data:
-                self.historical_data[symbol].clear()
+            # New series, the series returned by previous requests are left untouched, and reset event
+            self.historical_data[symbol] = HistoricalBarSeries()
             self.historical_data_complete.clear()
 
             # Create contract
@@ -428,6 +625,7 @@ class IBAPIClient(EWrapper, EClient):
             # Generate request ID and store symbol mapping
             req_id = self._get_next_req_id()
             self.req_id_to_symbol[req_id] = symbol
+            self.historical_request_ids.add(req_id)
 
             # Format end datetime
             end_datetime = end_datetime or datetime.now()
@@ -447,39 +645,152 @@ class IBAPIClient(EWrapper, EClient):
                 chartOptions=[]                         # Additional chart options (usually empty list)
             )
 
-            # Wait for completion
+            # Wait for completion, the end of the data or an error
             if not self.historical_data_complete.wait(timeout):
-                self.logger.warning(f"Timeout waiting for historical data for {symbol}")
+                self.historical_request_ids.discard(req_id)
+                raise HistoricalDataError(f"Timeout waiting for historical data for {symbol}")
+            error = self.historical_data_errors.pop(req_id, None)
+            if error is not None:
+                raise HistoricalDataError(f"Historical data request for {symbol} failed: {error}")
 
-            return self.historical_data.get(symbol, [])
+            return self.historical_data[symbol]
 
         except Exception as e:
             self.logger.error(f"Error fetching historical data for {symbol}: {str(e)}")
             raise
 
+    def get_cached_historical_data(
+            self,
+            symbol: str,
+            start: date,
+            end: Optional[date] = None,
+            bar_size: str = "1 day",
+            what_to_show: str = "TRADES",
+            use_rth: bool = True,
+            timeout: int = 60
+    ) -> List[HistoricalBar]:
+        """
+        Historical data for a day range, read from the bar cache and completed with requests for the missing days only
+
+        Each missing range is requested in chunks within the IBKR limit of the bar size (see MAX_REQUEST_DURATION),
+        days being split into several requests for second bars, merged into the cache and read back with the cached
+        bars. A chunk is only marked as covered once its requests completed, a failed request leaves it missing for the
+        next call. Days from today onwards are never covered (their bars are not final), they are requested on every
+        call that asks for them.
+
+        Args:
+            symbol: Stock symbol
+            start: First day
+            end: Last day, inclusive, the last day with final bars (yesterday) by default
+            bar_size: Size of data bars, one of the MAX_REQUEST_DURATION settings. Examples: "1 min", "1 hour", "1 day"
+            what_to_show: Type of data to retrieve (TRADES, MIDPOINT, BID, ASK, etc.)
+            use_rth: True for regular trading hours only
+            timeout: Maximum wait time in seconds of each request
+
+        Returns:
+            List of HistoricalBar objects
+
+        Raises:
+            ValueError: If the client has no bar cache or the bar size is not supported
+            HistoricalDataError: If a request is rejected by IBKR or times out, the chunks completed before are cached
+        """
+        if self.bar_cache is None:
+            raise ValueError("get_cached_historical_data requires a bar cache")
+        max_duration = MAX_REQUEST_DURATION.get(bar_size)
+        if max_duration is None:
+            raise ValueError(f"Unsupported bar size {bar_size}, expected one of {list(MAX_REQUEST_DURATION)}")
+        end = end or last_final_day()
+        key = BarSeriesKey(symbol, bar_size, what_to_show, use_rth)
+        chunk_days = max(max_duration.days, 1)
+
+        for gap_start, gap_end in self.bar_cache.gaps(key, start, end):
+            chunk_start = gap_start
+            while chunk_start <= gap_end:
+                chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), gap_end)
+                records = self._request_bar_records(key, chunk_start, chunk_end, max_duration, timeout)
+                self.bar_cache.write(key, records, chunk_start, chunk_end)
+                chunk_start = chunk_end + timedelta(days=1)
+
+        return array_to_bars(self.bar_cache.read(key, start, end))
+
+    def _request_bar_records(
+            self,
+            key: BarSeriesKey,
+            start: date,
+            end: date,
+            max_duration: timedelta,
+            timeout: int
+    ) -> np.ndarray:
+        """
+        Bars of a day range as BAR_DTYPE records, in one request or, for durations under a day, one per window
+
+        Args:
+            key: Series requested
+            start: First day
+            end: Last day, inclusive, equal to start when max_duration is under a day
+            max_duration: Longest duration of a request
+            timeout: Maximum wait time in seconds of each request
+        """
+        day_end = datetime.combine(end, datetime.max.time().replace(microsecond=0))
+        if max_duration >= timedelta(days=1):
+            windows = [(day_end, f"{(end - start).days + 1} D")]
+        else:
+            # Windows ending every max_duration through the day, the last one at the end of the day
+            step = int(max_duration.total_seconds())
+            day_start = datetime.combine(start, datetime.min.time())
+            windows = [(min(day_start + timedelta(seconds=offset + step), day_end), f"{step} S")
+                       for offset in range(0, 86_400, step)]
+
+        chunks = []
+        for window_end, duration in windows:
+            bars = self.request_historical_data(
+                symbol=key.symbol,
+                end_datetime=window_end,
+                duration=duration,
+                bar_size=key.bar_size,
+                what_to_show=key.what_to_show,
+                use_rth=key.use_rth,
+                timeout=timeout
+            )
+            chunks.append(bars_to_array(bars))
+        records = np.concatenate(chunks) if len(chunks) > 1 else chunks[0]
+        days = records['timestamp'] // US_PER_DAY
+        return records[(days >= (start - EPOCH_DATE).days) & (days <= (end - EPOCH_DATE).days)]
+
     def get_daily_historical_data(
             self,
             symbol: str,
             days: int = 30,
             use_rth: bool = True
-    ) -> List[HistoricalBar]:
+    ) -> Sequence[HistoricalBar]:
         """
-        Convenience method to get daily historical data
+        Convenience method to get daily historical data, through the bar cache if the client has one
+
+        Both ways request CALENDAR_DAYS_PER_TRADING_DAY calendar days per trading day wanted and keep the last bars.
+        Through the cache the range ends with the last day whose bar is final (yesterday), so that a rerun is served
+        from the cache without any request.
 
         Args:
             symbol: Stock symbol
-            days: Number of trading days to retrieve
+            days: Number of trading days (daily bars) to retrieve, fewer if the symbol has less history
             use_rth: Use regular trading hours only
 
         Returns:
-            List of HistoricalBar objects
-        """
-        return self.request_historical_data(
-            symbol=symbol,
-            duration=f"{days} D",
-            bar_size="1 day",
-            use_rth=use_rth
-        )
+            Sequence of the last HistoricalBar objects, oldest first
+        """
+        calendar_days = int(days * CALENDAR_DAYS_PER_TRADING_DAY) + 10  # margin for holiday clusters on short ranges
+        if self.bar_cache is not None:
+            last_day = last_final_day()
+            bars = self.get_cached_historical_data(symbol, last_day - timedelta(days=calendar_days - 1), last_day,
+                                                   use_rth=use_rth)
+        else:
+            bars = self.request_historical_data(
+                symbol=symbol,
+                duration=f"{calendar_days} D",
+                bar_size="1 day",
+                use_rth=use_rth
+            )
+        return bars[max(len(bars) - days, 0):]
 
     def get_intraday_historical_data(
             self,
@@ -487,7 +798,7 @@ class IBAPIClient(EWrapper, EClient):
             minutes: int = 1,
             days_back: int = 1,
             use_rth: bool = True
-    ) -> List[HistoricalBar]:
+    ) -> HistoricalBarSeries:
         """
         Convenience method to get intraday historical data
 
@@ -498,7 +809,7 @@ class IBAPIClient(EWrapper, EClient):
             use_rth: Use regular trading hours only
 
         Returns:
-            List of HistoricalBar objects
+            Columnar series of the bars, a sequence of HistoricalBar objects built on access
         """
         return self.request_historical_data(
             symbol=symbol,
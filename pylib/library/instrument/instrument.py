@@ -23,6 +23,14 @@ class Instrument:
     instrument_desc: Optional[str] = None
     # base_currency: Optional[str] = None
 
+    # Reference data, mirrors dim_instrument
+    symbol: Optional[str] = None
+    currency_code: Optional[str] = None
+    issuer_sk: Optional[int] = None
+    classification_level_1: Optional[str] = None
+    classification_level_2: Optional[str] = None
+    classification_level_3: Optional[str] = None
+
     def __hash__(self):
         return hash(self.instrument_id)
 
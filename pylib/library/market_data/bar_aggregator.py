@@ -0,0 +1,171 @@
+import time
+from collections import deque
+from datetime import timedelta
+from decimal import Decimal
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from pylib.library.market_data.historical_data import HistoricalBar
+from pylib.library.utils.fixed_point import EPOCH
+
+# Length in seconds of the bar sizes, named as in IBAPIClient.request_historical_data
+BAR_SIZE_SECONDS = {
+    '1 secs': 1,
+    '5 secs': 5,
+    '10 secs': 10,
+    '15 secs': 15,
+    '30 secs': 30,
+    '1 min': 60,
+    '2 mins': 120,
+    '3 mins': 180,
+    '5 mins': 300,
+    '10 mins': 600,
+    '15 mins': 900,
+    '20 mins': 1200,
+    '30 mins': 1800,
+    '1 hour': 3600,
+    '1 day': 86400,
+}
+
+DEFAULT_BAR_SIZES = ('5 secs', '1 min', '5 mins', '1 day')
+DEFAULT_MAX_BARS = 10_000  # completed bars kept per symbol and bar size
+
+
+class _BarBuilder:
+    """Running OHLCV of the bar being built, in floats until the bar is completed"""
+    __slots__ = ('start', 'open', 'high', 'low', 'close', 'volume', 'notional', 'count')
+
+    def __init__(self, start: int, price: float):
+        self.start = start
+        self.open = self.high = self.low = self.close = price
+        self.volume = 0.0
+        self.notional = 0.0
+        self.count = 1
+
+    def to_bar(self) -> HistoricalBar:
+        wap = self.notional / self.volume if self.volume else self.close
+        return HistoricalBar(
+            timestamp=EPOCH + timedelta(seconds=self.start),
+            open_price=Decimal(repr(self.open)),
+            high_price=Decimal(repr(self.high)),
+            low_price=Decimal(repr(self.low)),
+            close_price=Decimal(repr(self.close)),
+            volume=int(round(self.volume)),
+            weighted_avg_price=Decimal(repr(wap)),
+            bar_count=self.count
+        )
+
+
+class BarAggregator:
+    """
+    Streaming builder of OHLCV bars at several bar sizes at once from trade ticks
+
+    Each trade updates the bar being built of every bar size in constant time: a trade past the end of a bar completes
+    it and starts the next one. Completed bars are converted to HistoricalBar, the same as the bars of
+    IBAPIClient.request_historical_data, kept per symbol and bar size and passed to the on_bar callback. Bars are
+    aligned on multiples of their size in exchange time, intervals without trades produce no bar.
+
+    IBKR sends the size of a trade in a separate callback after its price (see MarketDataManager.attach_bar_aggregator),
+    so sizes are added to the volume and the VWAP notional of the current bars at the last trade price.
+    """
+    def __init__(
+            self,
+            bar_sizes: Sequence[str] = DEFAULT_BAR_SIZES,
+            utc_offset: int = 0,
+            on_bar: Optional[Callable[[str, str, HistoricalBar], None]] = None,
+            max_bars: int = DEFAULT_MAX_BARS
+    ):
+        """
+        Args:
+            bar_sizes: Bar sizes built, keys of BAR_SIZE_SECONDS
+            utc_offset: Offset in seconds of the exchange time from UTC, e.g. -5 * 3600 for New York in winter
+            on_bar: Called with the symbol, the bar size and the bar on each completed bar, on the tick thread
+            max_bars: Completed bars kept per symbol and bar size
+
+        Raises:
+            ValueError: If a bar size is not supported
+        """
+        unknown = [bar_size for bar_size in bar_sizes if bar_size not in BAR_SIZE_SECONDS]
+        if unknown:
+            raise ValueError(f"Unsupported bar sizes {unknown}, expected some of {list(BAR_SIZE_SECONDS)}")
+        self.bar_sizes = list(bar_sizes)
+        self.seconds = [BAR_SIZE_SECONDS[bar_size] for bar_size in self.bar_sizes]
+        self.utc_offset = utc_offset
+        self.on_bar = on_bar
+        self.max_bars = max_bars
+        self.builders: Dict[str, List[Optional[_BarBuilder]]] = {}  # symbol: current bar of each bar size
+        self.bars: Dict[Tuple[str, str], Deque[HistoricalBar]] = {}  # (symbol, bar size): completed bars
+
+    def on_trade(self, symbol: str, price: float, size: float = 0.0, timestamp: Optional[int] = None):
+        """
+        Add a trade to the current bars of a symbol
+
+        Args:
+            symbol: Symbol
+            price: Trade price
+            size: Trade size, 0 if sent later to on_size
+            timestamp: Nanoseconds since the epoch, the current time by default
+        """
+        now = (time.time_ns() if timestamp is None else timestamp) // 1_000_000_000 + self.utc_offset
+        builders = self.builders.get(symbol)
+        if builders is None:
+            builders = self.builders[symbol] = [None] * len(self.seconds)
+
+        for i, seconds in enumerate(self.seconds):
+            start = now - now % seconds
+            builder = builders[i]
+            if builder is None or start > builder.start:
+                if builder is not None:
+                    self._complete(symbol, i, builder)
+                builder = builders[i] = _BarBuilder(start, price)
+            else:
+                # A late trade is added to the current bar
+                if price > builder.high:
+                    builder.high = price
+                elif price < builder.low:
+                    builder.low = price
+                builder.close = price
+                builder.count += 1
+            if size:
+                builder.volume += size
+                builder.notional += size * price
+
+    def on_size(self, symbol: str, size: float):
+        """Add the size of the last trade of a symbol to its current bars"""
+        for builder in self.builders.get(symbol, ()):
+            if builder is not None:
+                builder.volume += size
+                builder.notional += size * builder.close
+
+    def _complete(self, symbol: str, index: int, builder: _BarBuilder):
+        bar = builder.to_bar()
+        key = (symbol, self.bar_sizes[index])
+        bars = self.bars.get(key)
+        if bars is None:
+            bars = self.bars[key] = deque(maxlen=self.max_bars)
+        bars.append(bar)
+        if self.on_bar is not None:
+            self.on_bar(symbol, self.bar_sizes[index], bar)
+
+    def current_bar(self, symbol: str, bar_size: str) -> Optional[HistoricalBar]:
+        """Bar being built of a symbol, None if it had no trade"""
+        builders = self.builders.get(symbol)
+        builder = builders[self.bar_sizes.index(bar_size)] if builders else None
+        return None if builder is None else builder.to_bar()
+
+    def completed_bars(self, symbol: str, bar_size: str) -> List[HistoricalBar]:
+        """Completed bars of a symbol, oldest first"""
+        return list(self.bars.get((symbol, bar_size), ()))
+
+    def flush(self, symbol: Optional[str] = None):
+        """
+        Complete the current bars, e.g. at the end of the session
+
+        Args:
+            symbol: Symbol, all the symbols by default
+        """
+        symbols = list(self.builders) if symbol is None else [symbol]
+        for flushed in symbols:
+            builders = self.builders.pop(flushed, [])
+            for i, builder in enumerate(builders):
+                if builder is not None:
+                    self._complete(flushed, i, builder)
@@ -0,0 +1,245 @@
+import json
+import os
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from pylib.library.market_data.historical_data import SERIES_COLUMNS, HistoricalBar, HistoricalBarSeries
+from pylib.library.utils.fixed_point import datetime_to_us, us_to_datetime
+
+BAR_CACHE_FORMAT = "bar_cache"
+BAR_CACHE_VERSION = 1
+COVERAGE_FILE = "coverage.json"
+
+US_PER_DAY = 86_400 * 1_000_000
+EPOCH_DATE = date(1970, 1, 1)
+
+BAR_DTYPE = np.dtype([
+    ('timestamp', np.int64),  # microseconds since the epoch of the naive bar datetime
+    ('open_price', np.float64),
+    ('high_price', np.float64),
+    ('low_price', np.float64),
+    ('close_price', np.float64),
+    ('volume', np.int64),
+    ('weighted_avg_price', np.float64),
+    ('bar_count', np.int64),
+])
+
+DateRange = Tuple[date, date]  # first and last day, inclusive
+
+
+@dataclass(frozen=True)
+class BarSeriesKey:
+    """Identifies a cached bar series, the arguments of IBAPIClient.request_historical_data it is fetched with"""
+    symbol: str
+    bar_size: str = "1 day"
+    what_to_show: str = "TRADES"
+    use_rth: bool = True
+
+    @property
+    def relative_path(self) -> str:
+        """Directory of the series under the cache root: symbol/bar_size/what_to_show_hours"""
+        return os.path.join(
+            self.symbol.replace('/', '_').replace('\\', '_'),
+            self.bar_size.replace(' ', '_'),
+            f"{self.what_to_show}_{'rth' if self.use_rth else 'all'}"
+        )
+
+    @property
+    def daily(self) -> bool:
+        """Whether the bars span a day or more, partitioned by year rather than by month"""
+        return any(unit in self.bar_size for unit in ('day', 'week', 'month'))
+
+
+def bars_to_array(bars: Sequence[HistoricalBar]) -> np.ndarray:
+    """Structured BAR_DTYPE array of bars"""
+    if isinstance(bars, HistoricalBarSeries):
+        records = np.empty(len(bars), dtype=BAR_DTYPE)
+        for field, column in zip(BAR_DTYPE.names, SERIES_COLUMNS):
+            records[field] = bars.column(column)
+        return records
+    return np.array([
+        (datetime_to_us(bar.timestamp), float(bar.open_price), float(bar.high_price), float(bar.low_price),
+         float(bar.close_price), int(bar.volume), float(bar.weighted_avg_price), int(bar.bar_count))
+        for bar in bars
+    ], dtype=BAR_DTYPE)
+
+
+def array_to_bars(records: np.ndarray) -> List[HistoricalBar]:
+    """HistoricalBar objects of a structured BAR_DTYPE array"""
+    return [
+        HistoricalBar(
+            timestamp=us_to_datetime(timestamp),
+            open_price=Decimal(repr(open_price)),
+            high_price=Decimal(repr(high_price)),
+            low_price=Decimal(repr(low_price)),
+            close_price=Decimal(repr(close_price)),
+            volume=volume,
+            weighted_avg_price=Decimal(repr(weighted_avg_price)),
+            bar_count=bar_count
+        )
+        for timestamp, open_price, high_price, low_price, close_price, volume, weighted_avg_price, bar_count in zip(
+            *(records[name].tolist() for name in BAR_DTYPE.names))
+    ]
+
+
+def last_final_day(today: Optional[date] = None) -> date:
+    """Last day whose bars are final, the day before today (the current date by default)"""
+    return (today or date.today()) - timedelta(days=1)
+
+
+def merge_ranges(ranges: Sequence[DateRange]) -> List[DateRange]:
+    """Sorted union of date ranges, adjacent ranges being joined"""
+    merged: List[DateRange] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class BarCache:
+    """
+    Persistent cache of historical bars, partitioned by symbol, bar size, data type and date
+
+    Every series (see BarSeriesKey) is a directory of uncompressed .npy files of BAR_DTYPE records, one per year for
+    daily bars and one per month for intraday bars, memory-mapped on read. The days already downloaded are recorded
+    in a coverage file next to the partitions, days without bars included, so that only the missing ranges are
+    requested again (see gaps). Days from today onwards are never marked as covered since their bars are not final.
+    """
+    def __init__(self, root: str):
+        """
+        Args:
+            root: Cache directory, created on the first write
+        """
+        self.root = root
+
+    def path(self, key: BarSeriesKey) -> str:
+        return os.path.join(self.root, key.relative_path)
+
+    @staticmethod
+    def _partition(key: BarSeriesKey, day: date) -> str:
+        return f"{day.year:04d}.npy" if key.daily else f"{day.year:04d}-{day.month:02d}.npy"
+
+    def _partitions(self, key: BarSeriesKey, start: date, end: date) -> List[str]:
+        """Partition files of a date range, whether they exist or not"""
+        if key.daily:
+            return [f"{year:04d}.npy" for year in range(start.year, end.year + 1)]
+        return [f"{month // 12:04d}-{month % 12 + 1:02d}.npy"
+                for month in range(start.year * 12 + start.month - 1, end.year * 12 + end.month)]
+
+    def coverage(self, key: BarSeriesKey) -> List[DateRange]:
+        """Day ranges already downloaded for a series"""
+        try:
+            with open(os.path.join(self.path(key), COVERAGE_FILE)) as coverage_file:
+                manifest = json.load(coverage_file)
+        except FileNotFoundError:
+            return []
+        if manifest.get('format') != BAR_CACHE_FORMAT:
+            raise ValueError(f"{self.path(key)} does not hold cached bars")
+        if manifest.get('version', 0) > BAR_CACHE_VERSION:
+            raise ValueError(f"Bar cache version {manifest['version']} is newer than supported {BAR_CACHE_VERSION}")
+        return [(date.fromisoformat(start), date.fromisoformat(end)) for start, end in manifest['coverage']]
+
+    def _write_coverage(self, key: BarSeriesKey, coverage: List[DateRange]):
+        manifest = {
+            'format': BAR_CACHE_FORMAT,
+            'version': BAR_CACHE_VERSION,
+            'updated': datetime.now().isoformat(),
+            'coverage': [[start.isoformat(), end.isoformat()] for start, end in coverage],
+        }
+        path = os.path.join(self.path(key), COVERAGE_FILE)
+        with open(path + '.tmp', 'w') as coverage_file:
+            json.dump(manifest, coverage_file, indent=2)
+        os.replace(path + '.tmp', path)
+
+    def gaps(self, key: BarSeriesKey, start: date, end: date) -> List[DateRange]:
+        """
+        Day ranges of a request not covered by the cache
+
+        Args:
+            key: Series
+            start: First day requested
+            end: Last day requested, inclusive
+
+        Returns:
+            Missing ranges in date order, empty if the whole request is cached
+        """
+        missing: List[DateRange] = []
+        cursor = start
+        for covered_start, covered_end in self.coverage(key):
+            if covered_end < cursor:
+                continue
+            if covered_start > end:
+                break
+            if covered_start > cursor:
+                missing.append((cursor, covered_start - timedelta(days=1)))
+            cursor = covered_end + timedelta(days=1)
+            if cursor > end:
+                return missing
+        missing.append((cursor, end))
+        return missing
+
+    def read(self, key: BarSeriesKey, start: date, end: date) -> np.ndarray:
+        """
+        Cached bars of a series between two days, inclusive
+
+        Returns:
+            Structured BAR_DTYPE array in time order, read from memory-mapped partitions
+        """
+        path = self.path(key)
+        chunks = []
+        for partition in self._partitions(key, start, end):
+            file = os.path.join(path, partition)
+            if os.path.exists(file):
+                chunks.append(np.load(file, mmap_mode='r', allow_pickle=False))
+        if not chunks:
+            return np.empty(0, dtype=BAR_DTYPE)
+        records = chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+        timestamps = records['timestamp']
+        first = np.searchsorted(timestamps, (start - EPOCH_DATE).days * US_PER_DAY, 'left')
+        last = np.searchsorted(timestamps, ((end - EPOCH_DATE).days + 1) * US_PER_DAY, 'left')
+        return np.array(records[first:last])
+
+    def write(self, key: BarSeriesKey, records: np.ndarray, start: date, end: date, today: Optional[date] = None):
+        """
+        Merge downloaded bars into the cache and mark their day range as covered
+
+        Bars already cached with the same timestamp are replaced.
+
+        Args:
+            key: Series
+            records: Structured BAR_DTYPE array of the bars downloaded for the range
+            start: First day downloaded
+            end: Last day downloaded, inclusive
+            today: Current day, not marked as covered nor any later day, the current date by default
+        """
+        path = self.path(key)
+        os.makedirs(path, exist_ok=True)
+
+        if len(records):
+            days = (records['timestamp'] // US_PER_DAY).tolist()
+            partition_of_day = {day: self._partition(key, EPOCH_DATE + timedelta(days=day)) for day in set(days)}
+            record_partitions = np.array([partition_of_day[day] for day in days])
+            for partition in set(partition_of_day.values()):
+                self._merge_partition(os.path.join(path, partition), records[record_partitions == partition])
+
+        last_final = last_final_day(today)
+        if start <= min(end, last_final):
+            self._write_coverage(key, merge_ranges(self.coverage(key) + [(start, min(end, last_final))]))
+
+    @staticmethod
+    def _merge_partition(file: str, records: np.ndarray):
+        if os.path.exists(file):
+            records = np.concatenate((np.load(file, allow_pickle=False), records))
+        records = records[np.argsort(records['timestamp'], kind='stable')]
+        timestamps = records['timestamp']
+        records = records[np.append(timestamps[1:] != timestamps[:-1], True)]  # the last bar of a timestamp wins
+        with open(file + '.tmp', 'wb') as partition_file:
+            np.save(partition_file, records, allow_pickle=False)
+        os.replace(file + '.tmp', file)
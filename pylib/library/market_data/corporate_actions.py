@@ -0,0 +1,222 @@
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from pylib.library.config.enumerations import CorporateActionType
+from pylib.library.market_data.historical_data import HistoricalBar, HistoricalBarSeries
+
+ACTION_COLUMNS = ['symbol', 'action_type', 'ex_date', 'ratio', 'amount']
+
+
+@dataclass(frozen=True)
+class CorporateAction:
+    """
+    Split or cash dividend of a symbol, effective on its ex-date
+    """
+    symbol: str
+    action_type: CorporateActionType
+    ex_date: date
+    ratio: float = 1.0  # new shares per old share for a split, e.g. 2.0 for a 2-for-1 split
+    amount: float = 0.0  # cash dividend per share, in the price currency
+
+
+class CorporateActionStore:
+    """
+    Splits and dividends by symbol, used to back-adjust raw historical bars
+
+    Every symbol carries a version incremented only when a new action is added, so that the adjusted views built from
+    the store (see AdjustedBarSeries) are recomputed when, and only when, the actions of their symbol change.
+    """
+    def __init__(self, actions: Sequence[CorporateAction] = ()):
+        self._actions: Dict[str, List[CorporateAction]] = {}
+        self._versions: Dict[str, int] = {}
+        self.add_many(actions)
+
+    def add(self, action: CorporateAction) -> bool:
+        """
+        Add an action, ignored if already in the store
+
+        Returns:
+            Whether the action was new
+        """
+        actions = self._actions.setdefault(action.symbol, [])
+        if action in actions:
+            return False
+        actions.append(action)
+        actions.sort(key=lambda existing: (existing.ex_date, existing.action_type.name))
+        self._versions[action.symbol] = self._versions.get(action.symbol, 0) + 1
+        return True
+
+    def add_many(self, actions: Sequence[CorporateAction]) -> int:
+        """Add several actions, returns the number of new ones"""
+        return sum(self.add(action) for action in actions)
+
+    def actions(self, symbol: str) -> List[CorporateAction]:
+        """Actions of a symbol by ex-date"""
+        return list(self._actions.get(symbol, []))
+
+    def version(self, symbol: str) -> int:
+        """Version of the actions of a symbol, 0 if it has none"""
+        return self._versions.get(symbol, 0)
+
+    def factors(
+            self,
+            symbol: str,
+            dates: np.ndarray,
+            closes: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Cumulative back-adjustment factors of a raw bar series
+
+        Each action contributes a factor applied to every bar before its ex-date: 1 / ratio on prices and ratio on
+        volumes for a split, 1 - amount / previous close on prices for a dividend, the previous close being the raw
+        close of the last bar before the ex-date. The factor of a bar is the product of the factors of the actions
+        after it, read from a reverse cumulative product of the action factors with one searchsorted.
+
+        Args:
+            symbol: Symbol of the bars
+            dates: datetime64[D] date of each bar, increasing
+            closes: Raw close of each bar
+
+        Returns:
+            Price factor and volume factor of each bar
+        """
+        actions = self._actions.get(symbol)
+        if not actions or len(dates) == 0:
+            return np.ones(len(dates)), np.ones(len(dates))
+
+        ex_dates = np.array([action.ex_date for action in actions], dtype='datetime64[D]')
+        previous = np.searchsorted(dates, ex_dates, side='left') - 1  # last bar before each ex-date
+        price_factors = np.ones(len(actions))
+        volume_factors = np.ones(len(actions))
+        for i, action in enumerate(actions):
+            if action.action_type == CorporateActionType.SPLIT:
+                price_factors[i] = 1.0 / action.ratio
+                volume_factors[i] = action.ratio
+            elif previous[i] >= 0:
+                price_factors[i] = 1.0 - action.amount / closes[previous[i]]
+
+        # Factor of the actions from each one onwards, with a trailing 1 for the bars after the last ex-date
+        price_suffix = np.append(np.cumprod(price_factors[::-1])[::-1], 1.0)
+        volume_suffix = np.append(np.cumprod(volume_factors[::-1])[::-1], 1.0)
+        first_after = np.searchsorted(ex_dates, dates, side='right')
+        return price_suffix[first_after], volume_suffix[first_after]
+
+    def to_frame(self) -> DataFrame:
+        """All the actions, one row each, with the ACTION_COLUMNS"""
+        return DataFrame([
+            (action.symbol, action.action_type.name, action.ex_date, action.ratio, action.amount)
+            for actions in self._actions.values() for action in actions
+        ], columns=ACTION_COLUMNS)
+
+    @classmethod
+    def from_frame(cls, frame: DataFrame) -> 'CorporateActionStore':
+        """Store holding the actions of a DataFrame with the ACTION_COLUMNS, e.g. written by to_frame"""
+        return cls([
+            CorporateAction(symbol, CorporateActionType[action_type], ex_date, float(ratio), float(amount))
+            for symbol, action_type, ex_date, ratio, amount in zip(
+                frame['symbol'], frame['action_type'], pd.to_datetime(frame['ex_date']).dt.date, frame['ratio'],
+                frame['amount'])
+        ])
+
+
+class AdjustedBarSeries:
+    """
+    Lazily back-adjusted view of a raw historical bar series
+
+    The raw bars are read once into arrays and never modified. Adjusted prices and volumes are the raw arrays times
+    the cumulative factors of the store, computed on first read and cached until the version of the symbol's actions
+    changes.
+    """
+    def __init__(self, symbol: str, bars: List[HistoricalBar], store: CorporateActionStore):
+        """
+        Args:
+            symbol: Symbol of the bars
+            bars: Raw bars in time order, e.g. from IBAPIClient.request_historical_data with TRADES
+            store: Corporate actions
+        """
+        self.symbol = symbol
+        self.bars = bars
+        self.store = store
+        names = ('open_price', 'high_price', 'low_price', 'close_price', 'weighted_avg_price')
+        if isinstance(bars, HistoricalBarSeries):
+            self.timestamps = bars.datetimes.copy()
+            self.raw_prices = {name: bars.column(name + 's').copy() for name in names}
+            self.raw_volumes = bars.column('volumes').astype(np.float64)
+        else:
+            self.timestamps = np.array([bar.timestamp for bar in bars], dtype='datetime64[us]')
+            self.raw_prices = {
+                name: np.fromiter((float(getattr(bar, name)) for bar in bars), dtype=np.float64, count=len(bars))
+                for name in names
+            }
+            self.raw_volumes = np.fromiter((float(bar.volume) for bar in bars), dtype=np.float64, count=len(bars))
+        self.dates = self.timestamps.astype('datetime64[D]')
+        self._version: Optional[int] = None
+        self._adjusted: Dict[str, np.ndarray] = {}
+
+    def _refresh(self):
+        """Recompute the factors if the actions of the symbol changed since the last read"""
+        version = self.store.version(self.symbol)
+        if version == self._version:
+            return
+        self._price_factors, self._volume_factors = self.store.factors(
+            self.symbol, self.dates, self.raw_prices['close_price'])
+        self._adjusted.clear()
+        self._version = version
+
+    @property
+    def price_factors(self) -> np.ndarray:
+        """Cumulative price adjustment factor of each bar"""
+        self._refresh()
+        return self._price_factors
+
+    def adjusted(self, name: str) -> np.ndarray:
+        """
+        Adjusted values of a bar field
+
+        Args:
+            name: open_price, high_price, low_price, close_price, weighted_avg_price or volume
+        """
+        self._refresh()
+        values = self._adjusted.get(name)
+        if values is None:
+            if name == 'volume':
+                values = self.raw_volumes * self._volume_factors
+            else:
+                values = self.raw_prices[name] * self._price_factors
+            self._adjusted[name] = values
+        return values
+
+    @property
+    def closes(self) -> np.ndarray:
+        """Adjusted close of each bar"""
+        return self.adjusted('close_price')
+
+    @property
+    def log_returns(self) -> np.ndarray:
+        """Log returns of the adjusted closes, including dividends"""
+        return np.diff(np.log(self.closes))
+
+    def adjusted_bars(self) -> List[HistoricalBar]:
+        """Adjusted copies of the bars"""
+        columns = [self.adjusted(name).tolist() for name in
+                   ('open_price', 'high_price', 'low_price', 'close_price', 'weighted_avg_price', 'volume')]
+        return [
+            HistoricalBar(
+                timestamp=bar.timestamp,
+                open_price=Decimal(repr(open_price)),
+                high_price=Decimal(repr(high_price)),
+                low_price=Decimal(repr(low_price)),
+                close_price=Decimal(repr(close_price)),
+                volume=int(round(volume)),
+                weighted_avg_price=Decimal(repr(weighted_avg_price)),
+                bar_count=bar.bar_count
+            )
+            for bar, open_price, high_price, low_price, close_price, weighted_avg_price, volume in zip(
+                self.bars, *columns)
+        ]
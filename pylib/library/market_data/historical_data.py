@@ -1,9 +1,15 @@
 
+from collections.abc import Sequence
 from datetime import datetime
 from decimal import Decimal
+from typing import Dict, Iterable, List
 
 from dataclasses import dataclass
 
+import numpy as np
+
+from pylib.library.utils.fixed_point import to_fixed, from_fixed, datetime_to_us, us_to_datetime
+
 
 @dataclass
 class HistoricalBar:
@@ -15,4 +21,190 @@ class HistoricalBar:
     close_price: Decimal
     volume: int
     weighted_avg_price: Decimal
-    bar_count: int
\ No newline at end of file
+    bar_count: int
+
+
+class CompactHistoricalBar:
+    """
+    Slotted counterpart of HistoricalBar, storing prices as fixed point int64 and the timestamp as epoch microseconds.
+    Converts to and from HistoricalBar, prices rounded to PRICE_DECIMALS decimal places.
+    """
+    __slots__ = (
+        'timestamp', 'open_price', 'high_price', 'low_price', 'close_price', 'volume', 'weighted_avg_price',
+        'bar_count'
+    )
+
+    def __init__(self, timestamp: int, open_price: int, high_price: int, low_price: int, close_price: int,
+                 volume: int, weighted_avg_price: int, bar_count: int):
+        self.timestamp = timestamp
+        self.open_price = open_price
+        self.high_price = high_price
+        self.low_price = low_price
+        self.close_price = close_price
+        self.volume = volume
+        self.weighted_avg_price = weighted_avg_price
+        self.bar_count = bar_count
+
+    @classmethod
+    def from_bar(cls, bar: HistoricalBar) -> 'CompactHistoricalBar':
+        """Build the compact representation of a HistoricalBar"""
+        return cls(
+            datetime_to_us(bar.timestamp), to_fixed(bar.open_price), to_fixed(bar.high_price),
+            to_fixed(bar.low_price), to_fixed(bar.close_price), bar.volume, to_fixed(bar.weighted_avg_price),
+            bar.bar_count
+        )
+
+    def to_bar(self) -> HistoricalBar:
+        """Rebuild the HistoricalBar dataclass"""
+        return HistoricalBar(
+            timestamp=us_to_datetime(self.timestamp),
+            open_price=from_fixed(self.open_price),
+            high_price=from_fixed(self.high_price),
+            low_price=from_fixed(self.low_price),
+            close_price=from_fixed(self.close_price),
+            volume=self.volume,
+            weighted_avg_price=from_fixed(self.weighted_avg_price),
+            bar_count=self.bar_count
+        )
+
+
+# Columns of a HistoricalBarSeries and their dtypes, in HistoricalBar field order
+SERIES_COLUMNS = {
+    'timestamps': np.int64,  # microseconds since the epoch
+    'open_prices': np.float64,
+    'high_prices': np.float64,
+    'low_prices': np.float64,
+    'close_prices': np.float64,
+    'volumes': np.int64,
+    'weighted_avg_prices': np.float64,
+    'bar_counts': np.int64,
+}
+
+INITIAL_CAPACITY = 256
+
+
+class HistoricalBarSeries(Sequence):
+    """
+    Columnar series of historical bars: one preallocated NumPy array per field, grown by doubling
+
+    Bars are appended as plain numbers, e.g. straight from the IBKR bar callback with parse_bar_date, without building
+    any object. The series is a read-only sequence of HistoricalBar built lazily on access, so that code iterating bar
+    lists keeps working, while numeric code reads the column arrays directly.
+
+    Timestamps are microseconds since the epoch, of the naive bar datetime (formatDate=1) or UTC (formatDate=2 epoch
+    seconds), as in CompactHistoricalBar.
+    """
+    def __init__(self, capacity: int = INITIAL_CAPACITY):
+        self._size = 0
+        self._columns = {name: np.empty(max(capacity, 1), dtype=dtype) for name, dtype in SERIES_COLUMNS.items()}
+
+    @classmethod
+    def from_bars(cls, bars: Iterable[HistoricalBar]) -> 'HistoricalBarSeries':
+        """Series of HistoricalBar objects"""
+        bars = list(bars)
+        series = cls(len(bars))
+        for bar in bars:
+            series.append(datetime_to_us(bar.timestamp), float(bar.open_price), float(bar.high_price),
+                          float(bar.low_price), float(bar.close_price), int(bar.volume),
+                          float(bar.weighted_avg_price), int(bar.bar_count))
+        return series
+
+    def _grow(self):
+        capacity = 2 * len(self._columns['timestamps'])
+        for name, values in self._columns.items():
+            grown = np.empty(capacity, dtype=values.dtype)
+            grown[:self._size] = values[:self._size]
+            self._columns[name] = grown
+
+    def append(self, timestamp: int, open_price: float, high_price: float, low_price: float, close_price: float,
+               volume: int, weighted_avg_price: float, bar_count: int):
+        """Append a bar, in amortized constant time"""
+        if self._size == len(self._columns['timestamps']):
+            self._grow()
+        i = self._size
+        columns = self._columns
+        columns['timestamps'][i] = timestamp
+        columns['open_prices'][i] = open_price
+        columns['high_prices'][i] = high_price
+        columns['low_prices'][i] = low_price
+        columns['close_prices'][i] = close_price
+        columns['volumes'][i] = volume
+        columns['weighted_avg_prices'][i] = weighted_avg_price
+        columns['bar_counts'][i] = bar_count
+        self._size = i + 1
+
+    def clear(self):
+        """Drop every bar, keeping the buffers"""
+        self._size = 0
+
+    def column(self, name: str) -> np.ndarray:
+        """View of a column, see SERIES_COLUMNS"""
+        return self._columns[name][:self._size]
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self.column('timestamps')
+
+    @property
+    def datetimes(self) -> np.ndarray:
+        """datetime64[us] timestamp of each bar"""
+        return self.timestamps.view('datetime64[us]')
+
+    @property
+    def close_prices(self) -> np.ndarray:
+        return self.column('close_prices')
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._size))]
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("bar index out of range")
+        columns = self._columns
+        return HistoricalBar(
+            timestamp=us_to_datetime(int(columns['timestamps'][index])),
+            open_price=Decimal(repr(float(columns['open_prices'][index]))),
+            high_price=Decimal(repr(float(columns['high_prices'][index]))),
+            low_price=Decimal(repr(float(columns['low_prices'][index]))),
+            close_price=Decimal(repr(float(columns['close_prices'][index]))),
+            volume=int(columns['volumes'][index]),
+            weighted_avg_price=Decimal(repr(float(columns['weighted_avg_prices'][index]))),
+            bar_count=int(columns['bar_counts'][index])
+        )
+
+    def bars(self) -> List[HistoricalBar]:
+        """All the bars as HistoricalBar objects"""
+        return list(self)
+
+
+_day_us_cache: Dict[str, int] = {}
+
+
+def parse_bar_date(value: str) -> int:
+    """
+    Microseconds since the epoch of an IBKR bar date, without strptime
+
+    Args:
+        value: 'YYYYMMDD' for daily bars, 'YYYYMMDD HH:MM:SS' with an optional time zone for intraday bars
+            (formatDate=1), or epoch seconds (formatDate=2)
+
+    Returns:
+        Microseconds since the epoch
+    """
+    if len(value) == 8:
+        day = value
+    elif ' ' not in value:
+        return int(value) * 1_000_000
+    else:
+        day = value[:8]
+    day_us = _day_us_cache.get(day)
+    if day_us is None:
+        day_us = _day_us_cache[day] = datetime_to_us(datetime(int(day[:4]), int(day[4:6]), int(day[6:8])))
+    if len(value) == 8:
+        return day_us
+    time_of_day = value[9:].lstrip()
+    return day_us + (int(time_of_day[0:2]) * 3600 + int(time_of_day[3:5]) * 60 + int(time_of_day[6:8])) * 1_000_000
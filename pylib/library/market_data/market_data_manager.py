@@ -1,6 +1,18 @@
+from typing import Callable, Dict, Iterable, Optional, List, TYPE_CHECKING
+from threading import Condition, Event, Thread
+import time
 
-from typing import Dict, Optional, List
-from threading import Event, Thread
+import numpy as np
+from pandas import DataFrame
+
+from pylib.library.contract.contract import Contract
+from pylib.library.market_data.bar_aggregator import BarAggregator
+from pylib.library.market_data.subscription import MarketDataSubscription
+from pylib.library.market_data.tick_buffer import TICK_DTYPE, TICK_TYPE_CODES, TickRingBuffer
+from pylib.library.market_data.tick_recorder import TickRecorder
+
+if TYPE_CHECKING:
+    from pylib.library.portfolio.portfolio import Portfolio
 
 
 class MarketDataManager:
@@ -9,10 +21,39 @@ class MarketDataManager:
     *** Here market data refers to market price for a stock symbol, to be extended to broader definition ***
 
     Initiation will create an empty market data carrier to be filled with desired data.
+
+    Portfolios attached to the manager are revalued incrementally: each tick of the valuation tick type is applied to
+    the portfolios holding the symbol only, at a constant cost per portfolio.
+
+    With a tick history, the ticks of each symbol are also kept in a preallocated ring buffer (see TickRingBuffer), so
+    that readers can pull the last seconds of ticks without locking the callback thread.
+
+    Callers waiting for quotes (see wait_for_symbols) are woken by a condition notified on the first quote of each
+    symbol only, so that later ticks never touch the lock.
+
+    Consumers registered with subscribe receive the ticks of their symbols through conflating subscriptions (see
+    MarketDataSubscription), so that a slow consumer gets the latest quotes rather than blocking the callback thread.
     """
-    def __init__(self):
+    def __init__(self, valuation_tick_type: str = 'last', tick_history: int = 0):
+        """
+        Args:
+            valuation_tick_type (str): Tick type used to value the attached portfolios
+            tick_history (int): Number of ticks kept per symbol, no tick history if 0
+        """
         self.market_data: Dict[str, Dict[str, float]] = {}  # symbol: {tick_type: value}
         self.data_received_event = Event()
+        self.first_quote_condition = Condition()  # notified when a symbol receives its first quote
+
+        self.tick_history = tick_history
+        self.tick_buffers: Dict[str, TickRingBuffer] = {}  # symbol: ticks, filled when tick_history > 0
+        self.bar_aggregators: List[BarAggregator] = []  # fed with the trade ticks
+        self.tick_recorders: List[TickRecorder] = []  # fed with every tick
+        self.subscriptions: List[MarketDataSubscription] = []
+        self.subscriptions_by_symbol: Dict[str, List[MarketDataSubscription]] = {}  # symbol: subscriptions
+        self.all_symbol_subscriptions: List[MarketDataSubscription] = []
+
+        self.valuation_tick_type = valuation_tick_type
+        self.portfolios_by_symbol: Dict[str, Dict[str, 'Portfolio']] = {}  # symbol: {portfolio unique_id: portfolio}
 
     def store_market_data(self, symbol: str, tick_type: str, value: float):
         """
@@ -23,10 +64,38 @@ class MarketDataManager:
             tick_type (str): Type of market data (last, bid, ask)
             value (float): Market data value
         """
-        if symbol not in self.market_data:
-            self.market_data[symbol] = {}
+        quotes = self.market_data.get(symbol)
+        if quotes is None:
+            with self.first_quote_condition:
+                self.market_data[symbol] = {tick_type: value}
+                self.first_quote_condition.notify_all()
+        else:
+            quotes[tick_type] = value
+
+        for recorder in self.tick_recorders:
+            recorder.record(symbol, tick_type, value)
+
+        if self.tick_history and tick_type in TICK_TYPE_CODES:
+            buffer = self.tick_buffers.get(symbol)
+            if buffer is None:
+                buffer = self.tick_buffers[symbol] = TickRingBuffer(self.tick_history)
+            buffer.append(TICK_TYPE_CODES[tick_type], value)
+
+        if tick_type == 'last':
+            for aggregator in self.bar_aggregators:
+                aggregator.on_trade(symbol, value)
+
+        for subscription in self.subscriptions_by_symbol.get(symbol, ()):
+            subscription.publish(symbol, tick_type, value)
+        for subscription in self.all_symbol_subscriptions:
+            subscription.publish(symbol, tick_type, value)
 
-        self.market_data[symbol][tick_type] = value
+        if tick_type == self.valuation_tick_type:
+            portfolios = self.portfolios_by_symbol.get(symbol)
+            if portfolios:
+                # Copied as the caller's thread may track or untrack a portfolio meanwhile
+                for portfolio in list(portfolios.values()):
+                    portfolio.apply_price(symbol, value)
 
     def get_stored_market_data(self, symbol: str) -> Optional[Dict[str, float]]:
         """
@@ -39,3 +108,212 @@ class MarketDataManager:
             Optional dictionary of market data
         """
         return self.market_data.get(symbol)
+
+    def wait_for_symbols(self, symbols: Iterable[str], timeout: Optional[float] = None) -> List[str]:
+        """
+        Wait until every symbol has received at least one quote
+
+        Returns as soon as the last missing quote arrives, however many symbols are requested.
+
+        Args:
+            symbols (Iterable[str]): Stock symbols
+            timeout (Optional[float]): Maximum wait time in seconds for all the symbols, no limit if None
+
+        Returns:
+            List[str]: Symbols still without a quote at the timeout, empty if all arrived
+        """
+        missing = [symbol for symbol in symbols if symbol not in self.market_data]
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.first_quote_condition:
+            while True:
+                missing = [symbol for symbol in missing if symbol not in self.market_data]
+                if not missing:
+                    return missing
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return missing
+                self.first_quote_condition.wait(remaining)
+
+    def store_tick_size(self, symbol: str, tick_type: str, size: float):
+        """
+        Store the size of the last price tick of a type in the tick history and the bar aggregators
+
+        Args:
+            symbol (str): Stock symbol
+            tick_type (str): Type of the price tick (last, bid, ask)
+            size (float): Size
+        """
+        buffer = self.tick_buffers.get(symbol)
+        if buffer is not None and tick_type in TICK_TYPE_CODES:
+            buffer.set_size(TICK_TYPE_CODES[tick_type], size)
+
+        if tick_type == 'last':
+            for aggregator in self.bar_aggregators:
+                aggregator.on_size(symbol, size)
+
+    def subscribe(
+            self,
+            name: str,
+            symbols: Optional[Iterable[str]] = None,
+            callback: Optional[Callable[[str, Dict[str, float]], None]] = None
+    ) -> MarketDataSubscription:
+        """
+        Register a market data consumer
+
+        Without a callback the consumer takes its updates with the poll or wait methods of the subscription, with a
+        callback they are delivered on a dedicated thread.
+
+        Args:
+            name (str): Name of the consumer, e.g. valuation, compliance, ui, recorder
+            symbols (Optional[Iterable[str]]): Symbols subscribed to, all the symbols if None
+            callback (Optional[Callable]): Called with each symbol and its latest quotes by tick type
+
+        Returns:
+            MarketDataSubscription: Subscription, to pass to unsubscribe
+        """
+        subscription = MarketDataSubscription(name, symbols, callback)
+        self.subscriptions.append(subscription)
+        if subscription.symbols is None:
+            self.all_symbol_subscriptions = self.all_symbol_subscriptions + [subscription]
+        else:
+            for symbol in subscription.symbols:
+                self.subscriptions_by_symbol[symbol] = self.subscriptions_by_symbol.get(symbol, []) + [subscription]
+        if callback is not None:
+            subscription.start()
+        return subscription
+
+    def unsubscribe(self, subscription: MarketDataSubscription):
+        """Unregister a market data consumer and stop its delivery thread"""
+        if subscription not in self.subscriptions:
+            return
+        self.subscriptions.remove(subscription)
+        if subscription.symbols is None:
+            self.all_symbol_subscriptions = [
+                existing for existing in self.all_symbol_subscriptions if existing is not subscription]
+        else:
+            for symbol in subscription.symbols:
+                remaining = [existing for existing in self.subscriptions_by_symbol.get(symbol, [])
+                             if existing is not subscription]
+                if remaining:
+                    self.subscriptions_by_symbol[symbol] = remaining
+                else:
+                    self.subscriptions_by_symbol.pop(symbol, None)
+        subscription.close()
+
+    def subscription_stats(self) -> DataFrame:
+        """Queue depth and drop counters of every subscription, one row per consumer name"""
+        return DataFrame(
+            [subscription.stats() for subscription in self.subscriptions],
+            index=[subscription.name for subscription in self.subscriptions],
+            columns=['depth', 'max_depth', 'published', 'conflated', 'delivered']
+        )
+
+    def attach_tick_recorder(self, recorder: TickRecorder):
+        """
+        Record every stored tick to a binary tick log
+
+        Args:
+            recorder (TickRecorder): Recorder of the ticks
+        """
+        if recorder not in self.tick_recorders:
+            self.tick_recorders.append(recorder)
+
+    def detach_tick_recorder(self, recorder: TickRecorder):
+        """Stop recording the ticks to a tick log, writing the buffered ones"""
+        if recorder in self.tick_recorders:
+            self.tick_recorders.remove(recorder)
+            recorder.flush()
+
+    def attach_bar_aggregator(self, aggregator: BarAggregator):
+        """
+        Stream the trade ticks of every symbol to a bar aggregator
+
+        Args:
+            aggregator (BarAggregator): Aggregator building bars from the trades
+        """
+        if aggregator not in self.bar_aggregators:
+            self.bar_aggregators.append(aggregator)
+
+    def detach_bar_aggregator(self, aggregator: BarAggregator):
+        """Stop streaming trade ticks to a bar aggregator"""
+        if aggregator in self.bar_aggregators:
+            self.bar_aggregators.remove(aggregator)
+
+    def get_tick_buffer(self, symbol: str) -> Optional[TickRingBuffer]:
+        """Tick history of a symbol, None if no tick was stored"""
+        return self.tick_buffers.get(symbol)
+
+    def recent_ticks(self, symbol: str, seconds: float) -> np.ndarray:
+        """
+        Copy of the ticks of a symbol received in the last seconds
+
+        Args:
+            symbol (str): Stock symbol
+            seconds (float): Length of the window
+
+        Returns:
+            Structured array of TICK_DTYPE records, oldest first, empty if the symbol has no tick history
+        """
+        buffer = self.tick_buffers.get(symbol)
+        if buffer is None:
+            return np.empty(0, dtype=TICK_DTYPE)
+        return buffer.since(seconds)
+
+    def attach_portfolio(self, portfolio: 'Portfolio'):
+        """
+        Stream the prices of the symbols held in a portfolio to it
+
+        The portfolio keeps the manager informed of the contracts it opens and closes afterwards.
+
+        Args:
+            portfolio (Portfolio): Portfolio to revalue on each tick
+        """
+        if self not in portfolio.market_data_managers:
+            portfolio.market_data_managers.append(self)
+        for contract in portfolio.positions:
+            self.track(portfolio, contract)
+
+    def detach_portfolio(self, portfolio: 'Portfolio'):
+        """Stop streaming prices to a portfolio"""
+        if self in portfolio.market_data_managers:
+            portfolio.market_data_managers.remove(self)
+        for symbol in portfolio.index.values('symbol'):
+            self._remove_portfolio(symbol, portfolio)
+
+    def track(self, portfolio: 'Portfolio', contract: Contract):
+        """
+        Register a contract held in an attached portfolio, seeding it with the last stored price
+
+        Args:
+            portfolio (Portfolio): Attached portfolio
+            contract (Contract): Contract held in the portfolio
+        """
+        symbol = contract.symbol
+        if symbol is None:
+            return
+
+        self.portfolios_by_symbol.setdefault(symbol, {})[portfolio.unique_id] = portfolio
+        price = self.market_data.get(symbol, {}).get(self.valuation_tick_type)
+        if price is not None:
+            portfolio.apply_price(symbol, price)
+
+    def untrack(self, portfolio: 'Portfolio', contract: Contract):
+        """
+        Unregister a contract closed in an attached portfolio
+
+        Args:
+            portfolio (Portfolio): Attached portfolio
+            contract (Contract): Contract no longer held in the portfolio
+        """
+        symbol = contract.symbol
+        if symbol is None or portfolio.index.first_contract_for('symbol', symbol) is not None:
+            return
+        self._remove_portfolio(symbol, portfolio)
+
+    def _remove_portfolio(self, symbol: str, portfolio: 'Portfolio'):
+        portfolios = self.portfolios_by_symbol.get(symbol)
+        if portfolios is None:
+            return
+        portfolios.pop(portfolio.unique_id, None)
+        if not portfolios:
+            del self.portfolios_by_symbol[symbol]
@@ -4,6 +4,7 @@ from decimal import Decimal
 from dataclasses import dataclass, field
 
 from pylib.library.instrument.instrument import Instrument
+from pylib.library.utils.fixed_point import to_fixed, from_fixed, datetime_to_us, us_to_datetime
 
 
 @dataclass
@@ -21,3 +22,43 @@ class SecurityMarketData:
         """Calculate mid-price"""
         return (self.bid_price + self.ask_price) / 2
 
+
+class CompactSecurityMarketData:
+    """
+    Slotted counterpart of SecurityMarketData, storing prices as fixed point int64 and the timestamp as epoch
+    microseconds. Converts to and from SecurityMarketData, prices rounded to PRICE_DECIMALS decimal places.
+    """
+    __slots__ = ('instrument', 'last_price', 'bid_price', 'ask_price', 'volume', 'timestamp')
+
+    def __init__(self, instrument: Instrument, last_price: int, bid_price: int, ask_price: int, volume: int,
+                 timestamp: int):
+        self.instrument = instrument
+        self.last_price = last_price
+        self.bid_price = bid_price
+        self.ask_price = ask_price
+        self.volume = volume
+        self.timestamp = timestamp
+
+    @property
+    def mid_price(self) -> Decimal:
+        """Calculate mid-price"""
+        return from_fixed(self.bid_price + self.ask_price) / 2
+
+    @classmethod
+    def from_market_data(cls, market_data: SecurityMarketData) -> 'CompactSecurityMarketData':
+        """Build the compact representation of a SecurityMarketData"""
+        return cls(
+            market_data.instrument, to_fixed(market_data.last_price), to_fixed(market_data.bid_price),
+            to_fixed(market_data.ask_price), market_data.volume, datetime_to_us(market_data.timestamp)
+        )
+
+    def to_market_data(self) -> SecurityMarketData:
+        """Rebuild the SecurityMarketData dataclass"""
+        return SecurityMarketData(
+            instrument=self.instrument,
+            last_price=from_fixed(self.last_price),
+            bid_price=from_fixed(self.bid_price),
+            ask_price=from_fixed(self.ask_price),
+            volume=self.volume,
+            timestamp=us_to_datetime(self.timestamp)
+        )
@@ -0,0 +1,118 @@
+import logging
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+Quotes = Dict[str, Dict[str, float]]  # symbol: {tick_type: value}
+
+
+class MarketDataSubscription:
+    """
+    Conflating subscription of a market data consumer to the ticks of some symbols
+
+    The publisher, the IB callback thread, only records the latest value of each symbol and tick type in a pending
+    dict under a short lock, so a slow consumer never blocks it: updates of a symbol that was not delivered yet replace
+    the pending one and are counted as conflated. The consumer takes every pending quote at once, either by polling
+    (poll, wait) or through a callback run on a dedicated thread (start).
+
+    The counters (see stats) monitor how far behind a consumer is: depth is the number of symbols waiting to be
+    delivered, conflated the number of updates dropped in favor of a later one.
+    """
+    def __init__(
+            self,
+            name: str,
+            symbols: Optional[Iterable[str]] = None,
+            callback: Optional[Callable[[str, Dict[str, float]], None]] = None
+    ):
+        """
+        Args:
+            name: Name of the consumer, e.g. valuation, compliance, ui, recorder
+            symbols: Symbols subscribed to, all the symbols if None
+            callback: Called with each symbol and its latest quotes by tick type, on the subscription thread
+        """
+        self.name = name
+        self.symbols = None if symbols is None else set(symbols)
+        self.callback = callback
+        self.published = 0  # updates received from the publisher
+        self.conflated = 0  # updates replaced by a later one before delivery
+        self.delivered = 0  # symbols delivered to the consumer
+        self.max_depth = 0  # largest number of pending symbols seen
+        self._pending: Quotes = {}
+        self._lock = Lock()
+        self._ready = Event()
+        self._closed = False
+        self._thread: Optional[Thread] = None
+
+    def publish(self, symbol: str, tick_type: str, value: float):
+        """Record the latest value of a symbol and tick type, in constant time"""
+        with self._lock:
+            quotes = self._pending.get(symbol)
+            if quotes is None:
+                self._pending[symbol] = {tick_type: value}
+                if len(self._pending) > self.max_depth:
+                    self.max_depth = len(self._pending)
+            else:
+                if tick_type in quotes:
+                    self.conflated += 1
+                quotes[tick_type] = value
+            self.published += 1
+        if not self._ready.is_set():
+            self._ready.set()
+
+    def poll(self) -> Quotes:
+        """Take every pending quote, empty if none"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._ready.clear()
+        self.delivered += len(pending)
+        return pending
+
+    def wait(self, timeout: Optional[float] = None) -> Quotes:
+        """Wait for pending quotes and take them, empty at the timeout or once closed"""
+        self._ready.wait(timeout)
+        return self.poll()
+
+    @property
+    def depth(self) -> int:
+        """Number of symbols waiting to be delivered"""
+        return len(self._pending)
+
+    def stats(self) -> Dict[str, int]:
+        """Monitoring counters"""
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'published': self.published,
+            'conflated': self.conflated,
+            'delivered': self.delivered,
+        }
+
+    def start(self):
+        """
+        Deliver the pending quotes to the callback on a dedicated daemon thread
+
+        Raises:
+            ValueError: If the subscription has no callback
+        """
+        if self.callback is None:
+            raise ValueError(f"Subscription {self.name} has no callback to deliver to")
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name=f"market-data-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            for symbol, quotes in self.wait().items():
+                try:
+                    self.callback(symbol, quotes)
+                except Exception as e:
+                    logger.error(f"Market data consumer {self.name} failed on {symbol}: {str(e)}")
+
+    def close(self, timeout: Optional[float] = None):
+        """Stop the delivery thread, if started"""
+        self._closed = True
+        self._ready.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
@@ -0,0 +1,125 @@
+import time
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Tick type codes stored in the buffer, the IBKR tick type ids of the prices
+TICK_TYPE_CODES = {
+    'bid': 1,
+    'ask': 2,
+    'last': 4,
+}
+
+TICK_DTYPE = np.dtype([
+    ('timestamp', np.int64),  # nanoseconds since the epoch
+    ('tick_type', np.int8),  # TICK_TYPE_CODES
+    ('price', np.float64),
+    ('size', np.float64),  # NaN until the size is received
+])
+
+
+class TickRingBuffer:
+    """
+    Preallocated ring buffer of the last ticks of a symbol, as a structured array of TICK_DTYPE records
+
+    The buffer has a single writer, the market data callback thread: an append writes one record then increments the
+    tick count, in constant time and without any lock. Readers never block the writer either: they copy the records
+    they need then check how far the writer got, dropping the records that were overwritten while they were copied.
+
+    The records of a window are at most two contiguous slices of the array, returned as views by segments() for
+    zero-copy reads when the caller can tolerate records being overwritten under it.
+    """
+    def __init__(self, capacity: int):
+        """
+        Args:
+            capacity: Number of ticks kept, the oldest ones are overwritten
+        """
+        self.capacity = max(int(capacity), 1)
+        self.records = np.zeros(self.capacity, dtype=TICK_DTYPE)
+        self.count = 0  # number of ticks ever appended
+        self._writing = 0  # count once the tick being appended is written, ahead of count during an append
+        self._last_index_by_type = {}  # tick type code: count of the last tick of the type
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def append(self, tick_type: int, price: float, size: float = np.nan, timestamp: Optional[int] = None):
+        """
+        Append a tick, overwriting the oldest one when the buffer is full
+
+        Args:
+            tick_type: Tick type code
+            price: Price
+            size: Size, NaN if not known yet
+            timestamp: Nanoseconds since the epoch, the current time by default
+        """
+        count = self.count
+        self._writing = count + 1
+        self.records[count % self.capacity] = (time.time_ns() if timestamp is None else timestamp, tick_type, price,
+                                               size)
+        self._last_index_by_type[tick_type] = count
+        self.count = count + 1
+
+    def set_size(self, tick_type: int, size: float, timestamp: Optional[int] = None):
+        """
+        Set the size of the last tick of a type if it has none yet, else append a tick repeating its price
+
+        IBKR sends the size of a price tick in a separate callback, right after the price.
+        """
+        index = self._last_index_by_type.get(tick_type)
+        if index is None or self.count - index > self.capacity:
+            return
+        record = self.records[index % self.capacity]
+        if np.isnan(record['size']):
+            record['size'] = size
+        else:
+            self.append(tick_type, float(record['price']), size, timestamp)
+
+    def _segments(self, count: int, n: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Views of the n ticks before the count-th one, n being at most the number of ticks kept"""
+        if n == 0:
+            return self.records[:0], self.records[:0]
+        start, end = (count - n) % self.capacity, count % self.capacity
+        if start < end:
+            return self.records[start:end], self.records[:0]
+        return self.records[start:], self.records[:end]
+
+    def _copy(self, count: int, n: int) -> np.ndarray:
+        """Copy of the n ticks before the count-th one, less the ones overwritten while they were copied"""
+        first, second = self._segments(count, n)
+        ticks = np.concatenate((first, second))
+        # Ticks before the one being written minus capacity are gone, whether the writer is done with it or not
+        overwritten = (self._writing - self.capacity) - (count - n)
+        return ticks[overwritten:] if overwritten > 0 else ticks
+
+    def segments(self, n: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Views of the last n ticks, all the ticks kept by default, oldest first
+
+        Returns:
+            Two views of the records array, the second one is empty unless the window wraps around
+        """
+        count = self.count
+        kept = min(count, self.capacity)
+        return self._segments(count, kept if n is None else min(n, kept))
+
+    def last(self, n: Optional[int] = None) -> np.ndarray:
+        """Copy of the last n ticks, all the ticks kept by default, oldest first"""
+        count = self.count
+        kept = min(count, self.capacity)
+        return self._copy(count, kept if n is None else min(n, kept))
+
+    def since(self, seconds: float, now: Optional[int] = None) -> np.ndarray:
+        """
+        Copy of the ticks of the last seconds, oldest first
+
+        Args:
+            seconds: Length of the window
+            now: End of the window in nanoseconds since the epoch, the current time by default
+        """
+        start = (time.time_ns() if now is None else now) - int(seconds * 1e9)
+        count = self.count
+        first, second = self._segments(count, min(count, self.capacity))
+        n = sum(len(segment) - int(np.searchsorted(segment['timestamp'], start, side='left'))
+                for segment in (first, second))
+        return self._copy(count, n)
@@ -0,0 +1,223 @@
+import os
+import time
+from datetime import date, datetime, timedelta
+from typing import BinaryIO, Dict, List, Optional, Sequence, TextIO, Tuple
+
+import numpy as np
+
+from pylib.library.market_data.tick_buffer import TICK_TYPE_CODES
+
+TICK_LOG_MAGIC = b'PMTICKS1'  # format name and version, followed by the records
+HEADER_SIZE = len(TICK_LOG_MAGIC)
+
+# Fixed-width little-endian record, packed: 21 bytes per tick
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<i8'),  # nanoseconds since the epoch, UTC
+    ('symbol', '<i4'),  # line of the symbol in the symbols file of the day
+    ('tick_type', 'i1'),  # TICK_TYPE_CODES
+    ('price', '<f8'),
+])
+
+DEFAULT_BATCH_SIZE = 4096  # ticks buffered before a write
+NS_PER_DAY = 86_400 * 1_000_000_000
+
+
+def log_paths(root: str, day: date) -> Tuple[str, str]:
+    """Records and symbols files of a day"""
+    name = f"ticks_{day:%Y%m%d}"
+    return os.path.join(root, name + '.bin'), os.path.join(root, name + '.symbols')
+
+
+class TickRecorder:
+    """
+    Append-only binary log of every tick, rotated daily
+
+    Each UTC day has a records file, a header then fixed-width RECORD_DTYPE records, and a symbols file listing the
+    symbols of the day one per line, the records referencing symbols by line. Ticks are written into a preallocated
+    batch of records, in constant time and without any conversion, and the batch is written to the file in one call
+    once full, on flush or when the day changes. A crash loses at most the current batch, and a partially written
+    record at the end of a file is ignored by the reader.
+    """
+    def __init__(self, root: str, batch_size: int = DEFAULT_BATCH_SIZE):
+        """
+        Args:
+            root: Directory of the logs, created if needed
+            batch_size: Ticks buffered before a write
+        """
+        os.makedirs(root, exist_ok=True)
+        self.root = root
+        self.batch = np.zeros(max(batch_size, 1), dtype=RECORD_DTYPE)
+        self.size = 0  # ticks in the batch
+        self.recorded = 0  # ticks recorded since creation
+        self.day: Optional[int] = None  # days since the epoch of the open files
+        self._day_end = 0  # first nanosecond of the next day
+        self._records_file: Optional[BinaryIO] = None
+        self._symbols_file: Optional[TextIO] = None
+        self._symbol_codes: Dict[str, int] = {}
+
+    def record(self, symbol: str, tick_type: str, price: float, timestamp: Optional[int] = None):
+        """
+        Record a tick, e.g. from MarketDataManager.store_market_data
+
+        Args:
+            symbol: Symbol
+            tick_type: Tick type, ticks of types not in TICK_TYPE_CODES are ignored
+            price: Price
+            timestamp: Nanoseconds since the epoch, the current time by default
+        """
+        tick_code = TICK_TYPE_CODES.get(tick_type)
+        if tick_code is None:
+            return
+        if timestamp is None:
+            timestamp = time.time_ns()
+        if timestamp >= self._day_end or self.day is None:
+            self._rotate(timestamp // NS_PER_DAY)
+        symbol_code = self._symbol_codes.get(symbol)
+        if symbol_code is None:
+            symbol_code = self._add_symbol(symbol)
+
+        self.batch[self.size] = (timestamp, symbol_code, tick_code, price)
+        self.size += 1
+        self.recorded += 1
+        if self.size == len(self.batch):
+            self.flush()
+
+    def _add_symbol(self, symbol: str) -> int:
+        code = self._symbol_codes[symbol] = len(self._symbol_codes)
+        self._symbols_file.write(symbol + '\n')
+        self._symbols_file.flush()  # before any record referencing it
+        return code
+
+    def _rotate(self, day: int):
+        """Flush the batch and open the files of a day, appending to them if they exist"""
+        self.flush()
+        self._close_files()
+        records_path, symbols_path = log_paths(self.root, date(1970, 1, 1) + timedelta(days=day))
+
+        self._symbol_codes = {}
+        if os.path.exists(symbols_path):
+            with open(symbols_path) as symbols_file:
+                for line in symbols_file:
+                    self._symbol_codes[line.rstrip('\n')] = len(self._symbol_codes)
+        self._symbols_file = open(symbols_path, 'a')
+
+        exists = os.path.exists(records_path)
+        self._records_file = open(records_path, 'ab')
+        if not exists:
+            self._records_file.write(TICK_LOG_MAGIC)
+        else:
+            # Drop a record partially written before a crash, so that the next ones stay aligned
+            partial = (os.path.getsize(records_path) - HEADER_SIZE) % RECORD_DTYPE.itemsize
+            if partial:
+                self._records_file.truncate(os.path.getsize(records_path) - partial)
+        self.day = day
+        self._day_end = (day + 1) * NS_PER_DAY
+
+    def flush(self):
+        """Write the buffered ticks to the log"""
+        if self.size and self._records_file is not None:
+            self._records_file.write(self.batch[:self.size].tobytes())
+            self._records_file.flush()
+        self.size = 0
+
+    def _close_files(self):
+        for file in (self._records_file, self._symbols_file):
+            if file is not None:
+                file.close()
+        self._records_file = self._symbols_file = None
+
+    def close(self):
+        """Write the buffered ticks and close the files"""
+        self.flush()
+        self._close_files()
+        self.day = None
+
+
+class TickLogReader:
+    """
+    Reader of the logs of a TickRecorder
+
+    The records files are memory-mapped and filtered with vectorized operations only: the time range with a
+    searchsorted on the timestamps, which are in time order within a day, and the symbols with their codes.
+    """
+    def __init__(self, root: str):
+        """
+        Args:
+            root: Directory of the logs
+        """
+        self.root = root
+
+    def days(self) -> List[date]:
+        """Days with a log, in order"""
+        return sorted(datetime.strptime(name[6:14], '%Y%m%d').date() for name in os.listdir(self.root)
+                      if name.startswith('ticks_') and name.endswith('.bin'))
+
+    def symbols(self, day: date) -> List[str]:
+        """Symbols of a day, in code order"""
+        with open(log_paths(self.root, day)[1]) as symbols_file:
+            return [line.rstrip('\n') for line in symbols_file]
+
+    def records(self, day: date) -> np.ndarray:
+        """
+        Memory-mapped records of a day, read-only
+
+        Raises:
+            ValueError: If the file is not a tick log
+        """
+        records_path = log_paths(self.root, day)[0]
+        with open(records_path, 'rb') as records_file:
+            if records_file.read(HEADER_SIZE) != TICK_LOG_MAGIC:
+                raise ValueError(f"{records_path} is not a tick log")
+        count = (os.path.getsize(records_path) - HEADER_SIZE) // RECORD_DTYPE.itemsize
+        if count == 0:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.memmap(records_path, dtype=RECORD_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+    def read(
+            self,
+            start: int,
+            end: int,
+            symbols: Optional[Sequence[str]] = None
+    ) -> Tuple[np.ndarray, List[str]]:
+        """
+        Ticks of a time range, of some symbols or all of them
+
+        Args:
+            start: First nanosecond since the epoch, included
+            end: End nanosecond since the epoch, excluded
+            symbols: Symbols to keep, all the symbols by default
+
+        Returns:
+            RECORD_DTYPE array in time order, its symbol codes indexing the returned symbol list
+        """
+        wanted = None if symbols is None else set(symbols)
+        all_symbols: List[str] = []
+        code_by_symbol: Dict[str, int] = {}
+        chunks = []
+        first_day, last_day = start // NS_PER_DAY, (end - 1) // NS_PER_DAY
+        for day in self.days():
+            epoch_day = (day - date(1970, 1, 1)).days
+            if not first_day <= epoch_day <= last_day:
+                continue
+            records = self.records(day)
+            timestamps = records['timestamp']
+            records = records[np.searchsorted(timestamps, start, 'left'):np.searchsorted(timestamps, end, 'left')]
+
+            # Day codes to the codes of the returned symbols, -1 for the symbols filtered out
+            day_symbols = self.symbols(day)
+            codes = np.full(len(day_symbols), -1, dtype=np.int32)
+            for day_code, symbol in enumerate(day_symbols):
+                if wanted is None or symbol in wanted:
+                    if symbol not in code_by_symbol:
+                        code_by_symbol[symbol] = len(all_symbols)
+                        all_symbols.append(symbol)
+                    codes[day_code] = code_by_symbol[symbol]
+            if len(records) == 0 or not len(day_symbols):
+                continue
+            mapped = codes[records['symbol']]
+            selected = np.asarray(records[mapped >= 0])  # boolean indexing copies out of the map
+            selected['symbol'] = mapped[mapped >= 0]
+            chunks.append(selected)
+
+        ticks = np.concatenate(chunks) if chunks else np.empty(0, dtype=RECORD_DTYPE)
+        return ticks, all_symbols
@@ -3,10 +3,26 @@ import uuid
 from dataclasses import dataclass, field
 from datetime import datetime
 from decimal import Decimal
-from typing import Optional
+from typing import Dict, FrozenSet, Optional
 
 from pylib.library.contract.contract import Instrument
 from pylib.library.config.enumerations import OrderType, OrderStatus
+from pylib.library.utils.fixed_point import to_fixed, from_fixed, datetime_to_us, us_to_datetime
+
+# Statuses an order may move to from each status, terminal statuses allow no further transition
+ORDER_STATUS_TRANSITIONS: Dict[OrderStatus, FrozenSet[OrderStatus]] = {
+    OrderStatus.PENDING: frozenset({OrderStatus.SUBMITTED, OrderStatus.CANCELLED, OrderStatus.REJECTED}),
+    OrderStatus.SUBMITTED: frozenset({
+        OrderStatus.PARTIALLY_FILLED, OrderStatus.FILLED, OrderStatus.CANCELLED, OrderStatus.REJECTED}),
+    OrderStatus.PARTIALLY_FILLED: frozenset({
+        OrderStatus.PARTIALLY_FILLED, OrderStatus.FILLED, OrderStatus.CANCELLED}),
+    OrderStatus.FILLED: frozenset(),
+    OrderStatus.CANCELLED: frozenset(),
+    OrderStatus.REJECTED: frozenset(),
+}
+
+TERMINAL_ORDER_STATUSES = frozenset(
+    status for status, next_statuses in ORDER_STATUS_TRANSITIONS.items() if not next_statuses)
 
 
 @dataclass
@@ -31,8 +47,74 @@ class Order:
     time_in_force: Optional[str] = None  # e.g., 'GTC', 'DAY'
     parent_order_id: Optional[str] = None
 
+    @property
+    def is_terminal(self) -> bool:
+        """Whether the order reached a status allowing no further transition"""
+        return self.status in TERMINAL_ORDER_STATUSES
+
     def update_status(self, new_status: OrderStatus):
-        """Update order status with timestamp"""
+        """
+        Update order status with timestamp
+
+        Raises:
+            ValueError: If the transition is not allowed by ORDER_STATUS_TRANSITIONS
+        """
+        if new_status not in ORDER_STATUS_TRANSITIONS[self.status]:
+            raise ValueError(f"Order {self.unique_id} cannot move from {self.status.name} to {new_status.name}")
         self.status = new_status
         if new_status in [OrderStatus.FILLED, OrderStatus.CANCELLED]:
             self.execution_time = datetime.now()
+
+
+class CompactOrder:
+    """
+    Slotted counterpart of Order, storing quantities and prices as fixed point int64 and times as epoch microseconds.
+    Converts to and from Order, quantities and prices rounded to PRICE_DECIMALS decimal places.
+    """
+    __slots__ = (
+        'instrument', 'order_type', 'side', 'quantity', 'limit_price', 'stop_price', 'unique_id', 'status',
+        'creation_time', 'execution_time', 'time_in_force', 'parent_order_id'
+    )
+
+    def __init__(self, instrument: Instrument, order_type: OrderType, side: str, quantity: int,
+                 limit_price: Optional[int], stop_price: Optional[int], unique_id: str, status: OrderStatus,
+                 creation_time: int, execution_time: Optional[int] = None, time_in_force: Optional[str] = None,
+                 parent_order_id: Optional[str] = None):
+        self.instrument = instrument
+        self.order_type = order_type
+        self.side = side
+        self.quantity = quantity
+        self.limit_price = limit_price
+        self.stop_price = stop_price
+        self.unique_id = unique_id
+        self.status = status
+        self.creation_time = creation_time
+        self.execution_time = execution_time
+        self.time_in_force = time_in_force
+        self.parent_order_id = parent_order_id
+
+    @classmethod
+    def from_order(cls, order: Order) -> 'CompactOrder':
+        """Build the compact representation of an Order"""
+        return cls(
+            order.instrument, order.order_type, order.side, to_fixed(order.quantity), to_fixed(order.limit_price),
+            to_fixed(order.stop_price), order.unique_id, order.status, datetime_to_us(order.creation_time),
+            datetime_to_us(order.execution_time), order.time_in_force, order.parent_order_id
+        )
+
+    def to_order(self) -> Order:
+        """Rebuild the Order dataclass"""
+        return Order(
+            instrument=self.instrument,
+            order_type=self.order_type,
+            side=self.side,
+            quantity=from_fixed(self.quantity),
+            limit_price=from_fixed(self.limit_price),
+            stop_price=from_fixed(self.stop_price),
+            unique_id=self.unique_id,
+            status=self.status,
+            creation_time=us_to_datetime(self.creation_time),
+            execution_time=us_to_datetime(self.execution_time),
+            time_in_force=self.time_in_force,
+            parent_order_id=self.parent_order_id
+        )
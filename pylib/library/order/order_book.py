@@ -0,0 +1,131 @@
+from collections import deque
+from typing import Callable, Deque, Dict, Iterator, List, Optional
+
+from pylib.library.instrument.instrument import Instrument
+from pylib.library.config.enumerations import OrderStatus
+from pylib.library.order.order import Order
+
+
+class OrderBook:
+    """
+    Store of a portfolio's orders, indexed by unique id, status, instrument and parent order.
+
+    Lookups by status, instrument or parent cost O(1) plus the number of orders returned. Status changes must go
+    through update_status so that the transition is validated and the indexes follow. Terminal orders (filled,
+    cancelled, rejected) stay in the book until more than max_terminal_orders are held, the oldest ones are then
+    archived: removed from the indexes, passed to archive_handler if provided and kept in a bounded archive.
+    """
+    def __init__(
+            self,
+            max_terminal_orders: int = 1_000,
+            archive_size: int = 10_000,
+            archive_handler: Optional[Callable[[Order], None]] = None
+    ):
+        """
+        Args:
+            max_terminal_orders: Number of terminal orders kept in the indexes before archival
+            archive_size: Number of archived orders kept in memory
+            archive_handler: Called with each archived order, e.g. to persist it
+        """
+        self.max_terminal_orders = max_terminal_orders
+        self.archive_handler = archive_handler
+        self.archive: Deque[Order] = deque(maxlen=archive_size)
+
+        self._orders: Dict[str, Order] = {}
+        self._by_status: Dict[OrderStatus, Dict[str, Order]] = {status: {} for status in OrderStatus}
+        self._by_instrument: Dict[Instrument, Dict[str, Order]] = {}
+        self._by_parent: Dict[str, Dict[str, Order]] = {}
+        self._terminal_order_ids: Deque[str] = deque()  # terminal orders in the indexes, oldest first
+
+    def __len__(self) -> int:
+        return len(self._orders)
+
+    def __iter__(self) -> Iterator[Order]:
+        return iter(self._orders.values())
+
+    def __contains__(self, unique_id: str) -> bool:
+        return unique_id in self._orders
+
+    def add(self, order: Order):
+        """Add a new order to the book"""
+        if order.unique_id in self._orders:
+            raise ValueError(f"Order {order.unique_id} is already in the book")
+
+        self._orders[order.unique_id] = order
+        self._by_status[order.status][order.unique_id] = order
+        self._by_instrument.setdefault(order.instrument, {})[order.unique_id] = order
+        if order.parent_order_id is not None:
+            self._by_parent.setdefault(order.parent_order_id, {})[order.unique_id] = order
+        if order.is_terminal:
+            self._on_terminal(order)
+
+    def get(self, unique_id: str) -> Optional[Order]:
+        """Retrieve an order by unique id, None if unknown or archived"""
+        return self._orders.get(unique_id)
+
+    def update_status(self, unique_id: str, new_status: OrderStatus) -> Order:
+        """
+        Move an order to a new status and re-index it
+
+        Raises:
+            KeyError: If the order is not in the book
+            ValueError: If the transition is not allowed, or the order status was changed outside the book
+        """
+        order = self._orders[unique_id]
+        old_status = order.status
+        if unique_id not in self._by_status[old_status]:
+            raise ValueError(f"Order {unique_id} is not indexed as {old_status.name}, its status was changed outside "
+                             f"the book")
+        order.update_status(new_status)
+
+        del self._by_status[old_status][unique_id]
+        self._by_status[new_status][unique_id] = order
+        if order.is_terminal:
+            self._on_terminal(order)
+        return order
+
+    def _on_terminal(self, order: Order):
+        """Track a terminal order and archive the oldest ones beyond max_terminal_orders"""
+        self._terminal_order_ids.append(order.unique_id)
+        while len(self._terminal_order_ids) > self.max_terminal_orders:
+            self._archive(self._terminal_order_ids.popleft())
+
+    def _archive(self, unique_id: str):
+        """Remove a terminal order from the indexes and archive it"""
+        order = self._orders.pop(unique_id)
+        del self._by_status[order.status][unique_id]
+
+        instrument_orders = self._by_instrument[order.instrument]
+        del instrument_orders[unique_id]
+        if not instrument_orders:
+            del self._by_instrument[order.instrument]
+
+        if order.parent_order_id is not None:
+            siblings = self._by_parent[order.parent_order_id]
+            del siblings[unique_id]
+            if not siblings:
+                del self._by_parent[order.parent_order_id]
+
+        self.archive.append(order)
+        if self.archive_handler is not None:
+            self.archive_handler(order)
+
+    def orders_with_status(self, *statuses: OrderStatus) -> List[Order]:
+        """Retrieve the orders in any of the given statuses"""
+        return [order for status in statuses for order in self._by_status[status].values()]
+
+    def open_orders(self) -> List[Order]:
+        """Retrieve the orders still working: pending, submitted or partially filled"""
+        return self.orders_with_status(OrderStatus.PENDING, OrderStatus.SUBMITTED, OrderStatus.PARTIALLY_FILLED)
+
+    def orders_for_instrument(self, instrument: Instrument) -> List[Order]:
+        """Retrieve the orders on an instrument"""
+        return list(self._by_instrument.get(instrument, {}).values())
+
+    def child_orders(self, parent_order_id: str) -> List[Order]:
+        """Retrieve the child orders of a parent order"""
+        return list(self._by_parent.get(parent_order_id, {}).values())
+
+    def count_by_status(self) -> Dict[OrderStatus, int]:
+        """Number of orders in the book per status"""
+        return {status: len(orders) for status, orders in self._by_status.items()}
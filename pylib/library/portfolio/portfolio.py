@@ -1,84 +1,540 @@
-
-
 import uuid
+from contextlib import contextmanager
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional, Union
+from datetime import datetime
+from threading import RLock
+from typing import Any, List, Dict, Optional, Sequence, Union
 from decimal import Decimal
 
+import numpy as np
+from pandas import DataFrame
+
 from pylib.library.contract.contract import Contract
 from pylib.library.position.position import Position
+from pylib.library.position.position_book import PositionBook, QUANTITY_TOLERANCE
+from pylib.library.position.fill_replay import replay_fills
+from pylib.library.position.tax_lot import TaxLotLedger, RealizedLot
+from pylib.library.config.enumerations import LotMethod
+from pylib.library.portfolio.position_index import PositionIndex
 from pylib.library.order.order import Order
+from pylib.library.order.order_book import OrderBook
 from pylib.library.market_data.security_market_data import SecurityMarketData
+from pylib.library.fx.fx_rates import DateLike, FxRates
+
+
+def _to_decimal(value: Union[Decimal, float, int]) -> Decimal:
+    """Decimal of a fill quantity or price, floats are taken at their shortest representation"""
+    return value if isinstance(value, Decimal) else Decimal(str(value))
 
 
 @dataclass
 class Portfolio(object):
     """
     Manages a collection of positions and orders
+
+    Quantities and average costs are mirrored in a columnar PositionBook so that valuations are computed as vector
+    operations over a row-aligned price vector (see PositionBook.price_vector). The held contracts are also indexed
+    by symbol, issuer, currency and classification levels (see PositionIndex) for constant time lookups.
+
+    Once attached to a MarketDataManager, every price tick received for a held symbol is applied as a delta to the
+    cached position and portfolio market values (see live_market_value), without re-summing the positions.
+
+    Tax lots are tracked when the portfolio is given a TaxLotLedger: purchases open lots and reductions relieve them
+    with the ledger's (or the requested) lot method, recording the realized lots.
+
+    Price ticks are applied on the market data callback thread while positions change on the caller's thread, so every
+    change to the positions and the position book, the price ticks and the live values are serialized by the portfolio
+    lock. apply_price never waits for it: a tick arriving while the lock is held, e.g. during a large apply_fills, is
+    kept as the pending price of its symbol (later ticks replacing it) and applied by the thread releasing the lock.
+    Callers reading the position book directly across several statements can hold the lock too.
     """
     name: str
     unique_id: str = field(default_factory=lambda: str(uuid.uuid4()))
     positions: Dict[Contract, Position] = field(default_factory=dict)
-    orders: List[Order] = field(default_factory=list)  # Orders history
+    orders: OrderBook = field(default_factory=OrderBook)  # Orders history
+    book: PositionBook = field(default_factory=PositionBook, repr=False)
+    index: PositionIndex = field(default_factory=PositionIndex, repr=False)
+    market_data_managers: List = field(default_factory=list, repr=False)  # managers streaming prices to the portfolio
+    lots: Optional[TaxLotLedger] = field(default=None, repr=False)  # None disables tax lot tracking
+    base_currency_code: str = 'USD'  # mirrors dim_portfolio, positions without a currency are in the base currency
+    lock: Any = field(default_factory=RLock, init=False, repr=False, compare=False)  # see the class docstring
+    _pending_prices: Dict[str, float] = field(default_factory=dict, init=False, repr=False, compare=False)
 
     # if we want to have cash balance not as position in cash instrument
     # cash_balance: Decimal = Decimal('0')
 
+    def __post_init__(self):
+        for contract, position in self.positions.items():
+            if contract not in self.book:
+                self.book.set_position(contract, float(position.quantity), float(position.average_cost))
+            self.index.add(contract)
+            if self.lots is not None and not self.lots.has_open_lots(contract):
+                self.lots.open_lot(contract, position.quantity, position.average_cost, position.purchase_date)
+
+    def _on_contract_added(self, contract: Contract):
+        """Index a newly held contract and subscribe it to the attached market data managers"""
+        self.index.add(contract)
+        for manager in self.market_data_managers:
+            manager.track(self, contract)
+
+    def _on_contract_removed(self, contract: Contract):
+        """Remove a contract no longer held from the indexes and the attached market data managers"""
+        self.index.remove(contract)
+        for manager in self.market_data_managers:
+            manager.untrack(self, contract)
+
+    def _apply_position_to_lots(self, position: Position):
+        """Open a lot for a position added, or relieve the lots at its average cost for a negative quantity"""
+        if position.quantity > 0:
+            self.lots.open_lot(position.contract, position.quantity, position.average_cost, position.purchase_date)
+        elif position.quantity < 0 and self.lots.has_open_lots(position.contract):
+            self.lots.relieve(position.contract, -position.quantity, position.average_cost)
+
     def add_position(self, position: Position):
-        """Add or update a position"""
-        existing_pos = self.positions.get(position.contract)
-        if existing_pos:
-            # Update average cost and quantity for existing position
-            total_quantity = existing_pos.quantity + position.quantity
-            weighted_avg_cost = (
-                (existing_pos.quantity * existing_pos.average_cost) +
-                (position.quantity * position.average_cost)
-            ) / total_quantity
-
-            existing_pos.quantity = total_quantity
-            existing_pos.average_cost = weighted_avg_cost
-        else:
-            self.positions[position.contract] = position
-
-    def remove_position(self, contract: Contract, quantity: Decimal):
-        """Reduce or remove a position"""
-        position = self.positions.get(contract)
-        if not position:
-            raise ValueError(f"No position found for {contract}")
-
-        if quantity >= position.quantity:
-            del self.positions[contract]
-        else:
-            position.quantity -= quantity
+        """Add or update a position, a negative quantity relieves the tax lots as a sale"""
+        with self._locked():
+            if self.lots is not None:
+                self._apply_position_to_lots(position)
 
-    @property
-    def total_market_value(self, market_data: Dict[Contract, SecurityMarketData]) -> Decimal:
+            existing_pos = self.positions.get(position.contract)
+            if existing_pos:
+                # Update average cost and quantity for existing position
+                total_quantity = existing_pos.quantity + position.quantity
+                weighted_avg_cost = (
+                    (existing_pos.quantity * existing_pos.average_cost) +
+                    (position.quantity * position.average_cost)
+                ) / total_quantity
+
+                existing_pos.quantity = total_quantity
+                existing_pos.average_cost = weighted_avg_cost
+                self.book.set_position(
+                    position.contract, float(existing_pos.quantity), float(existing_pos.average_cost))
+            else:
+                self.positions[position.contract] = position
+                self.book.set_position(position.contract, float(position.quantity), float(position.average_cost))
+                self._on_contract_added(position.contract)
+
+    def add_positions(self, positions: List[Position]):
+        """
+        Add or update several positions at once
+
+        Quantities and weighted average costs are netted per contract in Decimal, with the same results as calling
+        add_position for each position, then written to the position book in a single vectorized pass. A contract
+        whose quantity nets to zero is closed.
+        """
+        with self._locked():
+            if not positions:
+                return
+
+            if self.lots is not None:
+                for position in positions:
+                    self._apply_position_to_lots(position)
+
+            # Net quantity and book cost of each Position updated, starting from the quantity held, keyed by Position
+            # identity so that each contract is only hashed once
+            totals: Dict[int, List[Any]] = {}
+            new_positions: Dict[Contract, Position] = {}
+            for position in positions:
+                held = self.positions.get(position.contract)
+                is_new = held is None
+                if is_new:
+                    held = new_positions.setdefault(position.contract, position)
+                total = totals.get(id(held))
+                if total is None:
+                    if is_new:
+                        total = totals[id(held)] = [Decimal(0), Decimal(0), held, True]
+                    else:
+                        total = totals[id(held)] = [held.quantity, held.quantity * held.average_cost, held, False]
+                total[0] += position.quantity
+                total[1] += position.quantity * position.average_cost
+
+            open_positions = []
+            added_positions = []
+            for quantity, book_cost, position, is_new in totals.values():
+                if quantity == 0:
+                    if not is_new:
+                        del self.positions[position.contract]
+                        self.book.release(position.contract)
+                        self._on_contract_removed(position.contract)
+                    continue
+
+                position.quantity = quantity
+                position.average_cost = book_cost / quantity
+                open_positions.append(position)
+                if is_new:
+                    added_positions.append(position)
+
+            self.book.set_many(
+                self.book.rows_for([position.contract for position in open_positions]),
+                np.array([float(position.quantity) for position in open_positions]),
+                np.array([float(position.average_cost) for position in open_positions])
+            )
+            for position in added_positions:
+                self.positions[position.contract] = position
+                self._on_contract_added(position.contract)
+
+    def remove_position(
+            self,
+            contract: Contract,
+            quantity: Decimal,
+            price: Optional[Decimal] = None,
+            close_date: Optional[datetime] = None,
+            lot_method: Optional[LotMethod] = None,
+            lot_ids: Optional[Sequence[int]] = None
+    ) -> List[RealizedLot]:
+        """
+        Reduce or remove a position
+
+        Args:
+            contract: Contract sold
+            quantity: Quantity sold
+            price: Sale price, used for the realized profit/loss of the relieved lots
+            close_date: Sale date of the relieved lots, defaults to now
+            lot_method: Lot relief method, defaults to the ledger method
+            lot_ids: Lots to relieve, in order, for specific identification
+
+        Returns:
+            Realized lots, empty if tax lots are not tracked
+        """
+        with self._locked():
+            position = self.positions.get(contract)
+            if not position:
+                raise ValueError(f"No position found for {contract}")
+
+            realized = []
+            if self.lots is not None:
+                realized = self.lots.relieve(contract, quantity, price, close_date, lot_method, lot_ids)
+
+            if quantity >= position.quantity:
+                del self.positions[contract]
+                self.book.release(contract)
+                self._on_contract_removed(contract)
+            else:
+                position.quantity -= quantity
+                self.book.set_position(contract, float(position.quantity), float(position.average_cost))
+            return realized
+
+    def apply_fills(
+            self,
+            contracts: Union[Sequence[Contract], DataFrame],
+            quantities: Optional[Sequence[Union[Decimal, float]]] = None,
+            prices: Optional[Sequence[Union[Decimal, float]]] = None,
+            trade_dates: Optional[Sequence[datetime]] = None
+    ):
+        """
+        Apply a batch of executions in one vectorized pass
+
+        Fills are applied in their order within each contract, with the same results as calling add_position for each
+        buy and remove_position for each sell: quantities, weighted average costs and closed-out positions are
+        computed by replay_fills and written to the position book once per contract. The Decimal Position objects
+        are then replayed from the Decimal fills of the open contracts since their last close-out, so that they match
+        add_position exactly; a position opened by the batch is dated by its first fill. When tax lots are tracked,
+        the lots are still opened and relieved one fill at a time.
+
+        Args:
+            contracts: Contract of each fill, or a DataFrame with 'contract', 'quantity', 'price' and optionally
+                'trade_date' columns
+            quantities: Signed quantity of each fill, positive for buys and negative for sells
+            prices: Price of each fill
+            trade_dates: Date of each fill, used to date new positions and to open and close tax lots, defaults to
+                now
+
+        Raises:
+            ValueError: If a fill sells a contract with no position, or with no open lots when tax lots are tracked, in
+                which case the portfolio is left unchanged
+        """
+        with self._locked():
+            if isinstance(contracts, DataFrame):
+                fills = contracts
+                contracts = fills['contract'].tolist()
+                quantities = fills['quantity'].tolist()
+                prices = fills['price'].tolist()
+                if 'trade_date' in fills:
+                    trade_dates = fills['trade_date'].tolist()
+
+            if len(contracts) == 0:
+                return
+
+            group_of: Dict[Contract, int] = {}
+            group_ids = np.array(
+                [group_of.setdefault(contract, len(group_of)) for contract in contracts], dtype=np.int64)
+            groups = list(group_of)
+
+            opening_quantities = np.zeros(len(groups), dtype=np.float64)
+            opening_book_costs = np.zeros(len(groups), dtype=np.float64)
+            for i, contract in enumerate(groups):
+                row = self.book.row_of(contract)
+                if row is not None:
+                    opening_quantities[i] = self.book.quantities[row]
+                    opening_book_costs[i] = self.book.quantities[row] * self.book.average_costs[row]
+
+            running_quantities, running_book_costs = replay_fills(
+                group_ids,
+                np.asarray(quantities, dtype=np.float64),
+                np.asarray(prices, dtype=np.float64),
+                opening_quantities,
+                opening_book_costs
+            )
+
+            if self.lots is not None:
+                self.lots.check_sales(contracts, quantities)
+                self._apply_fills_to_lots(contracts, quantities, prices, trade_dates)
+
+            # Final state of each contract, taken at its last fill
+            last_fill = np.zeros(len(groups), dtype=np.int64)
+            last_fill[group_ids] = np.arange(len(group_ids))
+            final_quantities = running_quantities[last_fill]
+            final_book_costs = running_book_costs[last_fill]
+            final_average_costs = np.divide(
+                final_book_costs, final_quantities, out=np.zeros_like(final_book_costs), where=final_quantities > 0)
+
+            # Float residuals of a full close-out, e.g. 0.1 + 0.2 - 0.3, close the position
+            traded_quantities = np.abs(opening_quantities)
+            np.add.at(traded_quantities, group_ids, np.abs(np.asarray(quantities, dtype=np.float64)))
+            closing_quantities = QUANTITY_TOLERANCE * traded_quantities
+            is_open = final_quantities > closing_quantities
+            for contract, keep in zip(groups, is_open.tolist()):
+                if not keep and contract in self.positions:
+                    del self.positions[contract]
+                    self.book.release(contract)
+                    self._on_contract_removed(contract)
+
+            open_contracts = [contract for contract, keep in zip(groups, is_open.tolist()) if keep]
+            self.book.set_many(
+                self.book.rows_for(open_contracts), final_quantities[is_open], final_average_costs[is_open])
+
+            # The Position objects are replayed in Decimal from the last close-out of each open contract, with the
+            # add_position and remove_position arithmetic, so that they match the scalar path exactly
+            closes = np.flatnonzero(running_quantities <= closing_quantities[group_ids])
+            last_close = np.full(len(groups), -1, dtype=np.int64)
+            np.maximum.at(last_close, group_ids[closes], closes)
+            replayed = np.flatnonzero(
+                is_open[group_ids] & (np.arange(len(group_ids)) > last_close[group_ids])).tolist()
+
+            states: Dict[int, Position] = {}
+            for fill in replayed:
+                group = int(group_ids[fill])
+                position = states.get(group)
+                if position is None:
+                    contract = groups[group]
+                    position = self.positions.get(contract) if last_close[group] < 0 else None
+                    if position is None:
+                        trade_date = trade_dates[fill] if trade_dates is not None else datetime.now()
+                        position = Position(contract, Decimal(0), Decimal(0), trade_date)
+                    states[group] = position
+                quantity = _to_decimal(quantities[fill])
+                if quantity > 0:
+                    total_quantity = position.quantity + quantity
+                    position.average_cost = (
+                        position.quantity * position.average_cost + quantity * _to_decimal(prices[fill])
+                    ) / total_quantity
+                    position.quantity = total_quantity
+                else:
+                    position.quantity += quantity
+
+            for position in states.values():
+                held = self.positions.get(position.contract)
+                if held is not position:
+                    self.positions[position.contract] = position
+                    if held is None:
+                        self._on_contract_added(position.contract)
+
+    def _apply_fills_to_lots(self, contracts, quantities, prices, trade_dates):
+        """Open a lot for each buy and relieve the lots for each sell, in fill order"""
+        if trade_dates is None:
+            trade_dates = [datetime.now()] * len(contracts)
+        for contract, quantity, price, trade_date in zip(contracts, quantities, prices, trade_dates):
+            if quantity > 0:
+                self.lots.open_lot(contract, quantity, price, trade_date)
+            elif quantity < 0:
+                self.lots.relieve(contract, -quantity, price, trade_date)
+
+    def price_vector(
+            self,
+            market_data: Dict[Contract, Union[SecurityMarketData, Decimal, float]]
+    ) -> np.ndarray:
+        """
+        Build a price vector aligned with the rows of the position book
+
+        Args:
+            market_data: Current market data or last price of each contract held
+        """
+        return self.book.price_vector({
+            contract: data.last_price if isinstance(data, SecurityMarketData) else data
+            for contract, data in market_data.items()
+        })
+
+    def total_market_value(
+            self,
+            market_data: Union[Dict[Contract, SecurityMarketData], np.ndarray]
+    ) -> float:
         """
         Calculate total portfolio market value
 
+        The value is computed over the float position book and returned as a float, not a Decimal.
+
+        Args:
+            market_data (Dict[Contract, MarketData]): Current market prices, or a price vector aligned with the
+            position book
+        """
+        if not isinstance(market_data, np.ndarray):
+            market_data = self.price_vector(market_data)
+        return self.book.total_market_value(market_data)
+
+    def unrealized_pl(
+            self,
+            market_data: Union[Dict[Contract, SecurityMarketData], np.ndarray]
+    ) -> float:
+        """
+        Calculate total portfolio unrealized profit/loss
+
+        The profit/loss is computed over the float position book and returned as a float, not a Decimal.
+
         Args:
-            market_data (Dict[Contract, MarketData]): Current market prices
+            market_data (Dict[Contract, MarketData]): Current market prices, or a price vector aligned with the
+            position book
         """
-        return sum(
-            pos.market_value(market_data[contract].last_price)
-            for contract, pos in self.positions.items()
-        ) + self.cash_balance
+        if not isinstance(market_data, np.ndarray):
+            market_data = self.price_vector(market_data)
+        return self.book.total_unrealized_pl(market_data)
+
+    def apply_price(self, symbol: str, price: float):
+        """
+        Apply a price tick to the positions held on a symbol
+
+        Only the cached values of the matching positions and the portfolio totals are updated, by the delta between
+        the new and the previous price. Never blocks: while another thread holds the lock, the tick is left pending
+        for it (see the class docstring).
+
+        Args:
+            symbol: Instrument symbol
+            price: New price
+        """
+        self._pending_prices[symbol] = price
+        self._flush_pending_prices()
+
+    @contextmanager
+    def _locked(self):
+        """Hold the portfolio lock, applying the pending price ticks once acquired and once released"""
+        try:
+            with self.lock:
+                self._apply_pending_prices()
+                yield
+        finally:
+            self._flush_pending_prices()
+
+    def _flush_pending_prices(self):
+        """Apply the pending price ticks unless another thread holds the lock, that thread then applies them"""
+        while self._pending_prices and self.lock.acquire(blocking=False):
+            try:
+                self._apply_pending_prices()
+            finally:
+                self.lock.release()
+
+    def _apply_pending_prices(self):
+        """Apply the pending price ticks, the lock being held"""
+        while self._pending_prices:
+            symbol, price = self._pending_prices.popitem()
+            for contract in self.index.contracts_for('symbol', symbol):
+                self.book.apply_price(self.book.row_of(contract), price)
+
+    def base_currency_factors(self, fx_rates: FxRates, rate_date: Optional[DateLike] = None) -> np.ndarray:
+        """
+        Factor converting each row of the position book from its contract currency to the base currency
+
+        Args:
+            fx_rates: FX rates
+            rate_date: Date of the rates, the last date by default
+        """
+        currencies = [contract.currency_code if contract is not None else None for contract in self.book.contracts]
+        return fx_rates.conversion_factors(currencies, self.base_currency_code, rate_date)
+
+    def base_market_values(
+            self,
+            market_data: Union[Dict[Contract, SecurityMarketData], np.ndarray],
+            fx_rates: FxRates,
+            rate_date: Optional[DateLike] = None
+    ) -> np.ndarray:
+        """
+        Market value of each row of the position book in the base currency
+
+        Args:
+            market_data: Current market prices, or a price vector aligned with the position book, in the contract
+                currencies
+            fx_rates: FX rates
+            rate_date: Date of the rates, the last date by default
+        """
+        if not isinstance(market_data, np.ndarray):
+            market_data = self.price_vector(market_data)
+        return self.book.market_values(market_data) * self.base_currency_factors(fx_rates, rate_date)
+
+    def total_base_market_value(
+            self,
+            market_data: Union[Dict[Contract, SecurityMarketData], np.ndarray],
+            fx_rates: FxRates,
+            rate_date: Optional[DateLike] = None
+    ) -> float:
+        """Total market value in the base currency, see base_market_values"""
+        return float(self.base_market_values(market_data, fx_rates, rate_date).sum())
+
+    def live_base_market_value(self, fx_rates: FxRates, rate_date: Optional[DateLike] = None) -> float:
+        """Market value at the last prices received in the base currency, positions without a price are left out"""
+        with self._locked():
+            return float(np.dot(self.book.live_market_values, self.base_currency_factors(fx_rates, rate_date)))
+
+    @property
+    def live_market_value(self) -> float:
+        """Market value at the last prices received, positions without a price are left out"""
+        with self._locked():
+            return self.book.live_market_value
+
+    @property
+    def live_unrealized_pl(self) -> float:
+        """Unrealized profit/loss at the last prices received, positions without a price are left out"""
+        with self._locked():
+            return self.book.live_unrealized_pl
+
+    def position_market_value(self, contract: Contract) -> Optional[float]:
+        """Market value of a position at the last price received, None if the position or price is missing"""
+        with self._locked():
+            row = self.book.row_of(contract)
+            if row is None or np.isnan(self.book.last_prices[row]):
+                return None
+            return float(self.book.live_market_values[row])
 
     def add_order(self, order: Order):
         """Add a new order"""
-        self.orders.append(order)
+        self.orders.add(order)
 
     def get_position_by_symbol(self, symbol: str) -> Optional[Position]:
         """Retrieve a position by instrument symbol"""
-        return next(
-            (pos for pos in self.positions.values()
-             if pos.contract.symbol == symbol),
-            None
-        )
-
-    def __init__(self, portfolio_id):
-        self.portfolio = portfolio_id
-        self.instruments = list()
-
-    def market_value(self):
-        return sum([inst.market_value() for inst in self.instruments])
+        contract = self.index.first_contract_for('symbol', symbol)
+        return self.positions.get(contract) if contract is not None else None
+
+    def get_positions_by(self, attribute: str, value: Any) -> List[Position]:
+        """
+        Retrieve the positions whose contract has a given attribute value
+
+        Args:
+            attribute: Indexed contract attribute (symbol, issuer_sk, currency_code, classification_level_1/2/3)
+            value: Attribute value to look up
+
+        Returns:
+            List of matching positions
+        """
+        return [self.positions[contract] for contract in self.index.contracts_for(attribute, value)]
+
+    def group_positions_by(self, attribute: str) -> Dict[Any, List[Position]]:
+        """
+        Group positions by the value of an indexed contract attribute
+
+        Args:
+            attribute: Indexed contract attribute (symbol, issuer_sk, currency_code, classification_level_1/2/3)
+
+        Returns:
+            Dictionary of attribute value to positions
+        """
+        return {
+            value: [self.positions[contract] for contract in contracts]
+            for value, contracts in self.index.group(attribute).items()
+        }
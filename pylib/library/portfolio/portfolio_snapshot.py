@@ -0,0 +1,372 @@
+import dataclasses
+import importlib
+import json
+import os
+import shutil
+import tempfile
+from collections.abc import MutableMapping
+from datetime import datetime
+from decimal import Decimal
+from typing import Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+from pylib.library.contract.contract import Contract
+from pylib.library.instrument.instrument import Instrument
+from pylib.library.position.position import Position
+from pylib.library.position.position_book import PositionBook
+from pylib.library.position.tax_lot import TaxLotLedger
+from pylib.library.order.order import Order
+from pylib.library.portfolio.portfolio import Portfolio
+from pylib.library.config.enumerations import LotMethod, OrderStatus, OrderType
+
+SNAPSHOT_FORMAT = "portfolio_snapshot"
+SNAPSHOT_VERSION = 2  # 2: exact decimals stored as strings, contract types
+MANIFEST_FILE = "manifest.json"
+
+# Optional string attributes of the contracts, None is stored as an empty string
+CONTRACT_STRING_COLUMNS = (
+    'instrument_id', 'instrument_desc', 'symbol', 'currency_code',
+    'classification_level_1', 'classification_level_2', 'classification_level_3'
+)
+
+# Optional Decimal attributes of the contracts, stored as strings
+CONTRACT_DECIMAL_COLUMNS = ('multiplier', 'strike_price')
+
+# Every contract attribute stored, the dataclass fields of a snapshotted contract type must be among them
+CONTRACT_COLUMNS = CONTRACT_STRING_COLUMNS + CONTRACT_DECIMAL_COLUMNS + ('issuer_sk', 'expiration_date')
+
+
+def _strings(values: List[Optional[str]]) -> np.ndarray:
+    """Fixed-width unicode column, None stored as an empty string"""
+    return np.array(['' if value is None else value for value in values], dtype=np.str_)
+
+
+def _decimals(values: List[Optional[Decimal]]) -> np.ndarray:
+    """Exact Decimal column stored as strings, None stored as an empty string"""
+    return _strings([None if value is None else str(value) for value in values])
+
+
+def _optional_string(value: str) -> Optional[str]:
+    return value if value else None
+
+
+def _optional_decimal(value: str) -> Optional[Decimal]:
+    return Decimal(value) if value else None
+
+
+def _type_name(cls: type) -> str:
+    return f'{cls.__module__}:{cls.__qualname__}'
+
+
+def _resolve_type(name: str) -> type:
+    """
+    Instrument class from its stored name
+
+    Raises:
+        ValueError: If the name does not resolve to an Instrument subclass
+    """
+    module_name, _, qualname = name.partition(':')
+    cls = importlib.import_module(module_name)
+    for attribute in qualname.split('.'):
+        cls = getattr(cls, attribute, None)
+    if not (isinstance(cls, type) and issubclass(cls, Instrument)):
+        raise ValueError(f"Snapshot contract type {name} is not an Instrument")
+    return cls
+
+
+def _contract_columns(contracts: List[Instrument]) -> Dict[str, np.ndarray]:
+    """
+    Columns of the contracts table
+
+    Raises:
+        ValueError: If a contract type has attributes the snapshot does not store
+    """
+    types = {type(contract) for contract in contracts}
+    for cls in types:
+        missing = [field.name for field in dataclasses.fields(cls) if field.init and field.name not in CONTRACT_COLUMNS]
+        if missing:
+            raise ValueError(f"Snapshots do not store the attributes {missing} of {_type_name(cls)}")
+
+    type_codes = {cls: code for code, cls in enumerate(types)}
+    columns = {
+        f'contracts.{name}': _strings([getattr(contract, name, None) for contract in contracts])
+        for name in CONTRACT_STRING_COLUMNS
+    }
+    columns.update({
+        f'contracts.{name}': _decimals([getattr(contract, name, None) for contract in contracts])
+        for name in CONTRACT_DECIMAL_COLUMNS
+    })
+    columns['contracts.issuer_sk'] = np.array(
+        [-1 if getattr(contract, 'issuer_sk', None) is None else contract.issuer_sk for contract in contracts],
+        dtype=np.int64)
+    columns['contracts.expiration_date'] = np.array(
+        [getattr(contract, 'expiration_date', None) or 'NaT' for contract in contracts], dtype='datetime64[D]')
+    columns['contracts.type'] = np.array([type_codes[type(contract)] for contract in contracts], dtype=np.int16)
+    columns['contract_types.name'] = _strings([_type_name(cls) for cls in type_codes])
+    return columns
+
+
+def _restore_contracts(columns: Dict[str, np.ndarray]) -> List[Instrument]:
+    """Rebuild the contracts table with the type and the attributes of each contract"""
+    values = {'instrument_id': columns['contracts.instrument_id'].tolist()}
+    for name in CONTRACT_STRING_COLUMNS[1:]:
+        values[name] = [value or None for value in columns[f'contracts.{name}'].tolist()]
+    for name in CONTRACT_DECIMAL_COLUMNS:
+        values[name] = [Decimal(value) if value else None for value in columns[f'contracts.{name}'].tolist()]
+    values['issuer_sk'] = [None if value < 0 else value for value in columns['contracts.issuer_sk'].tolist()]
+    values['expiration_date'] = columns['contracts.expiration_date'].tolist()
+
+    types = [_resolve_type(name) for name in columns['contract_types.name'].tolist()]
+    fields = [[field.name for field in dataclasses.fields(cls) if field.init] for cls in types]
+    if len(types) == 1:
+        # Single contract type, built from positional rows
+        cls = types[0]
+        return [cls(*row) for row in zip(*(values[name] for name in fields[0]))]
+    return [
+        types[code](**{name: values[name][row] for name in fields[code]})
+        for row, code in enumerate(columns['contracts.type'].tolist())
+    ]
+
+
+class LazyPositions(MutableMapping):
+    """
+    Positions of a restored portfolio by contract, each Position being built from the snapshot columns on first access
+    """
+    def __init__(
+            self,
+            contracts: Sequence[Contract],
+            quantities: np.ndarray,
+            average_costs: np.ndarray,
+            purchase_dates: np.ndarray
+    ):
+        """
+        Args:
+            contracts: Contract of each position
+            quantities: Exact quantity of each position, as strings
+            average_costs: Exact average cost of each position, as strings
+            purchase_dates: Purchase date of each position
+        """
+        self._entries: Dict[Contract, Union[int, Position]] = dict(zip(contracts, range(len(contracts))))
+        self._quantities = quantities
+        self._average_costs = average_costs
+        self._purchase_dates = purchase_dates
+
+    def __getitem__(self, contract: Contract) -> Position:
+        entry = self._entries[contract]
+        if isinstance(entry, int):
+            entry = self._entries[contract] = Position(
+                contract, Decimal(self._quantities[entry]), Decimal(self._average_costs[entry]),
+                self._purchase_dates[entry].item())
+        return entry
+
+    def __setitem__(self, contract: Contract, position: Position):
+        self._entries[contract] = position
+
+    def __delitem__(self, contract: Contract):
+        del self._entries[contract]
+
+    def __contains__(self, contract) -> bool:
+        return contract in self._entries
+
+    def __iter__(self) -> Iterator[Contract]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __repr__(self) -> str:
+        return f"LazyPositions({len(self)} positions)"
+
+
+def save_portfolio_snapshot(portfolio: Portfolio, path: str):
+    """
+    Write a portfolio snapshot: positions, live orders and open tax lots
+
+    The snapshot is a directory holding one uncompressed .npy file per column and a versioned JSON manifest, so that
+    every column can be memory-mapped on restore. Contracts referenced by positions, orders and lots are stored once in
+    the contracts table and referenced by row.
+
+    The snapshot is written to a staging directory next to path, which then replaces path as a whole: the files of a
+    previous snapshot are never rewritten in place, so that portfolios restored from it and still reading its memory
+    maps are unaffected, and a failed save leaves the previous snapshot intact.
+
+    Args:
+        portfolio: Portfolio to snapshot
+        path: Snapshot directory, created if needed
+
+    Raises:
+        ValueError: If path is a non-empty directory that is not a snapshot
+    """
+    if os.path.isdir(path) and os.listdir(path) and not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+        raise ValueError(f"{path} is not a portfolio snapshot, refusing to replace it")
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.snapshot-', dir=parent)
+    try:
+        _write_snapshot(portfolio, staging)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    _replace_directory(staging, path)
+
+
+def _replace_directory(source: str, path: str):
+    """Move a directory to path, replacing any existing directory"""
+    if not os.path.exists(path):
+        os.replace(source, path)
+        return
+    # A directory can only replace an empty one: move the old snapshot aside first, its files stay readable through
+    # the open memory maps until they are released
+    previous = tempfile.mkdtemp(prefix='.snapshot-', dir=os.path.dirname(os.path.abspath(path)))
+    os.replace(path, previous)
+    os.replace(source, path)
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+def _write_snapshot(portfolio: Portfolio, path: str):
+    """Write the columns and manifest of a portfolio snapshot into an empty directory"""
+
+    contract_rows: Dict[Instrument, int] = {}
+    contracts: List[Instrument] = []
+
+    def contract_row(contract: Instrument) -> int:
+        row = contract_rows.get(contract)
+        if row is None:
+            row = contract_rows[contract] = len(contracts)
+            contracts.append(contract)
+        return row
+
+    columns: Dict[str, np.ndarray] = {}
+
+    positions = list(portfolio.positions.values())
+    rows = [portfolio.book.row_of(position.contract) for position in positions]
+    columns['positions.contract'] = np.array([contract_row(position.contract) for position in positions],
+                                             dtype=np.int64)
+    columns['positions.quantity'] = portfolio.book.quantities[rows]
+    columns['positions.average_cost'] = portfolio.book.average_costs[rows]
+    columns['positions.quantity_decimal'] = _decimals([position.quantity for position in positions])
+    columns['positions.average_cost_decimal'] = _decimals([position.average_cost for position in positions])
+    columns['positions.purchase_date'] = np.array(
+        [position.purchase_date for position in positions], dtype='datetime64[us]')
+
+    orders = list(portfolio.orders)
+    columns['orders.contract'] = np.array([contract_row(order.instrument) for order in orders], dtype=np.int64)
+    columns['orders.order_type'] = np.array([order.order_type.value for order in orders], dtype=np.int16)
+    columns['orders.status'] = np.array([order.status.value for order in orders], dtype=np.int16)
+    columns['orders.side'] = _strings([order.side for order in orders])
+    columns['orders.quantity'] = _decimals([order.quantity for order in orders])
+    columns['orders.limit_price'] = _decimals([order.limit_price for order in orders])
+    columns['orders.stop_price'] = _decimals([order.stop_price for order in orders])
+    columns['orders.unique_id'] = _strings([order.unique_id for order in orders])
+    columns['orders.creation_time'] = np.array([order.creation_time for order in orders], dtype='datetime64[us]')
+    columns['orders.execution_time'] = np.array(
+        [order.execution_time or 'NaT' for order in orders], dtype='datetime64[us]')
+    columns['orders.time_in_force'] = _strings([order.time_in_force for order in orders])
+    columns['orders.parent_order_id'] = _strings([order.parent_order_id for order in orders])
+
+    queues = portfolio.lots.all_queues() if portfolio.lots is not None else {}
+    lots = [queue.open_lots() for queue in queues.values()]
+    columns['lot_queues.contract'] = np.array([contract_row(contract) for contract in queues], dtype=np.int64)
+    columns['lot_queues.next_lot_id'] = np.array([queue.next_lot_id for queue in queues.values()], dtype=np.int64)
+    columns['lot_queues.size'] = np.array([len(queue_lots['lot_id']) for queue_lots in lots], dtype=np.int64)
+    for name, dtype in (('lot_id', np.int64), ('quantity', np.float64), ('cost', np.float64),
+                        ('open_date', 'datetime64[us]')):
+        columns[f'lots.{name}'] = np.concatenate(
+            [queue_lots[name] for queue_lots in lots]) if lots else np.empty(0, dtype=dtype)
+
+    columns.update(_contract_columns(contracts))
+
+    for name, column in columns.items():
+        np.save(os.path.join(path, f'{name}.npy'), column, allow_pickle=False)
+
+    manifest = {
+        'format': SNAPSHOT_FORMAT,
+        'version': SNAPSHOT_VERSION,
+        'created': datetime.now().isoformat(),
+        'name': portfolio.name,
+        'unique_id': portfolio.unique_id,
+        'base_currency_code': portfolio.base_currency_code,
+        'lot_method': portfolio.lots.method.name if portfolio.lots is not None else None,
+        'columns': sorted(columns),
+    }
+    with open(os.path.join(path, MANIFEST_FILE), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+
+
+def load_portfolio_snapshot(path: str) -> Portfolio:
+    """
+    Restore a portfolio from a snapshot written by save_portfolio_snapshot
+
+    Numeric columns are memory-mapped copy-on-write, only the quantity and average cost columns adopted by the position
+    book are copied as the book writes to them. Only the contracts and the live orders are rebuilt up front: the
+    Position objects (see LazyPositions) and the lot queues are built from their columns on first access, and the
+    contracts are indexed on the first index lookup.
+
+    Args:
+        path: Snapshot directory
+
+    Returns:
+        Restored portfolio
+
+    Raises:
+        ValueError: If the directory is not a snapshot or was written by another version
+    """
+    with open(os.path.join(path, MANIFEST_FILE)) as manifest_file:
+        manifest = json.load(manifest_file)
+    if manifest.get('format') != SNAPSHOT_FORMAT:
+        raise ValueError(f"{path} is not a portfolio snapshot")
+    if manifest.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Snapshot version {manifest.get('version')} is not the supported {SNAPSHOT_VERSION}")
+
+    columns = {
+        name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='c', allow_pickle=False).view(np.ndarray)
+        for name in manifest['columns']
+    }
+    contracts = _restore_contracts(columns)
+
+    position_contracts = [contracts[row] for row in columns['positions.contract'].tolist()]
+    lots = None
+    if manifest.get('lot_method') is not None:
+        lots = TaxLotLedger(LotMethod[manifest['lot_method']])
+        lots.restore_queues(
+            [contracts[row] for row in columns['lot_queues.contract'].tolist()], columns['lot_queues.size'],
+            columns['lot_queues.next_lot_id'], columns['lots.lot_id'], columns['lots.quantity'],
+            columns['lots.cost'], columns['lots.open_date'])
+
+    portfolio = Portfolio(
+        name=manifest['name'], unique_id=manifest['unique_id'],
+        book=PositionBook.from_arrays(
+            position_contracts, np.array(columns['positions.quantity']),
+            np.array(columns['positions.average_cost'])),
+        lots=lots, base_currency_code=manifest.get('base_currency_code', 'USD'))
+    portfolio.positions = LazyPositions(
+        position_contracts, columns['positions.quantity_decimal'], columns['positions.average_cost_decimal'],
+        columns['positions.purchase_date'])
+    portfolio.index.defer(position_contracts)
+
+    for values in zip(
+            columns['orders.contract'].tolist(), columns['orders.order_type'].tolist(),
+            columns['orders.side'].tolist(), columns['orders.quantity'].tolist(),
+            columns['orders.limit_price'].tolist(), columns['orders.stop_price'].tolist(),
+            columns['orders.unique_id'].tolist(), columns['orders.status'].tolist(),
+            columns['orders.creation_time'].tolist(), columns['orders.execution_time'].tolist(),
+            columns['orders.time_in_force'].tolist(), columns['orders.parent_order_id'].tolist()):
+        (contract_row, order_type, side, quantity, limit_price, stop_price, unique_id, status, creation_time,
+         execution_time, time_in_force, parent_order_id) = values
+        portfolio.add_order(Order(
+            instrument=contracts[contract_row],
+            order_type=OrderType(order_type),
+            side=side,
+            quantity=_optional_decimal(quantity),
+            limit_price=_optional_decimal(limit_price),
+            stop_price=_optional_decimal(stop_price),
+            unique_id=unique_id,
+            status=OrderStatus(status),
+            creation_time=creation_time,
+            execution_time=execution_time,
+            time_in_force=_optional_string(time_in_force),
+            parent_order_id=_optional_string(parent_order_id)
+        ))
+
+    return portfolio
@@ -0,0 +1,94 @@
+from typing import Any, Dict, List, Sequence, Tuple
+
+from pylib.library.contract.contract import Contract
+
+# Contract attributes indexed by default, they mirror the dim_instrument columns
+INDEXED_ATTRIBUTES = (
+    'symbol',
+    'issuer_sk',
+    'currency_code',
+    'classification_level_1',
+    'classification_level_2',
+    'classification_level_3',
+)
+
+
+class PositionIndex:
+    """
+    Secondary indexes of the contracts held in a portfolio, by contract attribute value.
+
+    Each index maps an attribute value to the contracts carrying it (kept in insertion order), so that lookups cost
+    O(1) and group-bys O(k) in the number of matching contracts. Contract attributes are assumed not to change while
+    the contract is held; re-index the contract (remove then add) if they do. Contracts added with defer are only
+    indexed on the next update or lookup, e.g. for a restored portfolio which may never be queried.
+    """
+    def __init__(self, attributes: Sequence[str] = INDEXED_ATTRIBUTES):
+        """
+        Args:
+            attributes: Contract attributes to index
+        """
+        self.attributes: Tuple[str, ...] = tuple(attributes)
+        self._indexes: Dict[str, Dict[Any, Dict[Contract, None]]] = {attribute: {} for attribute in self.attributes}
+        self._deferred: List[Contract] = []
+
+    def defer(self, contracts: Sequence[Contract]):
+        """Add contracts to be indexed on the next update or lookup"""
+        self._deferred.extend(contracts)
+
+    def _index_deferred(self):
+        deferred, self._deferred = self._deferred, []
+        for contract in deferred:
+            self.add(contract)
+
+    def add(self, contract: Contract):
+        """Index a contract under each of its attribute values"""
+        if self._deferred:
+            self._index_deferred()
+        for attribute, index in self._indexes.items():
+            index.setdefault(getattr(contract, attribute, None), {})[contract] = None
+
+    def remove(self, contract: Contract):
+        """Remove a contract from every index"""
+        if self._deferred:
+            self._index_deferred()
+        for attribute, index in self._indexes.items():
+            value = getattr(contract, attribute, None)
+            contracts = index.get(value)
+            if contracts is None:
+                continue
+            contracts.pop(contract, None)
+            if not contracts:
+                del index[value]
+
+    def _index(self, attribute: str) -> Dict[Any, Dict[Contract, None]]:
+        if self._deferred:
+            self._index_deferred()
+        index = self._indexes.get(attribute)
+        if index is None:
+            raise ValueError(f"Attribute {attribute} is not indexed, indexed attributes are {self.attributes}")
+        return index
+
+    def contracts_for(self, attribute: str, value: Any) -> List[Contract]:
+        """
+        Retrieve the contracts with a given attribute value
+
+        Args:
+            attribute: Indexed contract attribute, e.g. 'currency_code'
+            value: Attribute value to look up
+
+        Returns:
+            List of matching contracts, empty if none
+        """
+        return list(self._index(attribute).get(value, ()))
+
+    def first_contract_for(self, attribute: str, value: Any):
+        """Retrieve the first contract indexed with a given attribute value, or None"""
+        return next(iter(self._index(attribute).get(value, ())), None)
+
+    def values(self, attribute: str) -> List[Any]:
+        """Distinct values of an attribute among the indexed contracts"""
+        return list(self._index(attribute))
+
+    def group(self, attribute: str) -> Dict[Any, List[Contract]]:
+        """Group the indexed contracts by attribute value"""
+        return {value: list(contracts) for value, contracts in self._index(attribute).items()}
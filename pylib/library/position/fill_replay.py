@@ -0,0 +1,163 @@
+from typing import Tuple
+
+import numpy as np
+from pandas import Series
+
+# Natural log of the largest fall of the cumulative sell multiplier solved in one block, see replay_fills
+RENORMALIZATION_LOG = 50.0
+
+
+def _held_quantities(
+        group_ids: np.ndarray,
+        quantities: np.ndarray,
+        opening_quantities: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Quantity walk shared by replay_fills and invalid_sells, over the fills sorted by group
+
+    Returns:
+        Sort order of the fills, their group, their signed quantity, the quantity held after and before each of them
+    """
+    n = len(group_ids)
+    order = np.argsort(group_ids, kind='stable')
+    groups = group_ids[order]
+    dq = quantities[order]
+
+    is_group_start = np.empty(n, dtype=bool)
+    is_group_start[0] = True
+    is_group_start[1:] = groups[1:] != groups[:-1]
+
+    # Quantities: q_k = S_k - min(0, min_j<=k S_j), with S the running sum started at the opening quantity
+    running_sum = Series(dq).groupby(groups).cumsum().to_numpy() + opening_quantities[groups]
+    running_min = np.minimum(Series(running_sum).groupby(groups).cummin().to_numpy(), 0.0)
+    held = running_sum - running_min
+
+    held_before = np.empty(n, dtype=np.float64)
+    held_before[1:] = held[:-1]
+    held_before[is_group_start] = opening_quantities[groups[is_group_start]]
+    return order, groups, dq, held, held_before
+
+
+def invalid_sells(group_ids: np.ndarray, quantities: np.ndarray, opening_quantities: np.ndarray) -> np.ndarray:
+    """
+    Sells hitting a group with no quantity held, which replay_fills rejects
+
+    Args:
+        group_ids: Dense group id (0 to n_groups - 1) of each fill
+        quantities: Signed fill quantities, positive for buys and negative for sells
+        opening_quantities: Quantity held in each group before the fills
+
+    Returns:
+        Boolean mask aligned with the input fills
+    """
+    group_ids = np.asarray(group_ids, dtype=np.int64)
+    invalid = np.zeros(len(group_ids), dtype=bool)
+    if len(group_ids) == 0:
+        return invalid
+    order, _, dq, _, held_before = _held_quantities(
+        group_ids, np.asarray(quantities, dtype=np.float64), np.asarray(opening_quantities, dtype=np.float64))
+    invalid[order] = (dq < 0) & (held_before <= 0)
+    return invalid
+
+
+def replay_fills(
+        group_ids: np.ndarray,
+        quantities: np.ndarray,
+        prices: np.ndarray,
+        opening_quantities: np.ndarray,
+        opening_book_costs: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Replay signed fills into running quantities and book costs, vectorized across all groups (e.g. contracts)
+
+    The result matches applying the fills one at a time, in their order within each group, with the Portfolio
+    semantics: a buy updates the weighted average cost, a sell reduces the quantity at an unchanged average cost and a
+    sell of the whole quantity or more closes the position. A buy after a close-out opens a new position at its price.
+
+    Quantities follow a reflected walk, q_k = max(0, q_k-1 + dq_k), computed in closed form from the running sum and its
+    running minimum. Book costs follow B_k = a_k B_k-1 + d_k, with a_k = q_k / q_k-1 on sells (0 on close-outs) and
+    d_k = dq_k * price_k on buys, solved with segmented cumulative products and sums between close-outs, renormalized
+    whenever the cumulative product falls by more than e^RENORMALIZATION_LOG.
+
+    Args:
+        group_ids: Dense group id (0 to n_groups - 1) of each fill
+        quantities: Signed fill quantities, positive for buys and negative for sells
+        prices: Fill prices
+        opening_quantities: Quantity held in each group before the fills
+        opening_book_costs: Book cost (quantity * average cost) of each group before the fills
+
+    Returns:
+        Running quantity and book cost after each fill, aligned with the input fills
+
+    Raises:
+        ValueError: If a sell hits a group with no quantity held, see invalid_sells
+    """
+    group_ids = np.asarray(group_ids, dtype=np.int64)
+    quantities = np.asarray(quantities, dtype=np.float64)
+    prices = np.asarray(prices, dtype=np.float64)
+    opening_quantities = np.asarray(opening_quantities, dtype=np.float64)
+    opening_book_costs = np.asarray(opening_book_costs, dtype=np.float64)
+
+    n = len(group_ids)
+    if n == 0:
+        return np.empty(0), np.empty(0)
+
+    # Fills sorted by group, keeping their order within each group
+    order, groups, dq, held, held_before = _held_quantities(group_ids, quantities, opening_quantities)
+    px = prices[order]
+
+    is_group_start = np.empty(n, dtype=bool)
+    is_group_start[0] = True
+    is_group_start[1:] = groups[1:] != groups[:-1]
+
+    is_sell = dq < 0
+    invalid = is_sell & (held_before <= 0)
+    if invalid.any():
+        fill = int(order[np.argmax(invalid)])
+        raise ValueError(f"Fill {fill} sells a group with no position held (group {int(group_ids[fill])})")
+
+    # Book costs: the multiplier a_k is 1 on buys, the fraction of the quantity kept on sells
+    multiplier = np.ones(n, dtype=np.float64)
+    multiplier[is_sell] = held[is_sell] / held_before[is_sell]
+    addition = np.where(is_sell, 0.0, dq * px)
+
+    # A close-out (a_k = 0) wipes the book cost, the following fills start a new segment from zero
+    closed = multiplier == 0
+    is_segment_start = is_group_start.copy()
+    is_segment_start[1:] |= closed[:-1]
+    segments = np.cumsum(is_segment_start)
+
+    opening = np.where(is_group_start, opening_book_costs[groups], 0.0)
+    segment_opening = opening[is_segment_start][segments - 1]
+
+    safe_multiplier = np.where(closed, 1.0, multiplier)
+
+    # Log of the cumulative multiplier within each segment. Repeated partial sells drive the multiplier towards 0, so
+    # the segments are cut into blocks over which it falls by less than e^RENORMALIZATION_LOG, each block being
+    # solved relative to the multiplier at its start: no intermediate over or underflows.
+    log_multiplier = Series(np.log(safe_multiplier)).groupby(segments).cumsum().to_numpy()
+    bins = np.floor(-log_multiplier / RENORMALIZATION_LOG).astype(np.int64)
+    is_block_start = is_segment_start.copy()
+    is_block_start[1:] |= bins[1:] != bins[:-1]
+    blocks = np.cumsum(is_block_start) - 1
+    block_starts = np.flatnonzero(is_block_start)
+    block_log = log_multiplier[block_starts][blocks]
+
+    # Within a block: B_k = carry_k * B before the block + local_k
+    scale = np.exp(log_multiplier - block_log)
+    local = scale * Series(addition * np.exp(block_log - log_multiplier)).groupby(blocks).cumsum().to_numpy()
+    carry = scale * safe_multiplier[block_starts][blocks]
+    book_cost = carry * segment_opening + local
+
+    # Blocks continuing a segment start from the book cost at the end of the previous block, chained in order
+    block_ends = np.append(block_starts[1:], n) - 1
+    for block in np.flatnonzero(~is_segment_start[block_starts]).tolist():
+        rows = slice(block_starts[block], block_ends[block] + 1)
+        book_cost[rows] = carry[rows] * book_cost[block_ends[block - 1]] + local[rows]
+    book_cost[closed] = 0.0
+
+    running_quantities = np.empty(n, dtype=np.float64)
+    running_book_costs = np.empty(n, dtype=np.float64)
+    running_quantities[order] = held
+    running_book_costs[order] = book_cost
+    return running_quantities, running_book_costs
@@ -5,6 +5,7 @@ from decimal import Decimal
 from typing import Optional
 
 from pylib.library.contract.contract import Contract
+from pylib.library.utils.fixed_point import to_fixed, from_fixed, datetime_to_us, us_to_datetime
 
 
 @dataclass
@@ -15,7 +16,6 @@ class Position:
     average_cost: Decimal
     purchase_date: datetime = field(default_factory=datetime.now)
 
-    @property
     def market_value(self, current_price: Optional[Decimal] = None) -> Decimal:
         """
         Calculate current market value of the position
@@ -29,7 +29,40 @@ class Position:
             raise ValueError("Current price must be provided")
         return self.quantity * current_price
 
-    @property
     def unrealized_pl(self, current_price: Optional[Decimal] = None) -> Decimal:
         """Calculate unrealized profit/loss"""
         return self.market_value(current_price) - (self.quantity * self.average_cost)
+
+
+class CompactPosition:
+    """
+    Slotted counterpart of Position, storing the quantity and average cost as fixed point int64 and the purchase date
+    as epoch microseconds. Converts to and from Position, the quantity and average cost rounded to PRICE_DECIMALS
+    decimal places.
+    """
+    __slots__ = ('contract', 'quantity', 'average_cost', 'purchase_date')
+
+    def __init__(self, contract: Contract, quantity: int, average_cost: int, purchase_date: int):
+        self.contract = contract
+        self.quantity = quantity
+        self.average_cost = average_cost
+        self.purchase_date = purchase_date
+
+    @classmethod
+    def from_position(cls, position: Position) -> 'CompactPosition':
+        """Build the compact representation of a Position"""
+        return cls(
+            position.contract,
+            to_fixed(position.quantity),
+            to_fixed(position.average_cost),
+            datetime_to_us(position.purchase_date)
+        )
+
+    def to_position(self) -> Position:
+        """Rebuild the Position dataclass"""
+        return Position(
+            contract=self.contract,
+            quantity=from_fixed(self.quantity),
+            average_cost=from_fixed(self.average_cost),
+            purchase_date=us_to_datetime(self.purchase_date)
+        )
@@ -0,0 +1,354 @@
+import math
+from typing import Dict, List, Optional, Sequence, Union
+from decimal import Decimal
+
+import numpy as np
+
+from pylib.library.contract.contract import Contract
+
+# Float quantities within this fraction of the quantity traded of zero are closed, e.g. 0.1 + 0.2 - 0.3
+QUANTITY_TOLERANCE = 1e-9
+
+
+class PositionBook:
+    """
+    Columnar store of the quantities and average costs of a portfolio's positions.
+
+    Every contract is given an integer instrument key the first time it is seen. The key is mapped to a row of the
+    quantity / average cost arrays and keeps that row for as long as the position stays open; rows released by closed
+    positions are reused by later ones. Unused rows hold a key of -1 and a quantity of 0, so that whole-array
+    operations can be applied without masking.
+
+    The book also caches the last price received for each row together with the resulting market values. Price
+    updates (apply_price) and position changes apply a delta to the cached row and total values instead of re-summing
+    the book, rows without a price yet are left out of the live totals.
+
+    The book is a float mirror of the Decimal Position objects, which stay the source of truth: it is written from
+    them and its valuations (market values, unrealized profit/loss) are floats, not Decimals.
+    """
+    def __init__(self, capacity: int = 64):
+        """
+        Initialize an empty position book
+
+        Args:
+            capacity: Number of rows to preallocate, the arrays double in size when full
+        """
+        capacity = max(int(capacity), 1)
+        self._instrument_keys = np.full(capacity, -1, dtype=np.int64)
+        self._quantities = np.zeros(capacity, dtype=np.float64)
+        self._average_costs = np.zeros(capacity, dtype=np.float64)
+        self._contracts: List[Optional[Contract]] = [None] * capacity
+        self._last_prices = np.full(capacity, np.nan, dtype=np.float64)
+        self._market_values = np.zeros(capacity, dtype=np.float64)
+        self._live_market_value = 0.0
+        self._live_book_cost = 0.0  # book cost of the rows with a price
+
+        self._size = 0  # high-water mark of the rows in use
+        self._free_rows: List[int] = []
+        self._row_by_key: Dict[int, int] = {}
+        self._key_by_contract: Dict[Contract, int] = {}
+
+    @classmethod
+    def from_arrays(
+            cls,
+            contracts: List[Contract],
+            quantities: np.ndarray,
+            average_costs: np.ndarray
+    ) -> 'PositionBook':
+        """
+        Build a book holding one row per contract, adopting the quantity and average cost arrays without copying them
+
+        Args:
+            contracts: Distinct contracts, one per row
+            quantities: Quantity of each row, must be writable
+            average_costs: Average cost of each row, must be writable
+
+        Returns:
+            Position book whose arrays are the ones provided until it grows
+        """
+        size = len(contracts)
+        book = cls(capacity=size)
+        if size == 0:
+            return book
+
+        book._quantities = np.asarray(quantities, dtype=np.float64)
+        book._average_costs = np.asarray(average_costs, dtype=np.float64)
+        book._instrument_keys = np.arange(size, dtype=np.int64)
+        book._contracts = list(contracts)
+        book._size = size
+        book._key_by_contract = {contract: key for key, contract in enumerate(contracts)}
+        book._row_by_key = dict(zip(range(size), range(size)))
+        return book
+
+    def __len__(self) -> int:
+        return len(self._row_by_key)
+
+    def __contains__(self, contract: Contract) -> bool:
+        return self.row_of(contract) is not None
+
+    @property
+    def instrument_keys(self) -> np.ndarray:
+        """Instrument key of each row, -1 for unused rows"""
+        return self._instrument_keys[:self._size]
+
+    @property
+    def quantities(self) -> np.ndarray:
+        """Quantity held on each row"""
+        return self._quantities[:self._size]
+
+    @property
+    def average_costs(self) -> np.ndarray:
+        """Average cost of each row"""
+        return self._average_costs[:self._size]
+
+    @property
+    def contracts(self) -> List[Optional[Contract]]:
+        """Contract held on each row, None for unused rows"""
+        return self._contracts[:self._size]
+
+    @property
+    def last_prices(self) -> np.ndarray:
+        """Last price applied to each row, NaN if none was received yet"""
+        return self._last_prices[:self._size]
+
+    @property
+    def live_market_values(self) -> np.ndarray:
+        """Cached market value of each row at its last price, 0 for rows without a price"""
+        return self._market_values[:self._size]
+
+    @property
+    def live_market_value(self) -> float:
+        """Cached total market value of the rows with a price"""
+        return self._live_market_value
+
+    @property
+    def live_unrealized_pl(self) -> float:
+        """Cached total unrealized profit/loss of the rows with a price"""
+        return self._live_market_value - self._live_book_cost
+
+    def key_of(self, contract: Contract) -> int:
+        """
+        Return the instrument key of a contract, assigning a new one if the contract was never seen
+
+        Keys are never reused, so a key identifies the same contract for the lifetime of the book.
+        """
+        key = self._key_by_contract.get(contract)
+        if key is None:
+            key = len(self._key_by_contract)
+            self._key_by_contract[contract] = key
+        return key
+
+    def row_of(self, contract: Contract) -> Optional[int]:
+        """Return the row holding a contract, or None if there is no open position"""
+        key = self._key_by_contract.get(contract)
+        if key is None:
+            return None
+        return self._row_by_key.get(key)
+
+    def row_of_key(self, key: int) -> Optional[int]:
+        """Return the row holding an instrument key, or None if there is no open position"""
+        return self._row_by_key.get(key)
+
+    def _grow(self):
+        """Double the capacity of the arrays"""
+        capacity = len(self._quantities) * 2
+        self._instrument_keys = np.resize(self._instrument_keys, capacity)
+        self._instrument_keys[self._size:] = -1
+        self._quantities = np.resize(self._quantities, capacity)
+        self._quantities[self._size:] = 0.0
+        self._average_costs = np.resize(self._average_costs, capacity)
+        self._average_costs[self._size:] = 0.0
+        self._contracts.extend([None] * (capacity - len(self._contracts)))
+        self._last_prices = np.resize(self._last_prices, capacity)
+        self._last_prices[self._size:] = np.nan
+        self._market_values = np.resize(self._market_values, capacity)
+        self._market_values[self._size:] = 0.0
+
+    def _allocate_row(self, contract: Contract) -> int:
+        """Assign a row to a contract that has no open position"""
+        if self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            if self._size == len(self._quantities):
+                self._grow()
+            row = self._size
+            self._size += 1
+
+        key = self.key_of(contract)
+        self._instrument_keys[row] = key
+        self._contracts[row] = contract
+        self._row_by_key[key] = row
+        return row
+
+    def release(self, contract: Contract):
+        """Close the position held on a contract and free its row"""
+        row = self.row_of(contract)
+        if row is None:
+            raise ValueError(f"No position found for {contract}")
+
+        self._update_row(row, 0.0, 0.0)
+        del self._row_by_key[int(self._instrument_keys[row])]
+        self._instrument_keys[row] = -1
+        self._contracts[row] = None
+        self._last_prices[row] = np.nan
+        self._free_rows.append(row)
+
+    def set_position(self, contract: Contract, quantity: float, average_cost: float) -> int:
+        """
+        Overwrite the quantity and average cost of a contract, opening a row if needed
+
+        Returns:
+            Row holding the contract
+        """
+        row = self.row_of(contract)
+        if row is None:
+            row = self._allocate_row(contract)
+        self._update_row(row, float(quantity), float(average_cost))
+        return row
+
+    def _update_row(self, row: int, quantity: float, average_cost: float):
+        """Overwrite a row, applying the change to the cached market values if the row has a price"""
+        price = float(self._last_prices[row])
+        if not math.isnan(price):
+            market_value = quantity * price
+            self._live_market_value += market_value - float(self._market_values[row])
+            self._live_book_cost += (
+                quantity * average_cost - float(self._quantities[row]) * float(self._average_costs[row]))
+            self._market_values[row] = market_value
+        self._quantities[row] = quantity
+        self._average_costs[row] = average_cost
+
+    def apply_price(self, row: int, price: float):
+        """
+        Apply a new price to a row, updating the cached market values by the resulting delta
+
+        Args:
+            row: Row receiving the price
+            price: New price
+        """
+        quantity = float(self._quantities[row])
+        if math.isnan(self._last_prices[row]):
+            self._live_book_cost += quantity * float(self._average_costs[row])
+        market_value = quantity * price
+        self._live_market_value += market_value - float(self._market_values[row])
+        self._market_values[row] = market_value
+        self._last_prices[row] = price
+
+    def revalue(self):
+        """Recompute the cached market values from scratch, clearing any accumulated rounding drift"""
+        priced = ~np.isnan(self.last_prices)
+        self.live_market_values[:] = np.where(priced, self.quantities * self.last_prices, 0.0)
+        self._live_market_value = float(self.live_market_values.sum())
+        self._live_book_cost = float(np.dot(self.quantities[priced], self.average_costs[priced]))
+
+    def rows_for(self, contracts: Sequence[Contract]) -> np.ndarray:
+        """
+        Return the rows of a sequence of contracts, opening empty rows for contracts with no position
+
+        Args:
+            contracts: Contracts to locate, duplicates are allowed
+
+        Returns:
+            Array of rows aligned with contracts
+        """
+        rows = np.empty(len(contracts), dtype=np.int64)
+        for i, contract in enumerate(contracts):
+            row = self.row_of(contract)
+            if row is None:
+                row = self._allocate_row(contract)
+            rows[i] = row
+        return rows
+
+    def add_many(self, rows: np.ndarray, quantities: np.ndarray, prices: np.ndarray):
+        """
+        Add quantities bought at given prices to rows, updating the weighted average costs in one pass
+
+        Rows may appear several times. Rows whose quantity nets to zero, within QUANTITY_TOLERANCE of the quantity
+        traded, keep a zero quantity and cost; it is up to the caller to release them.
+
+        Args:
+            rows: Rows to update
+            quantities: Quantity added on each row
+            prices: Price paid for each quantity
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        quantities = np.asarray(quantities, dtype=np.float64)
+        prices = np.asarray(prices, dtype=np.float64)
+
+        added_quantity = np.zeros(self._size, dtype=np.float64)
+        added_cost = np.zeros(self._size, dtype=np.float64)
+        traded_quantity = np.zeros(self._size, dtype=np.float64)
+        np.add.at(added_quantity, rows, quantities)
+        np.add.at(added_cost, rows, quantities * prices)
+        np.add.at(traded_quantity, rows, np.abs(quantities))
+
+        touched = np.unique(rows)
+        old_quantity = self._quantities[touched]
+        new_quantity = old_quantity + added_quantity[touched]
+        book_cost = old_quantity * self._average_costs[touched] + added_cost[touched]
+
+        closed = np.abs(new_quantity) <= QUANTITY_TOLERANCE * (np.abs(old_quantity) + traded_quantity[touched])
+        new_quantity[closed] = 0.0
+        new_average_cost = np.divide(book_cost, new_quantity, out=np.zeros_like(book_cost), where=~closed)
+        self.set_many(touched, new_quantity, new_average_cost)
+
+    def set_many(self, rows: np.ndarray, quantities: np.ndarray, average_costs: np.ndarray):
+        """
+        Overwrite the quantities and average costs of distinct rows, applying the change to the cached market values
+
+        Args:
+            rows: Distinct rows to update
+            quantities: New quantity of each row
+            average_costs: New average cost of each row
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        quantities = np.asarray(quantities, dtype=np.float64)
+        average_costs = np.asarray(average_costs, dtype=np.float64)
+
+        prices = self._last_prices[rows]
+        priced = ~np.isnan(prices)
+        if priced.any():
+            priced_rows = rows[priced]
+            market_values = quantities[priced] * prices[priced]
+            old_book_cost = np.dot(self._quantities[priced_rows], self._average_costs[priced_rows])
+            self._live_market_value += float((market_values - self._market_values[priced_rows]).sum())
+            self._live_book_cost += float(np.dot(quantities[priced], average_costs[priced]) - old_book_cost)
+            self._market_values[priced_rows] = market_values
+
+        self._quantities[rows] = quantities
+        self._average_costs[rows] = average_costs
+
+    def price_vector(self, prices: Dict[Contract, Union[float, Decimal]]) -> np.ndarray:
+        """
+        Build a price vector aligned with the rows of the book
+
+        Args:
+            prices: Price of each contract held, other contracts are ignored
+
+        Returns:
+            Array of prices, 0 on unused rows
+        """
+        vector = np.zeros(self._size, dtype=np.float64)
+        for row, contract in enumerate(self.contracts):
+            if contract is None:
+                continue
+            if contract not in prices:
+                raise ValueError(f"No price provided for {contract}")
+            vector[row] = float(prices[contract])
+        return vector
+
+    def market_values(self, prices: np.ndarray) -> np.ndarray:
+        """Market value of each row for a row-aligned price vector"""
+        return self.quantities * prices
+
+    def total_market_value(self, prices: np.ndarray) -> float:
+        """Total market value for a row-aligned price vector"""
+        return float(np.dot(self.quantities, prices))
+
+    def unrealized_pl(self, prices: np.ndarray) -> np.ndarray:
+        """Unrealized profit/loss of each row for a row-aligned price vector"""
+        return self.quantities * (prices - self.average_costs)
+
+    def total_unrealized_pl(self, prices: np.ndarray) -> float:
+        """Total unrealized profit/loss for a row-aligned price vector"""
+        return float(np.dot(self.quantities, prices - self.average_costs))
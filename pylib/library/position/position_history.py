@@ -0,0 +1,265 @@
+import logging
+from datetime import date
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from pylib.library.position.fill_replay import invalid_sells, replay_fills
+
+logger = logging.getLogger(__name__)
+
+# Trade statuses ignored when replaying fact_trade
+EXCLUDED_TRADE_STATUSES = frozenset({'CANCELLED', 'REJECTED'})
+
+# Trade types reducing the position, matched on the prefix so that e.g. SELL_SHORT is a sell
+SELL_TRADE_TYPE_PREFIX = 'SELL'
+
+TRADE_COLUMNS = ['portfolio_sk', 'instrument_sk', 'trade_date', 'trade_type', 'quantity', 'price', 'currency_code']
+OPENING_COLUMNS = ['portfolio_sk', 'instrument_sk', 'quantity', 'average_cost', 'currency_code']
+POSITION_COLUMNS = [
+    'position_date', 'portfolio_sk', 'instrument_sk', 'quantity', 'market_price', 'market_value', 'average_cost',
+    'book_cost', 'unrealized_pl', 'currency_code'
+]
+
+
+def signed_trade_quantities(trades: DataFrame) -> np.ndarray:
+    """Trade quantities signed by trade type, negative for sells"""
+    is_sell = trades['trade_type'].str.upper().str.startswith(SELL_TRADE_TYPE_PREFIX).to_numpy(dtype=bool)
+    quantities = np.abs(trades['quantity'].to_numpy(dtype=np.float64))
+    return np.where(is_sell, -quantities, quantities)
+
+
+class PositionHistoryEngine:
+    """
+    Rebuild daily fact_position rows from fact_trade rows
+
+    Every portfolio x instrument pair is a group of fills replayed at once with replay_fills, so the running quantity
+    and book cost of all the trades of all the portfolios are computed with cumulative sums over sorted arrays. The
+    state at the end of each trade date is then spread over the position dates until the next trade date of the group.
+
+    Incremental runs start from the positions held on the last position date before the earliest affected trade date:
+    only the trades dated after it are replayed and only the position dates from the affected date onwards are
+    produced.
+
+    A portfolio x instrument whose trades sell more than is held (a sell with no quantity held) is left out of the
+    result instead of failing the whole build, its trades are kept in rejected_trades for the caller to report.
+    """
+    def __init__(self, freq: str = 'B'):
+        """
+        Args:
+            freq: Pandas frequency of the position dates, business days by default
+        """
+        self.freq = freq
+        self.rejected_trades = DataFrame(columns=TRADE_COLUMNS)  # trades of the groups left out by the last build
+
+    def position_dates(self, start_date: date, end_date: date) -> pd.DatetimeIndex:
+        """Position dates between start_date and end_date included"""
+        return pd.date_range(start_date, end_date, freq=self.freq)
+
+    def build(
+            self,
+            trades: DataFrame,
+            start_date: date,
+            end_date: date,
+            opening_positions: Optional[DataFrame] = None,
+            prices: Optional[DataFrame] = None
+    ) -> DataFrame:
+        """
+        Compute the daily positions of every portfolio x instrument between start_date and end_date
+
+        Trades dated before start_date are replayed but produce no position date of their own, their state is carried
+        into start_date. A trade dated between two position dates (e.g. on a weekend with business days) is reflected
+        from the next position date. Closed positions produce no row.
+
+        Args:
+            trades: Trades with the TRADE_COLUMNS (trade_status is used when present), in execution order within a
+                trade date
+            start_date: First position date
+            end_date: Last position date
+            opening_positions: Positions held before the first trade, with the OPENING_COLUMNS and optionally their
+                market_price
+            prices: Market prices with columns instrument_sk, price_date and price, the last price on or before each
+                position date is used. Defaults to the last trade price of the instrument across portfolios, or the
+                opening market price before any trade. The average cost is used when no price is known
+
+        Returns:
+            DataFrame with the POSITION_COLUMNS, sorted by position_date, portfolio_sk and instrument_sk, without the
+            portfolio x instrument pairs of the rejected_trades
+        """
+        trades = self._prepare_trades(trades, end_date)
+        if opening_positions is None:
+            opening_positions = DataFrame(columns=OPENING_COLUMNS)
+        self.rejected_trades = trades.iloc[:0]
+        return self._build(trades, start_date, end_date, opening_positions, prices)
+
+    def _build(
+            self,
+            trades: DataFrame,
+            start_date: date,
+            end_date: date,
+            opening_positions: DataFrame,
+            prices: Optional[DataFrame]
+    ) -> DataFrame:
+        """build over prepared trades, leaving out the groups with invalid sells"""
+        dates = self.position_dates(start_date, end_date)
+
+        # Dense group ids over the pairs held at the opening or traded
+        keys = pd.concat([opening_positions[['portfolio_sk', 'instrument_sk']],
+                          trades[['portfolio_sk', 'instrument_sk']]], ignore_index=True)
+        group_ids, group_keys = pd.MultiIndex.from_frame(keys.astype(np.int64)).factorize()
+        n_groups = len(group_keys)
+        n_openings = len(opening_positions)
+        trade_groups = group_ids[n_openings:]
+
+        opening_quantities = np.zeros(n_groups, dtype=np.float64)
+        opening_book_costs = np.zeros(n_groups, dtype=np.float64)
+        opening_currencies = np.full(n_groups, None, dtype=object)
+        opening_groups = group_ids[:n_openings]
+        opening_quantities[opening_groups] = opening_positions['quantity'].to_numpy(dtype=np.float64)
+        opening_book_costs[opening_groups] = \
+            opening_quantities[opening_groups] * opening_positions['average_cost'].to_numpy(dtype=np.float64)
+        opening_currencies[opening_groups] = opening_positions['currency_code'].to_numpy(dtype=object)
+
+        trade_quantities = signed_trade_quantities(trades)
+        invalid = invalid_sells(trade_groups, trade_quantities, opening_quantities)
+        if invalid.any():
+            rejected = np.isin(group_ids, np.unique(trade_groups[invalid]))
+            self.rejected_trades = trades[rejected[n_openings:]]
+            logger.warning(f"Left out {len(np.unique(trade_groups[invalid]))} portfolio x instrument pairs selling a "
+                           f"quantity not held, in portfolios "
+                           f"{sorted(set(self.rejected_trades['portfolio_sk'].tolist()))}")
+            return self._build(trades[~rejected[n_openings:]].reset_index(drop=True), start_date, end_date,
+                               opening_positions[~rejected[:n_openings]], prices)
+
+        running_quantities, running_book_costs = replay_fills(
+            trade_groups,
+            trade_quantities,
+            trades['price'].to_numpy(dtype=np.float64),
+            opening_quantities,
+            opening_book_costs
+        )
+
+        # One event per group and date index: the opening state at start_date, then the state after the last trade
+        # mapped to each date index. Trades before start_date map to index 0 and are overridden by the latest one.
+        event_groups = np.concatenate([opening_groups, trade_groups])
+        event_date_index = np.concatenate([
+            np.zeros(n_openings, dtype=np.int64),
+            np.searchsorted(dates.values, trades['trade_date'].to_numpy(dtype='datetime64[ns]'))
+        ])
+        event_quantities = np.concatenate([opening_quantities[opening_groups], running_quantities])
+        event_book_costs = np.concatenate([opening_book_costs[opening_groups], running_book_costs])
+        currency_codes, currencies = pd.factorize(np.concatenate([
+            opening_currencies[opening_groups], trades['currency_code'].to_numpy(dtype=object)]))
+
+        events = np.flatnonzero(event_date_index < len(dates))
+        events = events[np.lexsort((events, event_date_index[events], event_groups[events]))]
+        group = event_groups[events]
+        date_index = event_date_index[events]
+        is_last = np.ones(len(events), dtype=bool)
+        is_last[:-1] = (group[1:] != group[:-1]) | (date_index[1:] != date_index[:-1])
+        events, group, date_index = events[is_last], group[is_last], date_index[is_last]
+
+        # Spread every event over the dates up to the next event of its group
+        next_date_index = np.full(len(events), len(dates), dtype=np.int64)
+        is_same_group = group[1:] == group[:-1]
+        next_date_index[:-1][is_same_group] = date_index[1:][is_same_group]
+        is_open = event_quantities[events] > 0
+        events, group, date_index, next_date_index = \
+            events[is_open], group[is_open], date_index[is_open], next_date_index[is_open]
+
+        spans = next_date_index - date_index
+        rows = np.repeat(events, spans)
+        offsets = np.arange(len(rows)) - np.repeat(np.cumsum(spans) - spans, spans)
+        row_date_index = np.repeat(date_index, spans) + offsets
+        portfolio_sks = group_keys.get_level_values(0).to_numpy()[event_groups[rows]]
+        instrument_sks = group_keys.get_level_values(1).to_numpy()[event_groups[rows]]
+
+        ordering = np.lexsort((instrument_sks, portfolio_sks, row_date_index))
+        rows, row_date_index = rows[ordering], row_date_index[ordering]
+        portfolio_sks, instrument_sks = portfolio_sks[ordering], instrument_sks[ordering]
+
+        quantities = event_quantities[rows]
+        book_costs = event_book_costs[rows]
+        average_costs = book_costs / quantities
+        if prices is None:
+            first_date = dates[0] if trades.empty else min(dates[0], trades['trade_date'].min())
+            opening_date = first_date - pd.Timedelta(days=1)
+            prices = self._trade_prices(trades, opening_positions, opening_date)
+        market_prices = self._market_prices(dates, row_date_index, instrument_sks, prices)
+        market_prices = np.where(np.isnan(market_prices), average_costs, market_prices)
+        market_values = quantities * market_prices
+
+        return DataFrame({
+            'position_date': dates.values[row_date_index],
+            'portfolio_sk': portfolio_sks,
+            'instrument_sk': instrument_sks,
+            'quantity': quantities,
+            'market_price': market_prices,
+            'market_value': market_values,
+            'average_cost': average_costs,
+            'book_cost': book_costs,
+            'unrealized_pl': market_values - book_costs,
+            'currency_code': pd.Categorical.from_codes(currency_codes[rows], currencies),
+        }, columns=POSITION_COLUMNS)
+
+    @staticmethod
+    def _prepare_trades(trades: DataFrame, end_date: date) -> DataFrame:
+        """
+        Drop excluded and future trades, sort by portfolio, instrument and trade date keeping execution order, which is
+        recorded in a sequence column
+        """
+        trades = trades.copy()
+        trades['trade_date'] = pd.to_datetime(trades['trade_date'])
+        trades['sequence'] = np.arange(len(trades))
+        keep = trades['trade_date'] <= pd.Timestamp(end_date)
+        if 'trade_status' in trades:
+            keep &= ~trades['trade_status'].str.upper().isin(EXCLUDED_TRADE_STATUSES)
+        trades = trades[keep]
+        return trades.sort_values(['portfolio_sk', 'instrument_sk', 'trade_date'], kind='stable') \
+            .reset_index(drop=True)
+
+    @staticmethod
+    def _trade_prices(trades: DataFrame, opening_positions: DataFrame, opening_date: pd.Timestamp) -> DataFrame:
+        """Trade prices in execution order, preceded by the opening market prices dated opening_date"""
+        prices = trades.sort_values('sequence')[['instrument_sk', 'trade_date', 'price']] \
+            .rename(columns={'trade_date': 'price_date'})
+        if 'market_price' in opening_positions:
+            opening_prices = DataFrame({
+                'instrument_sk': opening_positions['instrument_sk'].to_numpy(),
+                'price_date': opening_date,
+                'price': opening_positions['market_price'].to_numpy(dtype=np.float64),
+            })
+            prices = pd.concat([opening_prices, prices], ignore_index=True)
+        return prices
+
+    @staticmethod
+    def _market_prices(
+            dates: pd.DatetimeIndex,
+            date_index: np.ndarray,
+            instrument_sks: np.ndarray,
+            prices: DataFrame
+    ) -> np.ndarray:
+        """
+        Last price known on each position date, NaN when no price is known
+
+        The prices are forward filled over a dates x instruments grid, a price dated before the first position date is
+        known from the first position date and a price dated between two position dates from the next one.
+        """
+        instruments, instrument_index = np.unique(instrument_sks, return_inverse=True)
+        price_instruments = prices['instrument_sk'].to_numpy(dtype=np.int64)
+        price_instrument_index = np.searchsorted(instruments, price_instruments)
+        price_dates = pd.to_datetime(prices['price_date']).to_numpy()
+        price_date_index = np.searchsorted(dates.values, price_dates)
+        price_values = prices['price'].to_numpy(dtype=np.float64)
+
+        known = (price_date_index < len(dates)) & (price_instrument_index < len(instruments))
+        known[known] &= instruments[price_instrument_index[known]] == price_instruments[known]
+        order = np.flatnonzero(known)
+        order = order[np.argsort(price_dates[order], kind='stable')]
+
+        grid = np.full((len(dates), len(instruments)), np.nan)
+        grid[price_date_index[order], price_instrument_index[order]] = price_values[order]
+        grid = DataFrame(grid).ffill().to_numpy()
+        return grid[date_index, instrument_index]
@@ -0,0 +1,434 @@
+import heapq
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from pylib.library.contract.contract import Contract
+from pylib.library.position.position_book import QUANTITY_TOLERANCE
+from pylib.library.config.enumerations import LotMethod
+
+
+@dataclass
+class RealizedLot:
+    """Quantity of a tax lot closed by a sale"""
+    contract: Contract
+    lot_id: int
+    quantity: float
+    cost: float
+    open_date: datetime
+    close_date: datetime
+    price: Optional[float] = None  # sale price, None if unknown
+
+    @property
+    def cost_basis(self) -> float:
+        """Cost of the quantity closed"""
+        return self.quantity * self.cost
+
+    @property
+    def realized_pl(self) -> Optional[float]:
+        """Realized profit/loss of the quantity closed, None if the sale price is unknown"""
+        if self.price is None:
+            return None
+        return self.quantity * (self.price - self.cost)
+
+
+class LotQueue:
+    """
+    Open tax lots of a single contract, stored in growable NumPy arrays in opening order.
+
+    Lots are relieved in O(lots consumed): FIFO and LIFO walk inwards from a head and tail pointer that skip the lots
+    already exhausted, HIFO pops a max-heap on cost lazily discarding exhausted lots and specific identification looks
+    lots up by id. Exhausted lots, at the head or left as holes by LIFO, HIFO and specific identification relief, are
+    compacted away once they outnumber the open lots, so that FIFO walks never skip more lots than they consume.
+    """
+    def __init__(self, capacity: int = 16):
+        capacity = max(int(capacity), 1)
+        self._lot_ids = np.zeros(capacity, dtype=np.int64)
+        self._quantities = np.zeros(capacity, dtype=np.float64)
+        self._costs = np.zeros(capacity, dtype=np.float64)
+        self._open_dates = np.zeros(capacity, dtype='datetime64[us]')
+
+        self._head = 0  # first lot that may still be open
+        self._tail = 0  # one past the last lot that may still be open
+        self._next_lot_id = 0
+        self._index_by_id: Dict[int, int] = {}
+        self._cost_heap: List[Tuple[float, int]] = []  # (-cost, lot_id)
+        self.open_quantity = 0.0
+
+    @classmethod
+    def from_arrays(cls, lot_ids: np.ndarray, quantities: np.ndarray, costs: np.ndarray, open_dates: np.ndarray,
+                    next_lot_id: int) -> 'LotQueue':
+        """
+        Rebuild a queue from the columns of its open lots, in opening order, adopting the arrays without copying them
+
+        Args:
+            lot_ids: Lot ids
+            quantities: Open quantities, must be writable
+            costs: Unit costs
+            open_dates: Opening dates
+            next_lot_id: Id given to the next lot opened
+        """
+        queue = cls.__new__(cls)
+        queue._lot_ids = np.asarray(lot_ids, dtype=np.int64)
+        queue._quantities = np.asarray(quantities, dtype=np.float64)
+        queue._costs = np.asarray(costs, dtype=np.float64)
+        queue._open_dates = np.asarray(open_dates, dtype='datetime64[us]')
+
+        ids = queue._lot_ids.tolist()
+        queue._head = 0
+        queue._tail = len(ids)
+        queue._next_lot_id = int(next_lot_id)
+        queue._index_by_id = dict(zip(ids, range(len(ids))))
+        queue._cost_heap = [(-cost, lot_id) for cost, lot_id in zip(queue._costs.tolist(), ids)]
+        heapq.heapify(queue._cost_heap)
+        queue.open_quantity = float(sum(queue._quantities.tolist()))
+        return queue
+
+    @property
+    def next_lot_id(self) -> int:
+        """Id given to the next lot opened"""
+        return self._next_lot_id
+
+    def __len__(self) -> int:
+        return len(self._index_by_id)
+
+    @property
+    def lot_ids(self) -> np.ndarray:
+        """Ids of the open lots, in opening order"""
+        return self._lot_ids[self._head:self._tail][self.quantities > 0]
+
+    @property
+    def quantities(self) -> np.ndarray:
+        """Remaining quantities between the head and tail pointers, exhausted lots included"""
+        return self._quantities[self._head:self._tail]
+
+    def open_lots(self) -> Dict[str, np.ndarray]:
+        """Columns (lot_id, quantity, cost, open_date) of the open lots, in opening order"""
+        window = slice(self._head, self._tail)
+        is_open = self._quantities[window] > 0
+        return {
+            'lot_id': self._lot_ids[window][is_open],
+            'quantity': self._quantities[window][is_open],
+            'cost': self._costs[window][is_open],
+            'open_date': self._open_dates[window][is_open],
+        }
+
+    def _grow(self):
+        capacity = max(len(self._quantities) * 2, 16)
+        self._lot_ids = np.resize(self._lot_ids, capacity)
+        self._quantities = np.resize(self._quantities, capacity)
+        self._costs = np.resize(self._costs, capacity)
+        self._open_dates = np.resize(self._open_dates, capacity)
+
+    def _compact(self):
+        """Move the open lots between the head and tail pointers to the start of the arrays, dropping exhausted lots"""
+        window = slice(self._head, self._tail)
+        is_open = self._quantities[window] > 0
+        count = int(is_open.sum())
+        for array in (self._lot_ids, self._quantities, self._costs, self._open_dates):
+            array[:count] = array[window][is_open]
+        self._head, self._tail = 0, count
+        self._index_by_id = dict(zip(self._lot_ids[:count].tolist(), range(count)))
+
+    def open(self, quantity: float, cost: float, open_date: datetime) -> int:
+        """
+        Open a new lot
+
+        Args:
+            quantity: Quantity bought
+            cost: Unit cost of the lot
+            open_date: Opening date of the lot
+
+        Returns:
+            Id of the new lot
+        """
+        if self._tail == len(self._quantities):
+            if self._head >= len(self._quantities) // 2:
+                self._compact()
+            if self._tail == len(self._quantities):
+                self._grow()
+
+        lot_id = self._next_lot_id
+        self._next_lot_id += 1
+        index = self._tail
+        self._tail += 1
+
+        self._lot_ids[index] = lot_id
+        self._quantities[index] = quantity
+        self._costs[index] = cost
+        self._open_dates[index] = np.datetime64(open_date, 'us')
+        self._index_by_id[lot_id] = index
+        heapq.heappush(self._cost_heap, (-cost, lot_id))
+        self.open_quantity += quantity
+        return lot_id
+
+    def _consume(self, index: int, quantity: float) -> Tuple[int, float, float, datetime]:
+        """
+        Take up to quantity from a lot, returning (lot_id, quantity taken, cost, open_date)
+
+        A lot left with less than QUANTITY_TOLERANCE of its quantity, a float residual such as 0.1 + 0.2 - 0.3, is
+        closed and its whole quantity taken, so that exhausted lots hold exactly 0.
+        """
+        lot_quantity = float(self._quantities[index])
+        taken = min(quantity, lot_quantity)
+        lot_id = int(self._lot_ids[index])
+        if lot_quantity - taken <= QUANTITY_TOLERANCE * lot_quantity:
+            taken = lot_quantity
+            self._quantities[index] = 0.0
+            del self._index_by_id[lot_id]
+        else:
+            self._quantities[index] = lot_quantity - taken
+        self.open_quantity = self.open_quantity - taken if self._index_by_id else 0.0
+        return lot_id, taken, float(self._costs[index]), self._open_dates[index].item()
+
+    def _advance_pointers(self):
+        """Move the head and tail pointers past the exhausted lots"""
+        while self._head < self._tail and self._quantities[self._head] <= 0:
+            self._head += 1
+        while self._tail > self._head and self._quantities[self._tail - 1] <= 0:
+            self._tail -= 1
+        if self._head == self._tail:
+            self._head = self._tail = 0
+
+    def relieve(
+            self,
+            quantity: float,
+            method: LotMethod = LotMethod.FIFO,
+            lot_ids: Optional[Sequence[int]] = None
+    ) -> List[Tuple[int, float, float, datetime]]:
+        """
+        Relieve a quantity from the open lots
+
+        Args:
+            quantity: Quantity sold, relieving more than the open quantity closes every lot
+            method: Lot relief method
+            lot_ids: Lots to relieve, in order, for specific identification
+
+        Returns:
+            List of (lot_id, quantity, cost, open_date) relieved, in relief order
+        """
+        relieved = []
+        remaining = quantity
+        residual = QUANTITY_TOLERANCE * quantity  # float residual of the quantity sold left unrelieved
+
+        if method == LotMethod.FIFO:
+            index = self._head
+            while remaining > residual and index < self._tail:
+                if self._quantities[index] > 0:
+                    relieved.append(self._consume(index, remaining))
+                    remaining -= relieved[-1][1]
+                index += 1
+
+        elif method == LotMethod.LIFO:
+            index = self._tail - 1
+            while remaining > residual and index >= self._head:
+                if self._quantities[index] > 0:
+                    relieved.append(self._consume(index, remaining))
+                    remaining -= relieved[-1][1]
+                index -= 1
+
+        elif method == LotMethod.HIFO:
+            while remaining > residual and self._cost_heap:
+                lot_id = self._cost_heap[0][1]
+                index = self._index_by_id.get(lot_id)
+                if index is None:
+                    heapq.heappop(self._cost_heap)
+                    continue
+                relieved.append(self._consume(index, remaining))
+                remaining -= relieved[-1][1]
+                if lot_id not in self._index_by_id:
+                    heapq.heappop(self._cost_heap)
+
+        elif method == LotMethod.SPECIFIC_ID:
+            if lot_ids is None:
+                raise ValueError("Lot ids must be provided for specific identification")
+            missing = [lot_id for lot_id in lot_ids if lot_id not in self._index_by_id]
+            if missing:
+                raise ValueError(f"Lots {missing} are not open")
+            indexes = [self._index_by_id[lot_id] for lot_id in dict.fromkeys(lot_ids)]
+            if float(self._quantities[indexes].sum()) < min(quantity, self.open_quantity) - residual:
+                raise ValueError(f"Lots {list(lot_ids)} do not cover the quantity sold")
+            for index in indexes:
+                if remaining <= residual:
+                    break
+                relieved.append(self._consume(index, remaining))
+                remaining -= relieved[-1][1]
+
+        else:
+            raise ValueError(f"Unsupported lot method {method}")
+
+        self._advance_pointers()
+        if self._tail - self._head > 2 * len(self._index_by_id) + 16:
+            self._compact()
+        if len(self._cost_heap) > 2 * len(self._index_by_id) + 16:
+            self._cost_heap = [entry for entry in self._cost_heap if entry[1] in self._index_by_id]
+            heapq.heapify(self._cost_heap)
+        return relieved
+
+
+@dataclass
+class TaxLotLedger:
+    """
+    Tax lots of a portfolio, one LotQueue per contract, with the history of realized lots
+
+    The queue of a contract is kept once all its lots are closed, so that the lots of a reopened position carry on
+    from the last lot id. Queues adopted with restore_queues are only built on first use, read them through
+    all_queues rather than the queues field.
+    """
+    method: LotMethod = LotMethod.FIFO  # default relief method
+    queues: Dict[Contract, LotQueue] = field(default_factory=dict)
+    realized_lots: List[RealizedLot] = field(default_factory=list)
+    # Restored queues not built yet, by position in the restored columns of the queues
+    _pending_queues: Dict[Contract, int] = field(default_factory=dict, init=False, repr=False)
+    _pending_columns: Tuple[np.ndarray, ...] = field(default=(), init=False, repr=False)
+
+    def restore_queues(
+            self,
+            contracts: Sequence[Contract],
+            sizes: np.ndarray,
+            next_lot_ids: np.ndarray,
+            lot_ids: np.ndarray,
+            quantities: np.ndarray,
+            costs: np.ndarray,
+            open_dates: np.ndarray
+    ):
+        """
+        Adopt the open lots of several contracts, each LotQueue being built from the columns on its first use
+
+        Args:
+            contracts: Contract of each queue
+            sizes: Number of open lots of each queue
+            next_lot_ids: Id given to the next lot opened in each queue
+            lot_ids: Lot ids of all the queues, concatenated in queue order
+            quantities: Open quantities, concatenated in queue order, must be writable
+            costs: Unit costs, concatenated in queue order
+            open_dates: Opening dates, concatenated in queue order
+
+        Raises:
+            ValueError: If the ledger already holds lots
+        """
+        if self.queues or self._pending_queues:
+            raise ValueError("Lots can only be restored into an empty ledger")
+        ends = np.cumsum(sizes, dtype=np.int64)
+        self._pending_columns = (ends - sizes, ends, np.asarray(next_lot_ids), lot_ids, quantities, costs, open_dates)
+        self._pending_queues = dict(zip(contracts, range(len(contracts))))
+
+    def _queue(self, contract: Contract) -> Optional[LotQueue]:
+        """Queue of a contract, built first if it was restored and not used yet"""
+        queue = self.queues.get(contract)
+        if queue is None and self._pending_queues:
+            position = self._pending_queues.pop(contract, None)
+            if position is not None:
+                starts, ends, next_lot_ids, *lot_columns = self._pending_columns
+                window = slice(starts[position], ends[position])
+                queue = self.queues[contract] = LotQueue.from_arrays(
+                    *(column[window] for column in lot_columns), next_lot_ids[position])
+        return queue
+
+    def all_queues(self) -> Dict[Contract, LotQueue]:
+        """Queue of every contract with lots, building the restored queues not used yet"""
+        for contract in list(self._pending_queues):
+            self._queue(contract)
+        return self.queues
+
+    def open_lot(self, contract: Contract, quantity: float, cost: float, open_date: Optional[datetime] = None) -> int:
+        """
+        Open a new lot on a contract
+
+        Args:
+            contract: Contract bought
+            quantity: Quantity bought
+            cost: Unit cost
+            open_date: Opening date, defaults to now
+
+        Returns:
+            Id of the new lot, unique within the contract
+        """
+        queue = self._queue(contract)
+        if queue is None:
+            queue = self.queues[contract] = LotQueue()
+        return queue.open(float(quantity), float(cost), open_date or datetime.now())
+
+    def relieve(
+            self,
+            contract: Contract,
+            quantity: float,
+            price: Optional[float] = None,
+            close_date: Optional[datetime] = None,
+            method: Optional[LotMethod] = None,
+            lot_ids: Optional[Sequence[int]] = None
+    ) -> List[RealizedLot]:
+        """
+        Relieve a sale from the lots of a contract and record the realized lots
+
+        Args:
+            contract: Contract sold
+            quantity: Quantity sold
+            price: Sale price, needed for the realized profit/loss
+            close_date: Sale date, defaults to now
+            method: Lot relief method, defaults to the ledger method
+            lot_ids: Lots to relieve, in order, for specific identification
+
+        Returns:
+            List of realized lots
+        """
+        queue = self._queue(contract)
+        if queue is None or len(queue) == 0:
+            raise ValueError(f"No lots found for {contract}")
+
+        close_date = close_date or datetime.now()
+        price = float(price) if price is not None else None
+        realized = [
+            RealizedLot(contract, lot_id, taken, cost, open_date, close_date, price)
+            for lot_id, taken, cost, open_date in queue.relieve(float(quantity), method or self.method, lot_ids)
+        ]
+        self.realized_lots.extend(realized)
+        return realized
+
+    def has_open_lots(self, contract: Contract) -> bool:
+        """Whether a contract has open lots"""
+        queue = self._queue(contract)
+        return queue is not None and len(queue) > 0
+
+    def check_sales(self, contracts: Sequence[Contract], quantities: Sequence[float]):
+        """
+        Check that a batch of signed fills can be applied in order with the ledger method, without changing the lots
+
+        Args:
+            contracts: Contract of each fill
+            quantities: Signed quantity of each fill, positive for buys and negative for sells
+
+        Raises:
+            ValueError: If a sale finds no open lots, or the ledger method needs lot ids
+        """
+        open_quantities: Dict[Contract, float] = {}
+        for fill, (contract, quantity) in enumerate(zip(contracts, quantities)):
+            quantity = float(quantity)
+            held = open_quantities.get(contract)
+            if held is None:
+                held = self._queue(contract).open_quantity if self.has_open_lots(contract) else 0.0
+            if quantity < 0:
+                if self.method == LotMethod.SPECIFIC_ID:
+                    raise ValueError(f"Fill {fill} sells {contract} without lot ids for specific identification")
+                if held <= 0:
+                    raise ValueError(f"Fill {fill} sells {contract} with no open lots")
+                held = held + quantity if held + quantity > QUANTITY_TOLERANCE * held else 0.0
+            else:
+                held += quantity
+            open_quantities[contract] = held
+
+    def open_lots(self, contract: Contract) -> Dict[str, np.ndarray]:
+        """Columns (lot_id, quantity, cost, open_date) of the open lots of a contract"""
+        queue = self._queue(contract)
+        if queue is None:
+            return LotQueue().open_lots()
+        return queue.open_lots()
+
+    def realized_pl(self, contract: Optional[Contract] = None) -> float:
+        """Total realized profit/loss, optionally for a single contract, lots without a sale price are skipped"""
+        return sum(
+            lot.realized_pl for lot in self.realized_lots
+            if lot.realized_pl is not None and (contract is None or lot.contract == contract)
+        )
@@ -1,12 +1,14 @@
 
 import sqlalchemy.orm as orm
+from sqlalchemy import func
+from pandas import DataFrame, read_sql
 from typing import Optional, Dict, List
 from datetime import date
 from uuid import UUID
 
 from pylib.library.instrument.instrument import Instrument
 # from pylib.library.sql.database import InstrumentData
-from pylib.library.sql.database import DimInstrument, DimIssuer
+from pylib.library.sql.database import DimInstrument, DimInstrumentClassification, DimIssuer
 
 
 class QuerierInstrument:
@@ -414,3 +416,39 @@ class QuerierInstrument:
         except Exception as e:
             session.rollback()
             raise Exception(f"Failed to bulk insert instruments: {str(e)}")
+
+    @staticmethod
+    def get_instrument_attributes(session: orm.session.Session) -> DataFrame:
+        """
+        Retrieve the classification, issuer and currency attributes of all active instruments in a single query
+
+        Classification levels are read from dim_instrument_classification, falling back on the levels stored on the
+        instrument when its classification is not found.
+
+        Args:
+            session: SQLAlchemy session object
+
+        Returns:
+            DataFrame with one row per instrument
+        """
+        query = session.query(
+            DimInstrument.instrument_sk,
+            DimInstrument.instrument_id,
+            DimInstrument.instrument_code,
+            func.coalesce(DimInstrumentClassification.classification_level_1,
+                          DimInstrument.classification_level_1).label('classification_level_1'),
+            func.coalesce(DimInstrumentClassification.classification_level_2,
+                          DimInstrument.classification_level_2).label('classification_level_2'),
+            func.coalesce(DimInstrumentClassification.classification_level_3,
+                          DimInstrument.classification_level_3).label('classification_level_3'),
+            DimInstrument.issuer_sk,
+            DimIssuer.issuer_name,
+            DimIssuer.sector_name,
+            DimIssuer.country_code,
+            DimInstrument.currency_code
+        ).join(DimIssuer, DimIssuer.issuer_sk == DimInstrument.issuer_sk) \
+            .outerjoin(DimInstrumentClassification,
+                       (DimInstrumentClassification.classification_id == DimInstrument.classification_id) &
+                       (DimInstrumentClassification.is_active == 1)) \
+            .filter(DimInstrument.is_active == 1)
+        return read_sql(query.statement, session.bind)
@@ -0,0 +1,100 @@
+from datetime import date
+from typing import Iterable, Optional
+
+import numpy as np
+import sqlalchemy.orm as orm
+from pandas import DataFrame, read_sql
+
+from pylib.library.sql.database import DimInstrument, FactPosition, FactTrade
+from pylib.library.position.position_history import EXCLUDED_TRADE_STATUSES, SELL_TRADE_TYPE_PREFIX
+
+# dim_instrument columns a return series can be bucketed by
+BUCKET_COLUMNS = ('classification_id', 'classification_level_1', 'classification_level_2', 'classification_level_3',
+                  'currency_code')
+
+
+class QuerierPerformance:
+    """
+    Class to retrieve the market values and flows the returns are computed from
+    """
+    @staticmethod
+    def _bucket(bucket_column: Optional[str]):
+        if bucket_column is None:
+            return None
+        if bucket_column not in BUCKET_COLUMNS:
+            raise ValueError(f"Cannot bucket returns by {bucket_column}, expected one of {BUCKET_COLUMNS}")
+        return getattr(DimInstrument, bucket_column)
+
+    @staticmethod
+    def get_market_values(
+            session: orm.session.Session,
+            start_date: date,
+            end_date: date,
+            bucket_column: Optional[str] = None,
+            portfolio_sks: Optional[Iterable[int]] = None
+    ) -> DataFrame:
+        """
+        Retrieve the market values of the portfolios, or of their classification buckets, between two dates
+
+        Args:
+            session: SQLAlchemy session object
+            start_date: First position date
+            end_date: Last position date
+            bucket_column: dim_instrument column to bucket the positions by, portfolio totals by default
+            portfolio_sks: Portfolios to retrieve, all portfolios by default
+
+        Returns:
+            DataFrame with position_date, portfolio_sk, the bucket column if any and market_value
+        """
+        bucket = QuerierPerformance._bucket(bucket_column)
+        columns = [FactPosition.position_date, FactPosition.portfolio_sk] + ([bucket] if bucket is not None else [])
+        query = session.query(*columns, FactPosition.market_value)
+        if bucket is not None:
+            query = query.join(DimInstrument, DimInstrument.instrument_sk == FactPosition.instrument_sk)
+        query = query.filter(FactPosition.position_date >= start_date, FactPosition.position_date <= end_date)
+        if portfolio_sks is not None:
+            query = query.filter(FactPosition.portfolio_sk.in_(list(portfolio_sks)))
+        market_values = read_sql(query.statement, session.bind, coerce_float=True)
+        key_columns = [column.key for column in columns]
+        return market_values.groupby(key_columns, as_index=False, sort=False)['market_value'].sum()
+
+    @staticmethod
+    def get_trade_flows(
+            session: orm.session.Session,
+            start_date: date,
+            end_date: date,
+            bucket_column: Optional[str] = None,
+            portfolio_sks: Optional[Iterable[int]] = None
+    ) -> DataFrame:
+        """
+        Retrieve the flows of the portfolios, or of their classification buckets, from their trades between two dates
+
+        Buys are inflows and sales outflows of their net amount, cancelled and rejected trades are ignored.
+
+        Args:
+            session: SQLAlchemy session object
+            start_date: First trade date
+            end_date: Last trade date
+            bucket_column: dim_instrument column to bucket the trades by, portfolio totals by default
+            portfolio_sks: Portfolios to retrieve, all portfolios by default
+
+        Returns:
+            DataFrame with trade_date, portfolio_sk, the bucket column if any, inflow and outflow
+        """
+        bucket = QuerierPerformance._bucket(bucket_column)
+        columns = [FactTrade.trade_date, FactTrade.portfolio_sk] + ([bucket] if bucket is not None else [])
+        query = session.query(*columns, FactTrade.trade_type, FactTrade.net_amount)
+        if bucket is not None:
+            query = query.join(DimInstrument, DimInstrument.instrument_sk == FactTrade.instrument_sk)
+        query = query.filter(FactTrade.trade_date >= start_date, FactTrade.trade_date <= end_date,
+                             FactTrade.trade_status.notin_(list(EXCLUDED_TRADE_STATUSES)))
+        if portfolio_sks is not None:
+            query = query.filter(FactTrade.portfolio_sk.in_(list(portfolio_sks)))
+        trades = read_sql(query.statement, session.bind, coerce_float=True)
+
+        is_sell = trades['trade_type'].str.upper().str.startswith(SELL_TRADE_TYPE_PREFIX).to_numpy(dtype=bool)
+        amounts = np.abs(trades['net_amount'].to_numpy(dtype=np.float64))
+        trades['inflow'] = np.where(is_sell, 0.0, amounts)
+        trades['outflow'] = np.where(is_sell, amounts, 0.0)
+        key_columns = [column.key for column in columns]
+        return trades.groupby(key_columns, as_index=False, sort=False)[['inflow', 'outflow']].sum()
@@ -0,0 +1,214 @@
+import logging
+from datetime import date
+from typing import Iterable, Optional
+
+import sqlalchemy.orm as orm
+from sqlalchemy import func
+from pandas import DataFrame, read_sql
+
+from pylib.library.sql.database import FactPosition, FactTrade
+from pylib.library.position.position_history import PositionHistoryEngine, POSITION_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+
+class QuerierPosition:
+    """
+    Class to handle the fact_position rebuild from fact_trade
+    """
+    @staticmethod
+    def get_trades(
+            session: orm.session.Session,
+            after_date: Optional[date],
+            end_date: date,
+            portfolio_sks: Optional[Iterable[int]] = None
+    ) -> DataFrame:
+        """
+        Retrieve the trades dated after a date up to an end date, in execution order
+
+        Args:
+            session: SQLAlchemy session object
+            after_date: Trades strictly after this date are retrieved, all trades if None
+            end_date: Last trade date
+            portfolio_sks: Portfolios to retrieve, all portfolios by default
+
+        Returns:
+            DataFrame of trades
+        """
+        query = session.query(
+            FactTrade.trade_sk, FactTrade.portfolio_sk, FactTrade.instrument_sk, FactTrade.trade_date,
+            FactTrade.trade_type, FactTrade.quantity, FactTrade.price, FactTrade.currency_code, FactTrade.trade_status
+        ).filter(FactTrade.trade_date <= end_date)
+        if after_date is not None:
+            query = query.filter(FactTrade.trade_date > after_date)
+        if portfolio_sks is not None:
+            query = query.filter(FactTrade.portfolio_sk.in_(list(portfolio_sks)))
+        query = query.order_by(FactTrade.trade_date, FactTrade.trade_sk)
+        return read_sql(query.statement, session.bind, coerce_float=True)
+
+    @staticmethod
+    def get_last_position_date(
+            session: orm.session.Session,
+            before_date: date,
+            portfolio_sks: Optional[Iterable[int]] = None
+    ) -> Optional[date]:
+        """
+        Retrieve the last position date strictly before a date common to a set of portfolios
+
+        This is the earliest of the last position dates of the portfolios, so that the positions of every portfolio
+        on that date plus its later trades give its complete history.
+
+        Args:
+            session: SQLAlchemy session object
+            before_date: Date to look before
+            portfolio_sks: Portfolios to look at, by default every portfolio with positions or trades before
+                before_date, so that a portfolio traded without positions is not left out of the rebuild
+
+        Returns:
+            Last common position date, or None if one of the portfolios has no position before before_date
+        """
+        query = session.query(FactPosition.portfolio_sk, func.max(FactPosition.position_date)) \
+            .filter(FactPosition.position_date < before_date)
+        if portfolio_sks is not None:
+            portfolio_sks = set(portfolio_sks)
+            query = query.filter(FactPosition.portfolio_sk.in_(list(portfolio_sks)))
+        last_dates = dict(query.group_by(FactPosition.portfolio_sk).all())
+        if portfolio_sks is None:
+            traded = session.query(FactTrade.portfolio_sk).filter(FactTrade.trade_date < before_date).distinct()
+            portfolio_sks = set(last_dates) | {portfolio_sk for (portfolio_sk,) in traded.all()}
+        if not last_dates or not portfolio_sks <= set(last_dates):
+            return None
+        return min(last_dates[portfolio_sk] for portfolio_sk in portfolio_sks)
+
+    @staticmethod
+    def get_positions(
+            session: orm.session.Session,
+            position_date: date,
+            portfolio_sks: Optional[Iterable[int]] = None
+    ) -> DataFrame:
+        """
+        Retrieve the positions held on a position date
+
+        Args:
+            session: SQLAlchemy session object
+            position_date: Position date
+            portfolio_sks: Portfolios to retrieve, all portfolios by default
+
+        Returns:
+            DataFrame of positions
+        """
+        query = session.query(
+            FactPosition.portfolio_sk, FactPosition.instrument_sk, FactPosition.quantity, FactPosition.average_cost,
+            FactPosition.market_price, FactPosition.currency_code
+        ).filter(FactPosition.position_date == position_date)
+        if portfolio_sks is not None:
+            query = query.filter(FactPosition.portfolio_sk.in_(list(portfolio_sks)))
+        return read_sql(query.statement, session.bind, coerce_float=True)
+
+    @staticmethod
+    def get_earliest_trade_date(session: orm.session.Session, trade_sks: Iterable[int]) -> Optional[date]:
+        """
+        Retrieve the earliest trade date of a set of new or amended trades, where an incremental rebuild starts
+
+        Args:
+            session: SQLAlchemy session object
+            trade_sks: Surrogate keys of the trades
+
+        Returns:
+            Earliest trade date or None if no trade matches
+        """
+        return session.query(func.min(FactTrade.trade_date)) \
+            .filter(FactTrade.trade_sk.in_(list(trade_sks))).scalar()
+
+    @staticmethod
+    def rebuild_positions(
+            session: orm.session.Session,
+            start_date: date,
+            end_date: date,
+            portfolio_sks: Optional[Iterable[int]] = None,
+            prices: Optional[DataFrame] = None,
+            engine: Optional[PositionHistoryEngine] = None
+    ) -> int:
+        """
+        Recompute fact_position from start_date to end_date and replace the existing rows
+
+        The positions held on the last position date before start_date common to the portfolios are the opening
+        positions and only the trades dated after it are replayed, so a run from the earliest affected trade date only
+        recomputes the dates that can change. Without an earlier position date every trade up to end_date is replayed.
+
+        Portfolios with a sell of no held quantity (see PositionHistoryEngine.rejected_trades) are reported in a
+        warning and their existing rows are left untouched, the other portfolios are rebuilt.
+
+        Args:
+            session: SQLAlchemy session object
+            start_date: First position date to recompute
+            end_date: Last position date to recompute
+            portfolio_sks: Portfolios to recompute, all portfolios by default
+            prices: Market prices, see PositionHistoryEngine.build
+            engine: Position history engine, business day positions by default
+
+        Returns:
+            Number of position rows written
+        """
+        engine = engine or PositionHistoryEngine()
+        portfolio_sks = list(portfolio_sks) if portfolio_sks is not None else None
+        try:
+            opening_date = QuerierPosition.get_last_position_date(session, start_date, portfolio_sks)
+            opening_positions = None
+            if opening_date is not None:
+                opening_positions = QuerierPosition.get_positions(session, opening_date, portfolio_sks)
+            trades = QuerierPosition.get_trades(session, opening_date, end_date, portfolio_sks)
+            positions = engine.build(trades, start_date, end_date, opening_positions, prices)
+
+            delete_query = session.query(FactPosition).filter(
+                FactPosition.position_date >= start_date, FactPosition.position_date <= end_date)
+            if portfolio_sks is not None:
+                delete_query = delete_query.filter(FactPosition.portfolio_sk.in_(portfolio_sks))
+            skipped_portfolio_sks = sorted(set(engine.rejected_trades['portfolio_sk'].tolist()))
+            if skipped_portfolio_sks:
+                logger.warning(f"Positions of portfolios {skipped_portfolio_sks} not rebuilt, they sell quantities "
+                               f"not held")
+                positions = positions[~positions['portfolio_sk'].isin(skipped_portfolio_sks)]
+                delete_query = delete_query.filter(FactPosition.portfolio_sk.notin_(skipped_portfolio_sks))
+            delete_query.delete(synchronize_session=False)
+
+            positions['position_date'] = positions['position_date'].dt.date
+            session.bulk_insert_mappings(FactPosition, positions[POSITION_COLUMNS].to_dict('records'))
+            session.commit()
+            return len(positions)
+
+        except Exception as e:
+            session.rollback()
+            raise Exception(f"Failed to rebuild positions: {str(e)}")
+
+    @staticmethod
+    def update_positions(
+            session: orm.session.Session,
+            trade_sks: Iterable[int],
+            end_date: Optional[date] = None,
+            prices: Optional[DataFrame] = None
+    ) -> int:
+        """
+        Incrementally recompute fact_position after trades were added or amended
+
+        Only the portfolios of the trades are recomputed, from the earliest of their trade dates.
+
+        Args:
+            session: SQLAlchemy session object
+            trade_sks: Surrogate keys of the new or amended trades
+            end_date: Last position date, defaults to today
+            prices: Market prices, see PositionHistoryEngine.build
+
+        Returns:
+            Number of position rows written
+        """
+        trade_sks = list(trade_sks)
+        start_date = QuerierPosition.get_earliest_trade_date(session, trade_sks)
+        if start_date is None:
+            return 0
+        portfolio_sks = [
+            portfolio_sk for portfolio_sk, in session.query(FactTrade.portfolio_sk)
+            .filter(FactTrade.trade_sk.in_(trade_sks)).distinct()
+        ]
+        return QuerierPosition.rebuild_positions(
+            session, start_date, end_date or date.today(), portfolio_sks, prices=prices)
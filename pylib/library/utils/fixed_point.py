@@ -0,0 +1,67 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal, ROUND_HALF_EVEN
+from typing import Optional
+
+# Number of decimal places kept by the fixed point representation, matches the Numeric(18, 8) database columns
+PRICE_DECIMALS = 8
+PRICE_SCALE = 10 ** PRICE_DECIMALS
+
+INT64_MAX = 2 ** 63 - 1
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_fixed(value: Optional[Decimal]) -> Optional[int]:
+    """
+    Convert a Decimal to a scaled integer with PRICE_DECIMALS decimal places, rounded half-even
+
+    Values with more decimal places, e.g. average costs from a Decimal division, are rounded as the Numeric(18, 8)
+    database columns store them.
+
+    Args:
+        value: Decimal to convert, None is passed through
+
+    Returns:
+        Scaled integer fitting in an int64
+
+    Raises:
+        ValueError: If the value does not fit in an int64
+    """
+    if value is None:
+        return None
+    fixed = int(Decimal(value).scaleb(PRICE_DECIMALS).to_integral_value(rounding=ROUND_HALF_EVEN))
+    if abs(fixed) > INT64_MAX:
+        raise ValueError(f"{value} does not fit in a fixed point int64")
+    return fixed
+
+
+def from_fixed(value: Optional[int]) -> Optional[Decimal]:
+    """Convert a scaled integer back to a Decimal, None is passed through"""
+    if value is None:
+        return None
+    return Decimal(value).scaleb(-PRICE_DECIMALS)
+
+
+def datetime_to_us(value: Optional[datetime]) -> Optional[int]:
+    """Convert a naive datetime to integer microseconds since the epoch, None is passed through"""
+    if value is None:
+        return None
+    delta = value - EPOCH
+    return (delta.days * 86_400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def us_to_datetime(value: Optional[int]) -> Optional[datetime]:
+    """Convert integer microseconds since the epoch back to a naive datetime, None is passed through"""
+    if value is None:
+        return None
+    return EPOCH + timedelta(microseconds=value)
+
+
+def date_to_ordinal(value: Optional[date]) -> Optional[int]:
+    """Convert a date to its proleptic Gregorian ordinal, None is passed through"""
+    return value.toordinal() if value is not None else None
+
+
+def ordinal_to_date(value: Optional[int]) -> Optional[date]:
+    """Convert a proleptic Gregorian ordinal back to a date, None is passed through"""
+    return date.fromordinal(value) if value is not None else None
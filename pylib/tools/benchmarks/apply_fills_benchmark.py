@@ -0,0 +1,96 @@
+import time
+from decimal import Decimal
+
+import numpy as np
+
+from pylib.library.contract.contract import Contract
+from pylib.library.position.position import Position
+from pylib.library.portfolio.portfolio import Portfolio
+
+FILL_COUNTS = (1_000, 10_000, 100_000)
+FILLS_PER_CONTRACT = 20
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<32} {:>7} fills: {:8.2f} ms'.format(label, n, (te - ts) * 1e3))
+    return result
+
+
+def generate_fills(n: int, rng: np.random.Generator):
+    """Random buys and sells, sells never exceeding the quantity held so the scalar path does not raise"""
+    contracts = [Contract(instrument_id=str(i)) for i in range(max(n // FILLS_PER_CONTRACT, 1))]
+    held = np.zeros(len(contracts))
+    fill_contracts, quantities, prices = [], [], []
+    for i in rng.integers(0, len(contracts), n):
+        quantity = float(rng.integers(1, 100))
+        if held[i] > 0 and rng.random() < 0.4:
+            quantity = -min(quantity, held[i])
+        held[i] += quantity
+        fill_contracts.append(contracts[i])
+        quantities.append(quantity)
+        prices.append(round(float(rng.uniform(10, 500)), 4))
+    return fill_contracts, quantities, prices
+
+
+def apply_scalar(portfolio: Portfolio, contracts, quantities, prices):
+    """One add_position / remove_position call per fill"""
+    for contract, quantity, price in zip(contracts, quantities, prices):
+        if quantity > 0:
+            portfolio.add_position(Position(contract, Decimal(str(quantity)), Decimal(str(price))))
+        else:
+            portfolio.remove_position(contract, Decimal(str(-quantity)))
+
+
+def max_difference(scalar: Portfolio, batch: Portfolio) -> float:
+    """Largest relative difference in quantity or average cost between two portfolios"""
+    if scalar.positions.keys() != batch.positions.keys():
+        raise AssertionError("Scalar and batch paths hold different contracts")
+    difference = 0.0
+    for contract, position in scalar.positions.items():
+        other = batch.positions[contract]
+        for a, b in ((position.quantity, other.quantity), (position.average_cost, other.average_cost)):
+            difference = max(difference, abs(float(a) - float(b)) / max(abs(float(a)), 1.0))
+    return difference
+
+
+def run(n: int, rng: np.random.Generator):
+    contracts, quantities, prices = generate_fills(n, rng)
+
+    scalar = Portfolio(name=f"scalar_{n}")
+    batch = Portfolio(name=f"batch_{n}")
+    timed("add/remove_position loop", n, apply_scalar, scalar, contracts, quantities, prices)
+    timed("apply_fills", n, batch.apply_fills, contracts, quantities, prices)
+    print('{:<32} {:>7} fills: {:.2e}'.format("max relative difference", n, max_difference(scalar, batch)))
+
+
+def run_repeated_partial_sells(cycles: int = 60):
+    """Large buys each sold back but for the share held throughout, driving the cumulative sell multiplier to 0"""
+    contract = Contract(instrument_id='partial_sells')
+    quantities = [1.0] + [1e6, -1e6] * cycles
+    prices = [10.0] * len(quantities)
+    contracts = [contract] * len(quantities)
+
+    scalar = Portfolio(name="scalar_partial_sells")
+    batch = Portfolio(name="batch_partial_sells")
+    apply_scalar(scalar, contracts, quantities, prices)
+    batch.apply_fills(contracts, quantities, prices)
+    difference = max_difference(scalar, batch)
+    print('{:<32} {:>7} fills: {:.2e}'.format("repeated partial sells", len(quantities), difference))
+    if not difference < 1e-9:
+        raise AssertionError(f"apply_fills diverges from the sequential path on repeated partial sells: {difference}")
+
+
+def main():
+    rng = np.random.default_rng(42)
+    for n in FILL_COUNTS:
+        run(n, rng)
+        print()
+    run_repeated_partial_sells()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import time
+
+import numpy as np
+import pandas as pd
+
+from pylib.library.market_data.bar_aggregator import BarAggregator
+
+TICK_COUNTS = (10_000, 100_000, 1_000_000)
+SYMBOL_COUNT = 100
+TICKS_PER_SECOND = 200
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<40} {:>8} ticks: {:9.2f} ms ({:.2f} us per tick)'.format(label, n, (te - ts) * 1e3,
+                                                                       (te - ts) * 1e6 / n))
+    return result
+
+
+def streaming(symbols: list, prices: list, sizes: list, timestamps: list):
+    aggregator = BarAggregator()
+    for symbol, price, size, timestamp in zip(symbols, prices, sizes, timestamps):
+        aggregator.on_trade(symbol, price, size, timestamp)
+    aggregator.flush()
+    return aggregator
+
+
+def resampled(symbols: list, prices: list, sizes: list, timestamps: list):
+    """Rebuild every bar size from the full tick history, as a periodic batch job would"""
+    ticks = pd.DataFrame({'symbol': symbols, 'price': prices, 'size': sizes},
+                         index=pd.to_datetime(np.asarray(timestamps), unit='ns'))
+    for rule in ('5s', '1min', '5min', '1D'):
+        ticks.groupby('symbol').resample(rule).agg({'price': 'ohlc', 'size': 'sum'})
+
+
+def run(n: int, rng: np.random.Generator):
+    symbols = [f'S{code}' for code in rng.integers(0, SYMBOL_COUNT, n).tolist()]
+    prices = (100.0 + np.cumsum(rng.normal(0, 0.01, n))).round(2).tolist()
+    sizes = rng.integers(1, 500, n).astype(float).tolist()
+    timestamps = (time.time_ns() + np.arange(n) * (10 ** 9 // TICKS_PER_SECOND)).tolist()
+
+    timed("streaming, 4 bar sizes", n, streaming, symbols, prices, sizes, timestamps)
+    if n <= 100_000:
+        timed("pandas resample of the history", n, resampled, symbols, prices, sizes, timestamps)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    for n in TICK_COUNTS:
+        run(n, rng)
+        print()
+
+
+if __name__ == "__main__":
+    main()
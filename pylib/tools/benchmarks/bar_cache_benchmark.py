@@ -0,0 +1,79 @@
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from pylib.library.market_data.bar_cache import BAR_DTYPE, US_PER_DAY, EPOCH_DATE, BarCache, BarSeriesKey, \
+    array_to_bars
+
+SYMBOL_COUNTS = (100, 2_000)
+START = date(2019, 1, 1)
+END = date(2023, 12, 31)
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<40} {:>6} symbols: {:9.2f} ms'.format(label, n, (te - ts) * 1e3))
+    return result
+
+
+def daily_bars(rng: np.random.Generator) -> np.ndarray:
+    days = np.arange((START - EPOCH_DATE).days, (END - EPOCH_DATE).days + 1)
+    days = days[(days + 3) % 7 < 5]  # weekdays
+    records = np.zeros(len(days), dtype=BAR_DTYPE)
+    records['timestamp'] = days * US_PER_DAY
+    closes = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.01, len(days))))
+    for name in ('open_price', 'high_price', 'low_price', 'close_price', 'weighted_avg_price'):
+        records[name] = closes
+    records['volume'] = 1_000
+    records['bar_count'] = 10
+    return records
+
+
+def backfill(cache: BarCache, symbols: list, records: np.ndarray):
+    for symbol in symbols:
+        cache.write(BarSeriesKey(symbol), records, START, END)
+
+
+def gaps(cache: BarCache, symbols: list):
+    return sum(len(cache.gaps(BarSeriesKey(symbol), START, END)) for symbol in symbols)
+
+
+def reads(cache: BarCache, symbols: list):
+    return [cache.read(BarSeriesKey(symbol), START, END) for symbol in symbols]
+
+
+def reads_as_bars(cache: BarCache, symbols: list):
+    return [array_to_bars(cache.read(BarSeriesKey(symbol), START, END)) for symbol in symbols]
+
+
+def run(n: int, rng: np.random.Generator):
+    root = tempfile.mkdtemp()
+    try:
+        cache = BarCache(root)
+        symbols = [f'S{i}' for i in range(n)]
+        records = daily_bars(rng)
+        timed("first backfill, writes", n, backfill, cache, symbols, records)
+        missing = timed("re-run, gap detection", n, gaps, cache, symbols)
+        assert missing == 0
+        timed("re-run, memory-mapped arrays", n, reads, cache, symbols)
+        if n <= 100:
+            timed("re-run, HistoricalBar objects", n, reads_as_bars, cache, symbols)
+    finally:
+        shutil.rmtree(root)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    for n in SYMBOL_COUNTS:
+        run(n, rng)
+        print()
+
+
+if __name__ == "__main__":
+    main()
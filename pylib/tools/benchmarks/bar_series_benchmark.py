@@ -0,0 +1,77 @@
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import numpy as np
+
+from pylib.library.market_data.historical_data import HistoricalBar, HistoricalBarSeries, parse_bar_date
+
+BAR_COUNTS = (10_000, 100_000, 500_000)  # 1-minute bars, about 390 per day
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<40} {:>7} bars: {:9.2f} ms'.format(label, n, (te - ts) * 1e3))
+    return result
+
+
+def ib_bars(n: int, rng: np.random.Generator, epoch: bool) -> list:
+    """Bars as received from the IBKR socket, with formatDate=1 strings or formatDate=2 epoch seconds"""
+    start = datetime(2020, 1, 2, 9, 30)
+    closes = 100.0 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+    bars = []
+    for i, close in enumerate(closes.round(2).tolist()):
+        timestamp = start + timedelta(days=i // 390, minutes=i % 390)
+        date = str(int(timestamp.timestamp())) if epoch else timestamp.strftime('%Y%m%d %H:%M:%S')
+        bars.append(SimpleNamespace(date=date, open=close, high=close, low=close, close=close,
+                                    volume=Decimal(100), wap=Decimal(repr(close)), barCount=10))
+    return bars
+
+
+def dataclass_callbacks(bars: list) -> list:
+    """One HistoricalBar per callback, as IBAPIClient.historicalData used to build"""
+    history = []
+    for bar in bars:
+        history.append(HistoricalBar(
+            timestamp=datetime.strptime(bar.date, '%Y%m%d %H:%M:%S' if len(bar.date) > 8 else '%Y%m%d'),
+            open_price=Decimal(str(bar.open)),
+            high_price=Decimal(str(bar.high)),
+            low_price=Decimal(str(bar.low)),
+            close_price=Decimal(str(bar.close)),
+            volume=bar.volume,
+            weighted_avg_price=Decimal(str(bar.wap)),
+            bar_count=bar.barCount
+        ))
+    return history
+
+
+def series_callbacks(bars: list) -> HistoricalBarSeries:
+    series = HistoricalBarSeries()
+    for bar in bars:
+        series.append(parse_bar_date(bar.date), bar.open, bar.high, bar.low, bar.close, int(bar.volume),
+                      float(bar.wap), bar.barCount)
+    return series
+
+
+def run(n: int, rng: np.random.Generator):
+    bars = ib_bars(n, rng, epoch=False)
+    history = timed("HistoricalBar per callback", n, dataclass_callbacks, bars)
+    series = timed("columnar series, formatDate=1", n, series_callbacks, bars)
+    timed("columnar series, formatDate=2", n, series_callbacks, ib_bars(n, rng, epoch=True))
+    timed("closes from HistoricalBar", n, lambda: np.array([float(bar.close_price) for bar in history]))
+    timed("closes from columnar series", n, lambda: series.close_prices.copy())
+
+
+def main():
+    rng = np.random.default_rng(42)
+    for n in BAR_COUNTS:
+        run(n, rng)
+        print()
+
+
+if __name__ == "__main__":
+    main()
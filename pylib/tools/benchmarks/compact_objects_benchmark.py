@@ -0,0 +1,90 @@
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+
+from pylib.library.contract.contract import Contract
+from pylib.library.position.position import Position, CompactPosition
+from pylib.library.market_data.historical_data import HistoricalBar, CompactHistoricalBar
+from pylib.library.market_data.security_market_data import SecurityMarketData, CompactSecurityMarketData
+from pylib.library.utils.fixed_point import PRICE_SCALE, datetime_to_us
+
+OBJECT_COUNT = 100_000
+
+# Attribute types owned by each object, references to contracts, enums or strings are shared and not counted
+OWNED_TYPES = (int, float, Decimal, datetime)
+
+
+def object_size(obj) -> int:
+    """Bytes used by an object, its attribute dict and the numeric / datetime values it owns"""
+    size = sys.getsizeof(obj)
+    if hasattr(obj, '__dict__'):
+        size += sys.getsizeof(obj.__dict__)
+        values = obj.__dict__.values()
+    else:
+        values = [getattr(obj, name) for name in obj.__slots__]
+    return size + sum(sys.getsizeof(value) for value in values if isinstance(value, OWNED_TYPES))
+
+
+def report(label: str, build, convert=None):
+    """Print the bytes per object and construction rate of a list of objects"""
+    ts = time.perf_counter()
+    objects = build()
+    te = time.perf_counter()
+    line = '{:<30} {:>6.0f} bytes/object {:>12,.0f} objects/s'.format(
+        label, np.mean([object_size(obj) for obj in objects[:1_000]]), len(objects) / (te - ts))
+    if convert is not None:
+        ts = time.perf_counter()
+        for obj in objects:
+            convert(obj)
+        te = time.perf_counter()
+        line += ' {:>12,.0f} conversions/s'.format(len(objects) / (te - ts))
+    print(line)
+    return objects
+
+
+def main():
+    rng = np.random.default_rng(42)
+    n = OBJECT_COUNT
+    start = datetime(2020, 1, 1)
+    prices = rng.uniform(10, 500, (n, 5)).round(4).tolist()
+    volumes = rng.integers(1, 1_000_000, n).tolist()
+    contract = Contract(symbol='BENCH')
+
+    bars = report("HistoricalBar", lambda: [
+        HistoricalBar(start + timedelta(minutes=i), Decimal(str(p[0])), Decimal(str(p[1])), Decimal(str(p[2])),
+                      Decimal(str(p[3])), v, Decimal(str(p[4])), 10)
+        for i, (p, v) in enumerate(zip(prices, volumes))
+    ])
+    compact_bars = report("CompactHistoricalBar", lambda: [
+        CompactHistoricalBar(datetime_to_us(start + timedelta(minutes=i)), round(p[0] * PRICE_SCALE),
+                             round(p[1] * PRICE_SCALE), round(p[2] * PRICE_SCALE), round(p[3] * PRICE_SCALE), v,
+                             round(p[4] * PRICE_SCALE), 10)
+        for i, (p, v) in enumerate(zip(prices, volumes))
+    ])
+    report("HistoricalBar -> compact", lambda: [CompactHistoricalBar.from_bar(bar) for bar in bars],
+           CompactHistoricalBar.to_bar)
+
+    quotes = report("SecurityMarketData", lambda: [
+        SecurityMarketData(contract, Decimal(str(p[0])), Decimal(str(p[1])), Decimal(str(p[2])), v)
+        for p, v in zip(prices, volumes)
+    ])
+    report("SecurityMarketData -> compact",
+           lambda: [CompactSecurityMarketData.from_market_data(quote) for quote in quotes],
+           CompactSecurityMarketData.to_market_data)
+
+    positions = report("Position", lambda: [
+        Position(contract, Decimal(v), Decimal(str(p[0]))) for p, v in zip(prices, volumes)
+    ])
+    report("Position -> compact", lambda: [CompactPosition.from_position(position) for position in positions],
+           CompactPosition.to_position)
+
+    mismatches = sum(compact.to_bar() != bar for compact, bar in
+                     zip((CompactHistoricalBar.from_bar(bar) for bar in bars), bars))
+    print(f"Round trip mismatches: {mismatches}, compact bars built: {len(compact_bars)}")
+
+
+if __name__ == "__main__":
+    main()
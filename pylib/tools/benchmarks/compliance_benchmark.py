@@ -0,0 +1,97 @@
+import time
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from pylib.library.config.enumerations import OrderType
+from pylib.library.contract.contract import Contract
+from pylib.library.order.order import Order
+from pylib.library.position.position import Position
+from pylib.library.portfolio.portfolio import Portfolio
+from pylib.tools.compliance.compliance_engine import ComplianceEngine, ExposureLimit, RestrictedList
+from pylib.tools.risk.exposure_engine import ExposureEngine
+
+INSTRUMENT_COUNT = 20_000
+POSITION_COUNTS = (100, 1_000, 10_000)
+ORDER_COUNT = 1_000
+
+
+def timed(label: str, n: int, n_orders: int, method, *args):
+    """Run method once and print its elapsed time per order"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<40} {:>6} positions: {:9.2f} us per order'.format(label, n, (te - ts) * 1e6 / n_orders))
+    return result
+
+
+def loop_checks(portfolio: Portfolio, orders: list, attributes: pd.DataFrame, prices: dict, limits: dict):
+    """Recompute the category weights of the portfolio with the order for every order"""
+    by_id = attributes.set_index('instrument_id').to_dict('index')
+    for order in orders:
+        values = {contract: float(position.quantity) * prices[contract]
+                  for contract, position in portfolio.positions.items()}
+        nav = sum(values.values())
+        values[order.instrument] = values.get(order.instrument, 0.0) + float(order.quantity) * prices[order.instrument]
+        for attribute, limit in limits.items():
+            weights = {}
+            for contract, value in values.items():
+                category = by_id[contract.instrument_id][attribute]
+                weights[category] = weights.get(category, 0.0) + value / nav
+            any(weight > limit for weight in weights.values())
+
+
+def compiled_checks(compliance, orders: list, prices: dict):
+    """Check every order against the compiled rules"""
+    for order in orders:
+        compliance.check(order, prices[order.instrument])
+
+
+def run(n: int, rng: np.random.Generator, attributes: pd.DataFrame, contracts: list, prices: dict, engine):
+    held = rng.choice(len(contracts), n, replace=False)
+    portfolio = Portfolio(name=f"portfolio_{n}", positions={
+        contracts[j]: Position(contracts[j], Decimal(int(q)), Decimal('100'))
+        for j, q in zip(held.tolist(), rng.integers(1, 1_000, n))
+    })
+    orders = [Order(contracts[j], OrderType.MARKET, 'BUY', Decimal(int(q)))
+              for j, q in zip(rng.integers(0, len(contracts), ORDER_COUNT).tolist(),
+                              rng.integers(1, 100, ORDER_COUNT).tolist())]
+    limits = {'issuer_sk': 0.05, 'sector_name': 0.25, 'currency_code': 0.6}
+
+    loop_orders = orders[:max(ORDER_COUNT * 100 // n, 10)]
+    timed("loop, recompute weights", n, len(loop_orders), loop_checks, portfolio, loop_orders, attributes, prices,
+          limits)
+    compliance = engine.portfolio(portfolio, prices)
+    timed("compiled rules", n, len(orders), compiled_checks, compliance, orders, prices)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    issuer_sks = rng.integers(0, 2_000, INSTRUMENT_COUNT)
+    attributes = pd.DataFrame({
+        'instrument_id': [str(i) for i in range(INSTRUMENT_COUNT)],
+        'classification_level_1': rng.choice(['Equity', 'Fixed Income', 'Cash'], INSTRUMENT_COUNT),
+        'classification_level_2': rng.choice([f'L2_{i}' for i in range(12)], INSTRUMENT_COUNT),
+        'classification_level_3': rng.choice([f'L3_{i}' for i in range(60)], INSTRUMENT_COUNT),
+        'issuer_sk': issuer_sks,
+        'issuer_name': [f'Issuer_{sk}' for sk in issuer_sks.tolist()],
+        'sector_name': rng.choice([f'Sector_{i}' for i in range(11)], INSTRUMENT_COUNT),
+        'country_code': rng.choice([f'C{i:02d}' for i in range(40)], INSTRUMENT_COUNT),
+        'currency_code': rng.choice(['CAD', 'USD', 'EUR', 'GBP', 'JPY'], INSTRUMENT_COUNT),
+    })
+    contracts = [Contract(instrument_id=str(i)) for i in range(INSTRUMENT_COUNT)]
+    prices = {contract: float(p) for contract, p in zip(contracts, rng.uniform(10, 500, INSTRUMENT_COUNT).round(2))}
+    engine = ComplianceEngine(ExposureEngine(attributes), [
+        ExposureLimit('issuer_sk', 0.05),
+        ExposureLimit('sector_name', 0.25),
+        ExposureLimit('currency_code', category_limits={'USD': 0.6}),
+        RestrictedList({str(i) for i in range(0, INSTRUMENT_COUNT, 100)}),
+    ])
+    for n in POSITION_COUNTS:
+        run(n, rng, attributes, contracts, prices, engine)
+        print()
+
+
+if __name__ == "__main__":
+    main()
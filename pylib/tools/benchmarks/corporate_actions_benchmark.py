@@ -0,0 +1,82 @@
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+
+from pylib.library.config.enumerations import CorporateActionType
+from pylib.library.market_data.corporate_actions import AdjustedBarSeries, CorporateAction, CorporateActionStore
+from pylib.library.market_data.historical_data import HistoricalBar
+
+BAR_COUNTS = (2_500, 25_000, 250_000)
+ACTION_COUNT = 80  # quarterly dividends over twenty years and a few splits
+READS = 20
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<40} {:>7} bars: {:9.2f} ms'.format(label, n, (te - ts) * 1e3))
+    return result
+
+
+def loop_adjusted_closes(bars: list, actions: list) -> list:
+    """Walk back through the bars applying the factor of every action after them, on every read"""
+    closes = [float(bar.close_price) for bar in bars]
+    for action in actions:
+        ex_date = datetime.combine(action.ex_date, datetime.min.time())
+        previous = [i for i, bar in enumerate(bars) if bar.timestamp < ex_date]
+        if not previous:
+            continue
+        if action.action_type == CorporateActionType.SPLIT:
+            factor = 1.0 / action.ratio
+        else:
+            factor = 1.0 - action.amount / float(bars[previous[-1]].close_price)
+        for i in previous:
+            closes[i] *= factor
+    return closes
+
+
+def repeated_loop(bars: list, actions: list):
+    for _ in range(READS):
+        loop_adjusted_closes(bars, actions)
+
+
+def repeated_reads(series: AdjustedBarSeries):
+    for _ in range(READS):
+        series.log_returns
+
+
+def run(n: int, rng: np.random.Generator):
+    start = datetime(2000, 1, 3)
+    closes = 50.0 * np.exp(np.cumsum(rng.normal(0, 0.001, n)))
+    bars = [HistoricalBar(start + timedelta(hours=i * 6), Decimal('0'), Decimal('0'), Decimal('0'),
+                          Decimal(f'{close:.4f}'), 100, Decimal('0'), 1) for i, close in enumerate(closes.tolist())]
+    last = bars[-1].timestamp.date()
+    ex_dates = sorted(rng.choice((last - date(2000, 1, 4)).days, ACTION_COUNT, replace=False).tolist())
+    actions = [
+        CorporateAction('SYM', CorporateActionType.SPLIT if i % 20 == 0 else CorporateActionType.CASH_DIVIDEND,
+                        date(2000, 1, 4) + timedelta(days=days), ratio=2.0, amount=0.25)
+        for i, days in enumerate(ex_dates)
+    ]
+    store = CorporateActionStore(actions[:-1])
+    series = timed("read raw bars into arrays", n, AdjustedBarSeries, 'SYM', bars, store)
+
+    if n <= 25_000:
+        timed(f"loop, {READS} reads", n, repeated_loop, bars, actions[:-1])
+    timed(f"lazy factors, {READS} reads", n, repeated_reads, series)
+    store.add(actions[-1])
+    timed("lazy factors, read after a new action", n, repeated_reads, series)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    for n in BAR_COUNTS:
+        run(n, rng)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import time
+from collections import defaultdict
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from pylib.library.contract.contract import Contract
+from pylib.library.position.position import Position
+from pylib.library.portfolio.portfolio import Portfolio
+from pylib.tools.risk.exposure_engine import EXPOSURE_ATTRIBUTES, ExposureEngine
+
+INSTRUMENT_COUNT = 20_000
+PORTFOLIO_COUNTS = (10, 100, 300)
+POSITIONS_PER_PORTFOLIO = 500
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<40} {:>5} portfolios: {:9.2f} ms'.format(label, n, (te - ts) * 1e3))
+    return result
+
+
+def loop_breakdowns(portfolios: list, attributes: pd.DataFrame, prices: dict) -> dict:
+    """Per-position attribute lookup and dict accumulation, as done by the dashboards"""
+    by_id = attributes.set_index('instrument_id')
+    breakdowns = {attribute: defaultdict(lambda: defaultdict(float)) for attribute in EXPOSURE_ATTRIBUTES}
+    for portfolio in portfolios:
+        for contract, position in portfolio.positions.items():
+            row = by_id.loc[contract.instrument_id]
+            value = float(position.quantity) * float(prices[contract])
+            for attribute in EXPOSURE_ATTRIBUTES:
+                breakdowns[attribute][portfolio.name][row[attribute]] += value
+    return breakdowns
+
+
+def run(n: int, rng: np.random.Generator, attributes: pd.DataFrame, contracts: list):
+    portfolios = []
+    for i in range(n):
+        held = rng.choice(len(contracts), POSITIONS_PER_PORTFOLIO, replace=False)
+        portfolios.append(Portfolio(name=f"portfolio_{i}", positions={
+            contracts[j]: Position(contracts[j], Decimal(int(q)), Decimal('100'))
+            for j, q in zip(held.tolist(), rng.integers(1, 1_000, len(held)))
+        }))
+    prices = {contract: Decimal(str(p)) for contract, p in zip(contracts, rng.uniform(10, 500, len(contracts)).round(2))}
+
+    engine = ExposureEngine(attributes)
+    timed("loop, per-position lookups", n, loop_breakdowns, portfolios, attributes, prices)
+    timed("engine, first call", n, engine.breakdowns, portfolios, EXPOSURE_ATTRIBUTES, prices)
+    timed("engine, contract rows cached", n, engine.breakdowns, portfolios, EXPOSURE_ATTRIBUTES, prices)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    issuer_sks = rng.integers(0, 2_000, INSTRUMENT_COUNT)
+    attributes = pd.DataFrame({
+        'instrument_id': [str(i) for i in range(INSTRUMENT_COUNT)],
+        'classification_level_1': rng.choice(['Equity', 'Fixed Income', 'Cash', None], INSTRUMENT_COUNT),
+        'classification_level_2': rng.choice([f'L2_{i}' for i in range(12)], INSTRUMENT_COUNT),
+        'classification_level_3': rng.choice([f'L3_{i}' for i in range(60)], INSTRUMENT_COUNT),
+        'issuer_sk': issuer_sks,
+        'issuer_name': [f'Issuer_{sk}' for sk in issuer_sks.tolist()],
+        'sector_name': rng.choice([f'Sector_{i}' for i in range(11)], INSTRUMENT_COUNT),
+        'country_code': rng.choice([f'C{i:02d}' for i in range(40)], INSTRUMENT_COUNT),
+        'currency_code': rng.choice(['CAD', 'USD', 'EUR', 'GBP', 'JPY'], INSTRUMENT_COUNT),
+    })
+    contracts = [Contract(instrument_id=str(i)) for i in range(INSTRUMENT_COUNT)]
+    for n in PORTFOLIO_COUNTS:
+        run(n, rng, attributes, contracts)
+        print()
+
+
+if __name__ == "__main__":
+    main()
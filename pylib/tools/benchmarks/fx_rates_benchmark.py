@@ -0,0 +1,66 @@
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from pylib.library.fx.fx_rates import FxRates
+
+CURRENCIES = ['EUR', 'GBP', 'JPY', 'CAD', 'CHF', 'AUD', 'NZD', 'SEK', 'NOK', 'DKK', 'HKD', 'SGD', 'MXN', 'ZAR']
+DATE_COUNT = 2_500  # ten years of business days
+POSITION_COUNTS = (100, 1_000, 5_000)
+BASE_CURRENCY = 'CAD'
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<40} {:>5} positions: {:9.2f} ms'.format(label, n, (te - ts) * 1e3))
+    return result
+
+
+def loop_revaluation(rates: pd.DataFrame, values: np.ndarray, currencies: list, dates: pd.DatetimeIndex) -> np.ndarray:
+    """Triangulate every position through USD on every date from a dict of rates"""
+    usd = {(day, currency): rate for day, row in zip(dates, rates.to_dict('records')) for currency, rate in row.items()}
+    totals = np.zeros(len(dates))
+    for t, day in enumerate(dates):
+        base_rate = usd[day, BASE_CURRENCY]
+        totals[t] = sum(value * usd[day, currency] / base_rate for value, currency in zip(values[t], currencies))
+    return totals
+
+
+def cube_revaluation(fx: FxRates, values: np.ndarray, currencies: list, dates: np.ndarray) -> np.ndarray:
+    """Gather the conversion factors of every position on every date from the cross rate cube"""
+    return (values * fx.conversion_history(currencies, BASE_CURRENCY, dates)).sum(axis=1)
+
+
+def run(n: int, rng: np.random.Generator, rates: pd.DataFrame, fx: FxRates):
+    currencies = rng.choice(CURRENCIES + ['USD'], n).tolist()
+    values = rng.uniform(1e3, 1e6, (DATE_COUNT, n))
+    loop = timed("loop, dict triangulation", n, loop_revaluation, rates, values, currencies, rates.index)
+    cube = timed("cross rate cube, memory-mapped", n, cube_revaluation, fx, values, currencies, fx.dates)
+    assert np.allclose(loop, cube)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    dates = pd.bdate_range('2015-01-01', periods=DATE_COUNT)
+    rates = pd.DataFrame(np.exp(np.cumsum(rng.normal(0, 0.005, (DATE_COUNT, len(CURRENCIES))), axis=0)) *
+                         rng.uniform(0.05, 1.5, len(CURRENCIES)), index=dates, columns=CURRENCIES)
+    rates['USD'] = 1.0
+    with tempfile.TemporaryDirectory() as path:
+        FxRates.from_usd_rates(rates).save(path)
+        print(f"{len(CURRENCIES) + 1} currencies x {DATE_COUNT} dates, "
+              f"{os.path.getsize(os.path.join(path, 'cross_rates.npy')) / 2 ** 20:.1f} MB cube")
+        fx = timed("load, memory-mapped", 0, FxRates.load, path)
+        for n in POSITION_COUNTS:
+            run(n, rng, rates, fx)
+            print()
+        del fx
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import time
+
+import numpy as np
+
+from pylib.library.config.enumerations import HistoricalSimulationMethod
+from pylib.tools.risk.market_returns import ReturnMatrix
+from pylib.tools.risk.historical_var import HistoricalVaR
+
+INSTRUMENT_COUNTS = (100, 1_000, 3_000)
+DATE_COUNT = 1_000
+WINDOW = 500
+PORTFOLIO_COUNT = 100
+APPENDED_DAYS = 20
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<40} {:>5} instruments: {:9.2f} ms'.format(label, n, (te - ts) * 1e3))
+    return result
+
+
+def roll_incremental(engine: HistoricalVaR, closes: np.ndarray, exposures: np.ndarray):
+    """Append each new day then compute every method"""
+    for t in range(closes.shape[1]):
+        engine.append(closes[:, t])
+        for method in HistoricalSimulationMethod:
+            engine.var_es(exposures, method=method)
+
+
+def roll_rebuild(returns: ReturnMatrix, closes: np.ndarray, exposures: np.ndarray):
+    """Rebuild the window from the close history every day then compute every method"""
+    for t in range(closes.shape[1]):
+        history = ReturnMatrix(returns.symbols, returns.dates, np.hstack([returns.closes, closes[:, :t + 1]]))
+        engine = HistoricalVaR(history, WINDOW)
+        for method in HistoricalSimulationMethod:
+            engine.var_es(exposures, method=method)
+
+
+def run(n: int, rng: np.random.Generator):
+    log_returns = rng.normal(0.0, 0.01, (n, DATE_COUNT + APPENDED_DAYS))
+    closes = 100.0 * np.exp(np.cumsum(log_returns, axis=1))
+    returns = ReturnMatrix([f'SYM{i}' for i in range(n)], np.arange(DATE_COUNT).astype('datetime64[D]'),
+                           closes[:, :DATE_COUNT])
+    new_closes = closes[:, DATE_COUNT:]
+    exposures = rng.uniform(0.0, 1e5, (n, PORTFOLIO_COUNT))
+
+    engine = timed("build window", n, HistoricalVaR, returns, WINDOW)
+    timed(f"{APPENDED_DAYS} days, append", n, roll_incremental, engine, new_closes, exposures)
+    timed(f"{APPENDED_DAYS} days, rebuild", n, roll_rebuild, returns, new_closes, exposures)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    for n in INSTRUMENT_COUNTS:
+        run(n, rng)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import time
+from decimal import Decimal
+
+import numpy as np
+
+from pylib.library.contract.contract import Contract
+from pylib.library.position.position import Position
+from pylib.library.portfolio.portfolio import Portfolio
+
+POSITION_COUNTS = (1_000, 10_000, 100_000)
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<40} {:>7} positions: {:8.2f} ms'.format(label, n, (te - ts) * 1e3))
+    return result
+
+
+def dict_market_value(portfolio: Portfolio, prices: dict) -> Decimal:
+    """Market value walking the dict of Position dataclasses"""
+    return sum(pos.market_value(prices[contract]) for contract, pos in portfolio.positions.items())
+
+
+def dict_unrealized_pl(portfolio: Portfolio, prices: dict) -> Decimal:
+    """Unrealized profit/loss walking the dict of Position dataclasses"""
+    return sum(pos.unrealized_pl(prices[contract]) for contract, pos in portfolio.positions.items())
+
+
+def dict_add_positions(portfolio: Portfolio, positions: list):
+    """Weighted average cost updates one add_position call at a time"""
+    for position in positions:
+        portfolio.add_position(position)
+
+
+def run(n: int, rng: np.random.Generator):
+    contracts = [Contract(instrument_id=str(i)) for i in range(n)]
+    quantities = rng.integers(1, 1_000, n)
+    costs = rng.uniform(10, 500, n).round(4)
+    portfolio = Portfolio(name=f"benchmark_{n}", positions={
+        contract: Position(contract, Decimal(int(q)), Decimal(str(c)))
+        for contract, q, c in zip(contracts, quantities, costs)
+    })
+
+    prices = {contract: Decimal(str(p)) for contract, p in zip(contracts, rng.uniform(10, 500, n).round(4))}
+    price_vector = timed("build price vector", n, portfolio.price_vector, prices)
+
+    timed("market value - dict of dataclasses", n, dict_market_value, portfolio, prices)
+    timed("market value - position book", n, portfolio.total_market_value, price_vector)
+    timed("unrealized p&l - dict of dataclasses", n, dict_unrealized_pl, portfolio, prices)
+    timed("unrealized p&l - position book", n, portfolio.unrealized_pl, price_vector)
+
+    fills = [Position(contract, Decimal(int(q)), Decimal(str(c))) for contract, q, c in
+             zip(contracts, rng.integers(1, 1_000, n), rng.uniform(10, 500, n).round(4))]
+    timed("add positions - add_position loop", n, dict_add_positions, portfolio, fills)
+    timed("add positions - batched", n, portfolio.add_positions, fills)
+
+    rows = portfolio.book.rows_for([position.contract for position in fills])
+    fill_quantities = np.array([float(position.quantity) for position in fills])
+    fill_costs = np.array([float(position.average_cost) for position in fills])
+    timed("add positions - position book only", n, portfolio.book.add_many, rows, fill_quantities, fill_costs)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    for n in POSITION_COUNTS:
+        run(n, rng)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from pylib.library.position.position_history import PositionHistoryEngine
+
+START_DATE = date(2022, 1, 1)
+END_DATE = date(2024, 12, 31)
+PORTFOLIO_COUNTS = (5, 20, 50)
+INSTRUMENT_COUNT = 100
+TRADES_PER_PORTFOLIO = 1_000
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<32} {:>4} portfolios: {:9.2f} ms'.format(label, n, (te - ts) * 1e3))
+    return result
+
+
+def generate_trades(n_portfolios: int, rng: np.random.Generator) -> DataFrame:
+    """Random fact_trade rows, sells never exceeding the quantity held"""
+    n = n_portfolios * TRADES_PER_PORTFOLIO
+    trade_dates = pd.date_range(START_DATE, END_DATE, freq='B')
+    trades = DataFrame({
+        'portfolio_sk': rng.integers(0, n_portfolios, n),
+        'instrument_sk': rng.integers(0, INSTRUMENT_COUNT, n),
+        'trade_date': np.sort(rng.choice(trade_dates.values, n)),
+        'quantity': rng.integers(1, 100, n).astype(np.float64),
+        'price': rng.uniform(10, 500, n).round(4),
+        'currency_code': 'USD',
+        'trade_status': 'SETTLED',
+    })
+    held = {}
+    trade_types = []
+    for key, quantity in zip(zip(trades['portfolio_sk'].tolist(), trades['instrument_sk'].tolist()),
+                             trades['quantity'].tolist()):
+        if held.get(key, 0.0) >= quantity and rng.random() < 0.4:
+            held[key] -= quantity
+            trade_types.append('SELL')
+        else:
+            held[key] = held.get(key, 0.0) + quantity
+            trade_types.append('BUY')
+    trades['trade_type'] = trade_types
+    return trades
+
+
+def build_loop(trades: DataFrame, engine: PositionHistoryEngine) -> list:
+    """One Python step per trade and per position row, the reference the engine replaces"""
+    state, last_prices, rows = {}, {}, []
+    trade_rows = list(trades.itertuples(index=False))
+    i = 0
+    for position_date in engine.position_dates(START_DATE, END_DATE):
+        while i < len(trade_rows) and trade_rows[i].trade_date <= position_date:
+            trade = trade_rows[i]
+            key = (trade.portfolio_sk, trade.instrument_sk)
+            quantity, book_cost = state.get(key, (0.0, 0.0))
+            if trade.trade_type == 'BUY':
+                quantity, book_cost = quantity + trade.quantity, book_cost + trade.quantity * trade.price
+            elif trade.quantity >= quantity:
+                quantity, book_cost = 0.0, 0.0
+            else:
+                quantity, book_cost = quantity - trade.quantity, book_cost * (quantity - trade.quantity) / quantity
+            state[key] = (quantity, book_cost)
+            last_prices[trade.instrument_sk] = trade.price
+            i += 1
+        for (portfolio_sk, instrument_sk), (quantity, book_cost) in state.items():
+            if quantity > 0:
+                market_value = quantity * last_prices[instrument_sk]
+                rows.append((position_date, portfolio_sk, instrument_sk, quantity, last_prices[instrument_sk],
+                             market_value, book_cost / quantity, book_cost, market_value - book_cost, 'USD'))
+    return rows
+
+
+def run(n_portfolios: int, rng: np.random.Generator):
+    trades = generate_trades(n_portfolios, rng)
+    engine = PositionHistoryEngine()
+    loop_rows = timed("per trade/position loop", n_portfolios, build_loop, trades, engine)
+    positions = timed("PositionHistoryEngine.build", n_portfolios, engine.build, trades, START_DATE, END_DATE)
+    print('{:<32} {:>4} portfolios: {} rows, loop {} rows'.format(
+        "position rows", n_portfolios, len(positions), len(loop_rows)))
+
+
+def main():
+    rng = np.random.default_rng(42)
+    for n_portfolios in PORTFOLIO_COUNTS:
+        run(n_portfolios, rng)
+        print()
+
+
+if __name__ == "__main__":
+    main()
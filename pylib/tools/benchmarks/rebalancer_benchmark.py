@@ -0,0 +1,82 @@
+import math
+import time
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from pylib.library.contract.contract import Contract
+from pylib.library.position.position import Position
+from pylib.library.portfolio.portfolio import Portfolio
+from pylib.tools.trading.rebalancer import Rebalancer
+
+UNIVERSE_SIZE = 2_000
+PORTFOLIO_COUNTS = (100, 500, 1_000)
+POSITIONS_PER_PORTFOLIO = 60
+DRIFT_BAND = 0.002
+MIN_TRADE_VALUE = 100.0
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<40} {:>5} portfolios: {:9.2f} ms'.format(label, n, (te - ts) * 1e3))
+    return result
+
+
+def loop_trades(portfolios: list, target_weights: pd.DataFrame, prices: dict, cash: dict) -> dict:
+    """Per-portfolio, per-position rebalancing with dictionaries"""
+    trades = {}
+    for portfolio in portfolios:
+        targets = {contract: w for contract, w in target_weights.loc[portfolio.name].items() if w > 0}
+        values = {contract: float(position.quantity) * float(prices[contract])
+                  for contract, position in portfolio.positions.items()}
+        nav = sum(values.values()) + cash[portfolio.name]
+        portfolio_trades = {}
+        for contract in set(targets) | set(values):
+            quantity = float(portfolio.positions[contract].quantity) if contract in portfolio.positions else 0.0
+            weight = targets.get(contract, 0.0)
+            if weight == 0:
+                portfolio_trades[contract] = -quantity
+            elif abs(values.get(contract, 0.0) / nav - weight) > DRIFT_BAND:
+                trade = math.trunc(weight * nav / float(prices[contract]) - quantity)
+                if abs(trade * float(prices[contract])) >= MIN_TRADE_VALUE:
+                    portfolio_trades[contract] = trade
+        trades[portfolio.name] = portfolio_trades
+    return trades
+
+
+def run(n: int, rng: np.random.Generator, contracts: list, prices: dict):
+    portfolios, weights, cash = [], np.zeros((n, len(contracts))), {}
+    for i in range(n):
+        held = rng.choice(len(contracts), POSITIONS_PER_PORTFOLIO, replace=False)
+        portfolios.append(Portfolio(name=f"portfolio_{i}", positions={
+            contracts[j]: Position(contracts[j], Decimal(int(q)), Decimal('100'))
+            for j, q in zip(held.tolist(), rng.integers(10, 1_000, len(held)))
+        }))
+        targeted = np.concatenate([held[:POSITIONS_PER_PORTFOLIO - 10],
+                                   rng.choice(len(contracts), 10, replace=False)])
+        weights[i, targeted] = rng.dirichlet(np.ones(len(targeted))) * 0.98
+        cash[portfolios[-1].name] = float(rng.uniform(0, 10_000))
+    target_weights = pd.DataFrame(weights, index=[p.name for p in portfolios], columns=contracts)
+
+    rebalancer = Rebalancer(drift_band=DRIFT_BAND, min_trade_value=MIN_TRADE_VALUE)
+    timed("loop, per position", n, loop_trades, portfolios, target_weights, prices, cash)
+    plan = timed("rebalancer, plan", n, rebalancer.plan, portfolios, target_weights, prices, cash)
+    orders = timed("rebalancer, orders", n, plan.orders)
+    print(f"{sum(len(o) for o in orders.values())} orders")
+
+
+def main():
+    rng = np.random.default_rng(42)
+    contracts = [Contract(instrument_id=str(i)) for i in range(UNIVERSE_SIZE)]
+    prices = {contract: float(p) for contract, p in zip(contracts, rng.uniform(10, 500, UNIVERSE_SIZE).round(2))}
+    for n in PORTFOLIO_COUNTS:
+        run(n, rng, contracts, prices)
+        print()
+
+
+if __name__ == "__main__":
+    main()
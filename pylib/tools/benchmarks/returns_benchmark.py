@@ -0,0 +1,70 @@
+import time
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from pylib.tools.performance.returns import ReturnsEngine
+
+SERIES_COUNTS = (100, 1_000, 5_000)
+DATES = pd.bdate_range('2020-01-01', '2024-12-31')
+FLOW_PROBABILITY = 0.05
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<32} {:>5} series: {:9.2f} ms'.format(label, n, (te - ts) * 1e3))
+    return result
+
+
+def generate_frames(n: int, rng: np.random.Generator):
+    """Random walk market values with occasional inflows, in the long format of the queriers"""
+    inflows = np.where(rng.random((len(DATES), n)) < FLOW_PROBABILITY, rng.uniform(1e3, 1e5, (len(DATES), n)), 0.0)
+    inflows[0] = rng.uniform(1e5, 1e6, n)
+    market_values = np.cumsum(inflows, axis=0) * np.cumprod(1.0 + rng.normal(0.0003, 0.01, (len(DATES), n)), axis=0)
+
+    dates = np.repeat(DATES.values, n)
+    portfolio_sks = np.tile(np.arange(n), len(DATES))
+    market_value_frame = DataFrame({
+        'position_date': dates, 'portfolio_sk': portfolio_sks, 'market_value': market_values.ravel()})
+    has_flow = inflows.ravel() > 0
+    flow_frame = DataFrame({
+        'trade_date': dates[has_flow], 'portfolio_sk': portfolio_sks[has_flow], 'inflow': inflows.ravel()[has_flow],
+        'outflow': 0.0})
+    return market_value_frame, flow_frame
+
+
+def rebuild(market_values: DataFrame, flows: DataFrame) -> ReturnsEngine:
+    """Inception to date recomputation, what a nightly run without a cache does"""
+    engine = ReturnsEngine()
+    engine.extend(market_values, flows)
+    return engine
+
+
+def run(n: int, rng: np.random.Generator):
+    market_values, flows = generate_frames(n, rng)
+    last_date = DATES[-1]
+    history = market_values['position_date'] < last_date
+
+    engine = timed("rebuild since inception", n, rebuild, market_values, flows)
+    cached = rebuild(market_values[history], flows[flows['trade_date'] < last_date])
+    timed("extend by one day", n, cached.extend, market_values[~history], flows[flows['trade_date'] == last_date])
+    timed("twr since inception", n, cached.twr)
+    timed("modified dietz since inception", n, cached.modified_dietz)
+    timed("irr since inception", n, cached.irr)
+    print('{:<32} {:>5} series: {:.2e}'.format(
+        "max twr difference", n, float(np.abs(engine.twr() - cached.twr()).max())))
+
+
+def main():
+    rng = np.random.default_rng(42)
+    for n in SERIES_COUNTS:
+        run(n, rng)
+        print()
+
+
+if __name__ == "__main__":
+    main()
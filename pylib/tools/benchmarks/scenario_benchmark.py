@@ -0,0 +1,112 @@
+import time
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+from pylib.library.config.enumerations import ShockType
+from pylib.library.contract.contract import Contract
+from pylib.library.position.position import Position
+from pylib.library.portfolio.portfolio import Portfolio
+from pylib.tools.risk.exposure_engine import ExposureEngine
+from pylib.tools.risk.scenario_engine import Scenario, ScenarioEngine, ScenarioSet, Shock
+
+INSTRUMENT_COUNT = 5_000
+SCENARIO_COUNTS = (100, 1_000, 5_000)
+PORTFOLIO_COUNT = 50
+POSITIONS_PER_PORTFOLIO = 200
+SECTORS = [f'Sector_{i}' for i in range(11)]
+COUNTRIES = [f'C{i:02d}' for i in range(20)]
+CURRENCIES = ['CAD', 'USD', 'EUR', 'GBP', 'JPY']
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<40} {:>5} scenarios: {:9.2f} ms'.format(label, n, (te - ts) * 1e3))
+    return result
+
+
+def loop_pnl(portfolios: list, scenario_set: ScenarioSet, attributes: dict, durations: dict, prices: dict) -> dict:
+    """Revalue every position of every portfolio scenario by scenario"""
+    pnl = {}
+    for scenario in scenario_set.scenarios:
+        for portfolio in portfolios:
+            total = 0.0
+            for contract, position in portfolio.positions.items():
+                instrument = attributes[contract.instrument_id]
+                price_shock = fx_shock = yield_shift = 0.0
+                for shock in scenario.shocks:
+                    if instrument.get(shock.attribute) != shock.category:
+                        continue
+                    if shock.shock_type == ShockType.PRICE:
+                        price_shock += shock.value
+                    elif shock.shock_type == ShockType.FX:
+                        fx_shock += shock.value
+                    else:
+                        yield_shift += shock.value
+                value = float(position.quantity) * prices[contract]
+                duration = durations.get(contract.instrument_id, 0.0)
+                total += value * ((1 + price_shock - duration * yield_shift) * (1 + fx_shock) - 1)
+            pnl[scenario.name, portfolio.name] = total
+    return pnl
+
+
+def run(n: int, rng: np.random.Generator, engine: ScenarioEngine, portfolios: list, attributes: pd.DataFrame,
+        durations: dict, prices: dict):
+    scenarios = [Scenario(f'scenario_{i}', [
+        Shock(ShockType.PRICE, float(rng.normal(0, 0.1)), 'sector_name', sector) for sector in SECTORS
+    ] + [
+        Shock(ShockType.FX, float(rng.normal(0, 0.05)), 'currency_code', currency) for currency in CURRENCIES
+    ] + [
+        Shock(ShockType.CURVE, float(rng.normal(0, 0.005)), 'country_code', country) for country in COUNTRIES[:5]
+    ]) for i in range(n)]
+    scenario_set = ScenarioSet('benchmark', n, scenarios)
+
+    if n <= 100:
+        by_id = attributes.set_index('instrument_id').to_dict('index')
+        timed("loop, scenario by scenario", n, loop_pnl, portfolios, scenario_set, by_id, durations, prices)
+    timed("engine, compile and revalue", n, engine.scenario_pnl, portfolios, scenario_set, prices)
+    timed("engine, cached", n, engine.scenario_pnl, portfolios, scenario_set, prices)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    issuer_sks = rng.integers(0, 1_000, INSTRUMENT_COUNT)
+    attributes = pd.DataFrame({
+        'instrument_id': [str(i) for i in range(INSTRUMENT_COUNT)],
+        'classification_level_1': rng.choice(['Equity', 'Fixed Income'], INSTRUMENT_COUNT),
+        'classification_level_2': rng.choice([f'L2_{i}' for i in range(12)], INSTRUMENT_COUNT),
+        'classification_level_3': rng.choice([f'L3_{i}' for i in range(60)], INSTRUMENT_COUNT),
+        'issuer_sk': issuer_sks,
+        'issuer_name': [f'Issuer_{sk}' for sk in issuer_sks.tolist()],
+        'sector_name': rng.choice(SECTORS, INSTRUMENT_COUNT),
+        'country_code': rng.choice(COUNTRIES, INSTRUMENT_COUNT),
+        'currency_code': rng.choice(CURRENCIES, INSTRUMENT_COUNT),
+    })
+    durations = {
+        instrument_id: float(duration) for instrument_id, duration, level_1 in zip(
+            attributes['instrument_id'], rng.uniform(0.5, 15, INSTRUMENT_COUNT), attributes['classification_level_1'])
+        if level_1 == 'Fixed Income'
+    }
+    contracts = [Contract(instrument_id=str(i)) for i in range(INSTRUMENT_COUNT)]
+    prices = {contract: float(p) for contract, p in zip(contracts, rng.uniform(10, 500, INSTRUMENT_COUNT).round(2))}
+    portfolios = []
+    for i in range(PORTFOLIO_COUNT):
+        held = rng.choice(INSTRUMENT_COUNT, POSITIONS_PER_PORTFOLIO, replace=False)
+        portfolios.append(Portfolio(name=f"portfolio_{i}", positions={
+            contracts[j]: Position(contracts[j], Decimal(int(q)), Decimal('100'))
+            for j, q in zip(held.tolist(), rng.integers(1, 1_000, len(held)))
+        }))
+
+    engine = ScenarioEngine(ExposureEngine(attributes), durations)
+    print(f"{PORTFOLIO_COUNT} portfolios x {POSITIONS_PER_PORTFOLIO} positions, loop timed up to 100 scenarios")
+    for n in SCENARIO_COUNTS:
+        run(n, rng, engine, portfolios, attributes, durations, prices)
+        print()
+
+
+if __name__ == "__main__":
+    main()
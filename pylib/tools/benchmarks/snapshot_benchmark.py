@@ -0,0 +1,85 @@
+import tempfile
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+import numpy as np
+
+from pylib.library.contract.contract import Contract
+from pylib.library.position.position import Position
+from pylib.library.position.tax_lot import TaxLotLedger
+from pylib.library.order.order import Order
+from pylib.library.portfolio.portfolio import Portfolio
+from pylib.library.portfolio.portfolio_snapshot import save_portfolio_snapshot, load_portfolio_snapshot
+from pylib.library.config.enumerations import OrderType
+
+POSITION_COUNTS = (1_000, 10_000, 50_000)
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<36} {:>7} positions: {:8.2f} ms'.format(label, n, (te - ts) * 1e3))
+    return result
+
+
+def fact_position_rows(n: int, rng: np.random.Generator) -> list:
+    """Rows shaped like the fact_position / dim_instrument query results, with Decimal measures"""
+    return [
+        {
+            'instrument_id': f'{i:08d}-0000-0000-0000-000000000000',
+            'instrument_code': f'SYM{i}',
+            'currency_code': 'USD',
+            'classification_level_1': 'Equity',
+            'quantity': Decimal(int(q)),
+            'average_cost': Decimal(str(c)),
+            'position_date': date(2024, 1, 2),
+        }
+        for i, (q, c) in enumerate(zip(rng.integers(1, 1_000, n), rng.uniform(10, 500, n).round(4)))
+    ]
+
+
+def rebuild_from_rows(rows: list) -> Portfolio:
+    """Rebuild a portfolio one fact_position row at a time"""
+    portfolio = Portfolio(name="rebuilt", lots=TaxLotLedger())
+    for row in rows:
+        contract = Contract(instrument_id=row['instrument_id'], symbol=row['instrument_code'],
+                            currency_code=row['currency_code'],
+                            classification_level_1=row['classification_level_1'])
+        portfolio.add_position(Position(contract, row['quantity'], row['average_cost'],
+                                        datetime.combine(row['position_date'], datetime.min.time())))
+    return portfolio
+
+
+def run(n: int, rng: np.random.Generator):
+    rows = fact_position_rows(n, rng)
+    portfolio = timed("rebuild from fact_position rows", n, rebuild_from_rows, rows)
+    for contract in list(portfolio.positions)[:n // 10]:
+        portfolio.add_order(Order(contract, OrderType.LIMIT, 'BUY', Decimal(10), limit_price=Decimal('12.5')))
+
+    with tempfile.TemporaryDirectory() as path:
+        timed("snapshot", n, save_portfolio_snapshot, portfolio, path)
+        restored = timed("restore", n, load_portfolio_snapshot, path)
+
+    if len(restored.positions) != len(portfolio.positions) or len(restored.orders) != len(portfolio.orders):
+        raise AssertionError("Restored portfolio differs from the original")
+    if not np.array_equal(restored.book.quantities, portfolio.book.quantities):
+        raise AssertionError("Restored quantities differ from the original")
+    for contract in list(portfolio.positions)[::max(n // 100, 1)]:
+        original, copy = portfolio.positions[contract], restored.positions[contract]
+        if (copy.quantity, copy.average_cost, type(copy.contract)) != (original.quantity, original.average_cost,
+                                                                       type(original.contract)):
+            raise AssertionError(f"Restored position of {contract.symbol} differs from the original")
+
+
+def main():
+    rng = np.random.default_rng(42)
+    for n in POSITION_COUNTS:
+        run(n, rng)
+        print()
+
+
+if __name__ == "__main__":
+    main()
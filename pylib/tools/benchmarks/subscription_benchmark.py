@@ -0,0 +1,76 @@
+import queue
+import threading
+import time
+
+import numpy as np
+
+from pylib.library.market_data.market_data_manager import MarketDataManager
+
+TICK_COUNTS = (10_000, 100_000)
+SYMBOL_COUNT = 500
+CONSUMER_DELAY = 0.001  # seconds spent by the slow consumer on each update
+QUEUE_SIZE = 1_000
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<40} {:>7} ticks: {:9.2f} ms ({:.2f} us per tick)'.format(label, n, (te - ts) * 1e3,
+                                                                       (te - ts) * 1e6 / n))
+    return result
+
+
+def slow_consumer(symbol: str, quotes: dict):
+    time.sleep(CONSUMER_DELAY)
+
+
+def bounded_queue_ticks(symbols: list, prices: list):
+    """Slow consumer behind a bounded queue: the publisher blocks once the queue is full"""
+    updates = queue.Queue(maxsize=QUEUE_SIZE)
+    stop = object()
+
+    def consume():
+        while updates.get() is not stop:
+            slow_consumer('', {})
+
+    thread = threading.Thread(target=consume, daemon=True)
+    thread.start()
+    for symbol, price in zip(symbols, prices):
+        updates.put((symbol, 'last', price))
+    updates.put(stop)
+    thread.join()
+
+
+def conflated_ticks(manager: MarketDataManager, symbols: list, prices: list):
+    for symbol, price in zip(symbols, prices):
+        manager.store_market_data(symbol, 'last', price)
+
+
+def run(n: int, rng: np.random.Generator):
+    symbols = [f'S{code}' for code in rng.integers(0, SYMBOL_COUNT, n).tolist()]
+    prices = (100.0 + np.cumsum(rng.normal(0, 0.01, n))).tolist()
+
+    if n * CONSUMER_DELAY <= 20:
+        timed("bounded queue, slow consumer", n, bounded_queue_ticks, symbols, prices)
+
+    manager = MarketDataManager()
+    timed("no subscription", n, conflated_ticks, manager, symbols, prices)
+    manager.subscribe('slow', callback=slow_consumer)
+    manager.subscribe('polled', symbols[:50])
+    timed("conflated, slow and polled consumers", n, conflated_ticks, manager, symbols, prices)
+    print(manager.subscription_stats())
+    for subscription in list(manager.subscriptions):
+        manager.unsubscribe(subscription)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    for n in TICK_COUNTS:
+        run(n, rng)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import time
+from collections import deque
+
+import numpy as np
+
+from pylib.library.market_data.market_data_manager import MarketDataManager
+
+TICK_COUNTS = (10_000, 100_000, 1_000_000)
+TICK_HISTORY = 50_000
+TICKS_PER_SECOND = 1_000
+WINDOW_SECONDS = 5.0
+READS = 100
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<40} {:>8} ticks: {:9.2f} ms'.format(label, n, (te - ts) * 1e3))
+    return result
+
+
+def deque_appends(history: deque, prices: list, timestamps: list):
+    for timestamp, price in zip(timestamps, prices):
+        history.append((timestamp, 4, price, np.nan))
+
+
+def deque_windows(history: deque, now: int):
+    start = now - int(WINDOW_SECONDS * 1e9)
+    for _ in range(READS):
+        [tick for tick in history if tick[0] >= start]
+
+
+def buffer_appends(manager: MarketDataManager, prices: list, timestamps: list):
+    buffer = manager.tick_buffers['SYM']
+    for timestamp, price in zip(timestamps, prices):
+        buffer.append(4, price, timestamp=timestamp)
+
+
+def manager_ticks(manager: MarketDataManager, prices: list):
+    for price in prices:
+        manager.store_market_data('SYM', 'last', price)
+
+
+def buffer_windows(manager: MarketDataManager, now: int):
+    buffer = manager.tick_buffers['SYM']
+    for _ in range(READS):
+        buffer.since(WINDOW_SECONDS, now)
+
+
+def run(n: int, rng: np.random.Generator):
+    prices = (100.0 + np.cumsum(rng.normal(0, 0.01, n))).tolist()
+    timestamps = (time.time_ns() + np.arange(n) * (10 ** 9 // TICKS_PER_SECOND)).tolist()
+    now = timestamps[-1]
+
+    history = deque(maxlen=TICK_HISTORY)
+    timed("deque, append", n, deque_appends, history, prices, timestamps)
+    timed(f"deque, {READS} reads of {WINDOW_SECONDS:g}s", n, deque_windows, history, now)
+
+    manager = MarketDataManager(tick_history=TICK_HISTORY)
+    manager.store_market_data('SYM', 'last', prices[0])
+    timed("ring buffer, append", n, buffer_appends, manager, prices, timestamps)
+    timed(f"ring buffer, {READS} reads of {WINDOW_SECONDS:g}s", n, buffer_windows, manager, now)
+    timed("manager, store_market_data", n, manager_ticks, manager, prices)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    for n in TICK_COUNTS:
+        run(n, rng)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import csv
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from pylib.library.market_data.tick_recorder import NS_PER_DAY, TickLogReader, TickRecorder
+
+TICK_COUNTS = (100_000, 1_000_000)
+SYMBOL_COUNT = 300
+SESSION_NS = 6 * 3600 * 10 ** 9  # ticks spread over a session
+
+
+def timed(label: str, n: int, method, *args):
+    """Run method once and print its elapsed time"""
+    ts = time.perf_counter()
+    result = method(*args)
+    te = time.perf_counter()
+    print('{:<40} {:>8} ticks: {:9.2f} ms ({:.2f} us per tick)'.format(label, n, (te - ts) * 1e3,
+                                                                       (te - ts) * 1e6 / n))
+    return result
+
+
+def csv_ticks(path: str, symbols: list, prices: list, timestamps: list):
+    """Text log written line by line, as a naive recorder would"""
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.writer(csv_file)
+        for symbol, price, timestamp in zip(symbols, prices, timestamps):
+            writer.writerow((timestamp, symbol, 'last', price))
+
+
+def csv_read(path: str, symbol: str, start: int, end: int) -> list:
+    with open(path, newline='') as csv_file:
+        return [row for row in csv.reader(csv_file) if row[1] == symbol and start <= int(row[0]) < end]
+
+
+def recorded_ticks(root: str, symbols: list, prices: list, timestamps: list):
+    recorder = TickRecorder(root)
+    for symbol, price, timestamp in zip(symbols, prices, timestamps):
+        recorder.record(symbol, 'last', price, timestamp)
+    recorder.close()
+
+
+def run(n: int, rng: np.random.Generator):
+    root = tempfile.mkdtemp()
+    try:
+        symbols = [f'S{code}' for code in rng.integers(0, SYMBOL_COUNT, n).tolist()]
+        prices = (100.0 + np.cumsum(rng.normal(0, 0.01, n))).tolist()
+        start = 19_000 * NS_PER_DAY + 14 * 3600 * 10 ** 9
+        timestamps = (start + np.arange(n) * (SESSION_NS // n)).tolist()
+        window = (start + SESSION_NS // 3, start + SESSION_NS // 2)
+
+        csv_path = os.path.join(root, 'ticks.csv')
+        timed("csv, write", n, csv_ticks, csv_path, symbols, prices, timestamps)
+        timed("csv, read one symbol over an hour", n, csv_read, csv_path, 'S7', *window)
+
+        timed("binary log, write", n, recorded_ticks, os.path.join(root, 'log'), symbols, prices, timestamps)
+        reader = TickLogReader(os.path.join(root, 'log'))
+        timed("binary log, read one symbol over an hour", n, reader.read, *window, ['S7'])
+        timed("binary log, read the session", n, reader.read, start, start + SESSION_NS)
+    finally:
+        shutil.rmtree(root)
+
+
+def main():
+    rng = np.random.default_rng(42)
+    for n in TICK_COUNTS:
+        run(n, rng)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Sequence, Set, Union
+
+import numpy as np
+
+from pylib.library.contract.contract import Contract
+from pylib.library.order.order import Order
+from pylib.library.portfolio.portfolio import Portfolio
+from pylib.tools.risk.exposure_engine import ExposureEngine
+
+
+@dataclass
+class ExposureLimit:
+    """
+    Cap on the weight of each category of an instrument attribute, e.g. 5% per issuer_sk, 25% per sector_name or
+    40% in USD for currency_code. Issuer caps are set on issuer_sk, issuer_name only labels issuers and may be
+    shared by distinct issuers.
+    """
+    attribute: str
+    max_weight: float = np.inf  # cap of the categories without their own limit
+    category_limits: Dict[Any, float] = field(default_factory=dict)  # e.g. by issuer_sk or currency_code
+    name: Optional[str] = None
+
+    @property
+    def rule_name(self) -> str:
+        return self.name or f'max_{self.attribute}_weight'
+
+
+@dataclass
+class RestrictedList:
+    """
+    Instruments that cannot be bought, nor sold unless sells are allowed
+    """
+    instrument_ids: Set[str]
+    allow_sells: bool = True
+    name: str = 'restricted_list'
+
+    @property
+    def rule_name(self) -> str:
+        return self.name
+
+
+ComplianceRule = Union[ExposureLimit, RestrictedList]
+
+
+@dataclass
+class ComplianceBreach:
+    """Rule breached by a proposed order"""
+    rule_name: str
+    category: str
+    weight: float  # weight of the category after the order, nan for restricted instruments, inf if the NAV is <= 0
+    limit: float
+
+
+class ComplianceError(Exception):
+    """Raised when a proposed order breaches compliance rules"""
+    def __init__(self, breaches: List[ComplianceBreach]):
+        self.breaches = breaches
+        super().__init__("; ".join(
+            f"{breach.rule_name} breached by {breach.category}" +
+            ("" if np.isnan(breach.weight) else f" ({breach.weight:.2%} > {breach.limit:.2%})")
+            for breach in breaches
+        ))
+
+
+@dataclass
+class CompiledLimit:
+    """Exposure limit resolved to the category codes of the instrument attribute rows"""
+    rule_name: str
+    codes: np.ndarray  # category code of each attribute row
+    limits: np.ndarray  # weight limit of each category, inf if unlimited
+    categories: List[str]
+
+
+class ComplianceEngine:
+    """
+    Pre-trade compliance rules compiled against the instrument attribute codes of an ExposureEngine
+
+    Exposure limits are resolved once into a category code per instrument and a weight limit per category, restricted
+    lists into a dictionary of the restricted instrument ids. Checking an order against a PortfolioCompliance then
+    only reads and compares a few array elements per rule, without any reference data lookup.
+    """
+    def __init__(self, exposure_engine: ExposureEngine, rules: Sequence[ComplianceRule]):
+        """
+        Compile the rules
+
+        Args:
+            exposure_engine: Encoded instrument attributes
+            rules: Exposure limits and restricted lists
+
+        Raises:
+            ValueError: If a limit is set on an attribute that is not encoded
+        """
+        self.exposure_engine = exposure_engine
+        self.rules = list(rules)
+        self.limits: List[CompiledLimit] = []
+        self.restricted: Dict[str, RestrictedList] = {}  # restricted list of each restricted instrument id
+
+        for rule in self.rules:
+            if isinstance(rule, RestrictedList):
+                self.restricted.update((str(instrument_id).lower(), rule) for instrument_id in rule.instrument_ids)
+                continue
+
+            if rule.attribute not in exposure_engine.codes:
+                raise ValueError(f"Cannot set a limit on {rule.attribute}, it is not an encoded instrument attribute")
+            categories = exposure_engine.categories[rule.attribute]
+            limits = np.full(len(categories), rule.max_weight, dtype=np.float64)
+            limits[-1] = np.inf  # unclassified instruments are only limited by an explicit UNCLASSIFIED limit
+            for code, category in enumerate(categories):
+                if category in rule.category_limits:
+                    limits[code] = rule.category_limits[category]
+            self.limits.append(CompiledLimit(rule.rule_name, exposure_engine.codes[rule.attribute], limits, categories))
+
+    def restriction_breach(self, order: Order, value: float) -> Optional[ComplianceBreach]:
+        """Breach of a restricted list by an order of a signed value, None if the instrument is not restricted"""
+        rule = self.restricted.get(str(order.instrument.instrument_id).lower())
+        if rule is None or (value <= 0 and rule.allow_sells):
+            return None
+        return ComplianceBreach(rule.rule_name, str(order.instrument.instrument_id), np.nan, 0.0)
+
+    def portfolio(
+            self,
+            portfolio: Portfolio,
+            prices: Optional[Dict[Contract, float]] = None,
+            cash: float = 0.0
+    ) -> 'PortfolioCompliance':
+        """
+        Exposure state of a portfolio to check orders against
+
+        Raises:
+            ValueError: If prices are not given and a position has no live price, see ExposureEngine.flatten
+        """
+        return PortfolioCompliance(self, portfolio, prices, cash)
+
+
+def order_value(order: Order, price: Union[float, Decimal]) -> float:
+    """Signed value of an order, positive for buys, including the contract multiplier"""
+    multiplier = float(getattr(order.instrument, 'multiplier', None) or 1)
+    value = float(order.quantity) * float(price) * multiplier
+    return value if order.side == 'BUY' else -value
+
+
+class PortfolioCompliance:
+    """
+    Category exposures of one portfolio under every compiled limit, kept up to date as orders are applied
+
+    Orders are assumed to be settled against cash, so that the NAV is unchanged by a trade. An order breaches a limit
+    when it takes the absolute weight of a category above its limit, orders reducing an existing excess are allowed.
+    """
+    def __init__(
+            self,
+            engine: ComplianceEngine,
+            portfolio: Portfolio,
+            prices: Optional[Dict[Contract, float]] = None,
+            cash: float = 0.0
+    ):
+        """
+        Args:
+            engine: Compiled rules
+            portfolio: Portfolio whose orders are checked
+            prices: Price of each contract held, the live market values of the position book by default, which then
+                need a live price for every position
+            cash: Cash held by the portfolio
+
+        Raises:
+            ValueError: If prices are not given and a position has no live price, the NAV would be understated
+        """
+        self.engine = engine
+        self.portfolio = portfolio
+        self.cash = cash
+        self.refresh(prices)
+
+    def refresh(self, prices: Optional[Dict[Contract, float]] = None, cash: Optional[float] = None):
+        """
+        Recompute the exposures and the NAV from the portfolio positions, e.g. after new prices
+
+        Raises:
+            ValueError: If prices are not given and a position has no live price
+        """
+        if cash is not None:
+            self.cash = cash
+        _, rows, values = self.engine.exposure_engine.flatten([self.portfolio], prices)
+        self.nav = float(values.sum()) + self.cash
+        self.exposures = [
+            np.bincount(limit.codes[rows], weights=values, minlength=len(limit.categories))
+            for limit in self.engine.limits
+        ]
+
+    def check(self, order: Order, price: Union[float, Decimal]) -> List[ComplianceBreach]:
+        """
+        Check a proposed order
+
+        Args:
+            order: Proposed order
+            price: Expected execution price
+
+        Returns:
+            Rules breached by the order, empty if it is compliant. With a NAV of zero or less, every order increasing
+            a limited exposure breaches it, at an infinite weight
+        """
+        engine = self.engine
+        row = engine.exposure_engine.row_of(order.instrument)
+        value = order_value(order, price)
+
+        breach = engine.restriction_breach(order, value)
+        breaches = [] if breach is None else [breach]
+        for limit, exposures in zip(engine.limits, self.exposures):
+            code = limit.codes[row]
+            before = exposures[code]
+            weight = abs(before + value) / self.nav if self.nav > 0 else np.inf
+            if weight > limit.limits[code] and abs(before + value) > abs(before):
+                breaches.append(ComplianceBreach(limit.rule_name, str(limit.categories[code]), float(weight),
+                                                 float(limit.limits[code])))
+        return breaches
+
+    def enforce(self, order: Order, price: Union[float, Decimal]):
+        """
+        Check a proposed order, e.g. as the pre-trade check of IBAPIClient.submit_order
+
+        Raises:
+            ComplianceError: If the order breaches a rule
+        """
+        breaches = self.check(order, price)
+        if breaches:
+            raise ComplianceError(breaches)
+
+    def check_orders(
+            self,
+            orders: Sequence[Order],
+            prices: Dict[Contract, Union[float, Decimal]]
+    ) -> List[ComplianceBreach]:
+        """
+        Check a basket of orders as a whole, e.g. a rebalancing, the exposures after all the orders are compared to
+        the limits
+
+        Args:
+            orders: Proposed orders
+            prices: Expected execution price of each contract traded
+
+        Returns:
+            Rules breached by the basket, empty if it is compliant, with a NAV of zero or less see check
+        """
+        engine = self.engine
+        rows = np.array([engine.exposure_engine.row_of(order.instrument) for order in orders], dtype=np.int64)
+        values = np.array([order_value(order, prices[order.instrument]) for order in orders], dtype=np.float64)
+
+        breaches = [engine.restriction_breach(order, value) for order, value in zip(orders, values.tolist())]
+        breaches = [breach for breach in breaches if breach is not None]
+        for limit, exposures in zip(engine.limits, self.exposures):
+            delta = np.bincount(limit.codes[rows], weights=values, minlength=len(limit.categories))
+            before = np.abs(exposures)
+            after = np.abs(exposures + delta)
+            weights = after / self.nav if self.nav > 0 else np.full_like(after, np.inf)
+            for code in np.flatnonzero((weights > limit.limits) & (after > before)).tolist():
+                breaches.append(ComplianceBreach(limit.rule_name, str(limit.categories[code]), float(weights[code]),
+                                                 float(limit.limits[code])))
+        return breaches
+
+    def apply(self, order: Order, price: Union[float, Decimal]):
+        """Add a filled order to the exposures"""
+        row = self.engine.exposure_engine.row_of(order.instrument)
+        value = order_value(order, price)
+        for limit, exposures in zip(self.engine.limits, self.exposures):
+            exposures[limit.codes[row]] += value
+        self.cash -= value
@@ -0,0 +1,335 @@
+import json
+import os
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame, Series
+
+# Days per year used to annualize money-weighted returns
+DAYS_PER_YEAR = 365.0
+
+IRR_MAX_ITERATIONS = 50
+IRR_TOLERANCE = 1e-10
+
+STATE_ARRAYS = ('market_values', 'inflows', 'outflows', 'growth', 'cumulative_flows', 'cumulative_weighted_flows')
+
+
+class ReturnsEngine:
+    """
+    Daily time-weighted, Modified Dietz and money-weighted returns of a set of series (portfolios or portfolio x
+    classification buckets), computed on dates x series matrices.
+
+    Flows are the trades of a series: buys are inflows, assumed to happen at the start of the day, and sales are
+    outflows, assumed to happen at the end of the day, so that the daily return is
+    r_t = (MV_t - MV_t-1 - F_t) / (MV_t-1 + inflows_t), with F_t the net flow. Dates without market value are valued
+    at zero, a series holding nothing has a zero return. The first cached date is the base date of the returns, a
+    series first seen later starts from a zero market value.
+
+    The engine caches, per date and series, the market value, the cumulative TWR growth factor and the cumulative
+    sums of the net flows and of the flows weighted by their day number. Appending a day only computes that day's row,
+    and a TWR or Modified Dietz return between any two cached dates is then read from the cumulative series in
+    O(series). The cache can be saved and loaded so that a nightly run only appends the new day.
+    """
+    def __init__(self, key_columns: Sequence[str] = ('portfolio_sk',), capacity: int = 256):
+        """
+        Initialize an empty engine
+
+        Args:
+            key_columns: Columns identifying a series in the market value and flow frames
+            capacity: Number of dates to preallocate, the arrays double in size when full
+        """
+        self.key_columns = list(key_columns)
+        self.keys: List[Tuple] = []
+        self._column_by_key: Dict[Tuple, int] = {}
+
+        capacity = max(int(capacity), 1)
+        self._dates = np.zeros(capacity, dtype='datetime64[D]')
+        self._arrays: Dict[str, np.ndarray] = {name: np.zeros((capacity, 0)) for name in STATE_ARRAYS}
+        self._size = 0
+
+    @property
+    def dates(self) -> pd.DatetimeIndex:
+        """Dates cached, in increasing order"""
+        return pd.DatetimeIndex(self._dates[:self._size])
+
+    def _matrix(self, name: str) -> DataFrame:
+        return DataFrame(self._arrays[name][:self._size], index=self.dates,
+                         columns=pd.MultiIndex.from_tuples(self.keys, names=self.key_columns))
+
+    @property
+    def market_values(self) -> DataFrame:
+        """Market values, dates x series"""
+        return self._matrix('market_values')
+
+    @property
+    def daily_returns(self) -> DataFrame:
+        """Daily time-weighted returns, dates x series"""
+        growth = self._arrays['growth'][:self._size]
+        previous = np.vstack([np.ones((1, len(self.keys))), growth[:-1]])
+        return DataFrame(growth / previous - 1.0, index=self.dates,
+                         columns=pd.MultiIndex.from_tuples(self.keys, names=self.key_columns))
+
+    def cumulative_returns(self) -> DataFrame:
+        """Time-weighted returns since the first cached date, dates x series"""
+        return self._matrix('growth') - 1.0
+
+    def _grow(self, size: int):
+        capacity = len(self._dates)
+        while capacity < size:
+            capacity *= 2
+        if capacity == len(self._dates):
+            return
+        self._dates = np.resize(self._dates, capacity)
+        for name, array in self._arrays.items():
+            grown = np.zeros((capacity, array.shape[1]))
+            grown[:self._size] = array[:self._size]
+            self._arrays[name] = grown
+
+    def _add_keys(self, keys: Sequence[Tuple]):
+        """Add columns for series not seen yet, with a zero history and a growth factor of 1"""
+        new_keys = [
+            tuple(value.item() if isinstance(value, np.generic) else value for value in key)
+            for key in keys if key not in self._column_by_key
+        ]
+        if not new_keys:
+            return
+        for key in new_keys:
+            self._column_by_key[key] = len(self.keys)
+            self.keys.append(key)
+        for name, array in self._arrays.items():
+            padding = np.ones if name == 'growth' else np.zeros
+            self._arrays[name] = np.hstack([array, padding((len(array), len(new_keys)))])
+
+    def _pivot(self, frame: DataFrame, date_column: str, value_column: str, dates: np.ndarray) -> np.ndarray:
+        """Sum a value column into a dates x series matrix, dates between two cached dates map to the next one"""
+        matrix = np.zeros((len(dates), len(self.keys)))
+        if frame.empty:
+            return matrix
+        date_index = np.searchsorted(dates, pd.to_datetime(frame[date_column]).to_numpy().astype('datetime64[D]'))
+        columns = pd.MultiIndex.from_tuples(self.keys, names=self.key_columns) \
+            .get_indexer(pd.MultiIndex.from_frame(frame[self.key_columns]))
+        known = date_index < len(dates)
+        np.add.at(matrix, (date_index[known], columns[known]), frame[value_column].to_numpy(dtype=np.float64)[known])
+        return matrix
+
+    def extend(self, market_values: DataFrame, flows: Optional[DataFrame] = None):
+        """
+        Append the dates of a market value frame, after the last cached date
+
+        Args:
+            market_values: Market values with the key columns, position_date and market_value, e.g. fact_position rows
+            flows: Flows with the key columns, trade_date, inflow and outflow. Flows dated between the last cached
+                date and a new date are applied on the new date, flows after the last new date are ignored
+
+        Raises:
+            ValueError: If a date is not after the last cached date
+        """
+        dates = np.unique(pd.to_datetime(market_values['position_date']).to_numpy().astype('datetime64[D]'))
+        if len(dates) == 0:
+            return
+        if self._size and dates[0] <= self._dates[self._size - 1]:
+            raise ValueError(f"Dates must be after the last cached date {self._dates[self._size - 1]}")
+        if flows is None:
+            flows = DataFrame(columns=self.key_columns + ['trade_date', 'inflow', 'outflow'])
+        if self._size:
+            flows = flows[pd.to_datetime(flows['trade_date']).to_numpy() > self._dates[self._size - 1]]
+
+        self._add_keys(list(pd.MultiIndex.from_frame(market_values[self.key_columns]).unique()))
+        self._add_keys(list(pd.MultiIndex.from_frame(flows[self.key_columns]).unique()))
+
+        new_market_values = self._pivot(market_values, 'position_date', 'market_value', dates)
+        inflows = self._pivot(flows, 'trade_date', 'inflow', dates)
+        outflows = self._pivot(flows, 'trade_date', 'outflow', dates)
+        net_flows = inflows - outflows
+
+        start, end = self._size, self._size + len(dates)
+        previous_market_values = self._last_row('market_values')
+        previous_growth = self._last_row('growth', 1.0)
+        days = (dates - self._origin(dates[0])).astype(np.float64)[:, None]
+
+        market_values_before = np.vstack([previous_market_values, new_market_values[:-1]])
+        denominator = market_values_before + inflows
+        gain = new_market_values - market_values_before - net_flows
+        daily_returns = np.divide(gain, denominator, out=np.zeros_like(gain), where=denominator > 0)
+        if start == 0:
+            daily_returns[0] = 0.0
+
+        self._grow(end)
+        self._dates[start:end] = dates
+        self._arrays['market_values'][start:end] = new_market_values
+        self._arrays['inflows'][start:end] = inflows
+        self._arrays['outflows'][start:end] = outflows
+        self._arrays['growth'][start:end] = previous_growth * np.cumprod(1.0 + daily_returns, axis=0)
+        self._arrays['cumulative_flows'][start:end] = \
+            self._last_row('cumulative_flows') + np.cumsum(net_flows, axis=0)
+        self._arrays['cumulative_weighted_flows'][start:end] = \
+            self._last_row('cumulative_weighted_flows') + np.cumsum(days * net_flows, axis=0)
+        self._size = end
+
+    def _origin(self, first_date: np.datetime64) -> np.datetime64:
+        """Day 0 of the weighted flows, the day before the first cached date"""
+        return (self._dates[0] if self._size else first_date) - np.timedelta64(1, 'D')
+
+    def _last_row(self, name: str, default: float = 0.0) -> np.ndarray:
+        if self._size == 0:
+            return np.full(len(self.keys), default)
+        return self._arrays[name][self._size - 1]
+
+    def _period(self, start: Optional[date], end: Optional[date]) -> Tuple[int, int]:
+        """
+        Indexes of the start and end dates of a period, the first and last cached dates by default
+
+        Raises:
+            ValueError: If a date is not cached
+        """
+        index = {}
+        for name, value in (('start', start), ('end', end)):
+            if value is None:
+                index[name] = 0 if name == 'start' else self._size - 1
+                continue
+            position = int(np.searchsorted(self._dates[:self._size], np.datetime64(value, 'D')))
+            if position == self._size or self._dates[position] != np.datetime64(value, 'D'):
+                raise ValueError(f"{value} is not a cached date")
+            index[name] = position
+        if index['end'] <= index['start']:
+            raise ValueError("The period end must be after its start")
+        return index['start'], index['end']
+
+    def _row(self, name: str, index: int) -> np.ndarray:
+        return self._arrays[name][index]
+
+    def _day(self, index: int) -> float:
+        return float((self._dates[index] - self._origin(self._dates[0])).astype(np.float64))
+
+    def _series(self, values: np.ndarray) -> Series:
+        return Series(values, index=pd.MultiIndex.from_tuples(self.keys, names=self.key_columns))
+
+    def twr(self, start: Optional[date] = None, end: Optional[date] = None) -> Series:
+        """
+        Time-weighted return of every series over a period
+
+        Args:
+            start: Date the period starts after, first cached date by default
+            end: Last date of the period, last cached date by default
+
+        Returns:
+            Series of returns indexed by series key
+        """
+        start_index, end_index = self._period(start, end)
+        return self._series(self._row('growth', end_index) / self._row('growth', start_index) - 1.0)
+
+    def modified_dietz(self, start: Optional[date] = None, end: Optional[date] = None) -> Series:
+        """
+        Modified Dietz return of every series over a period
+
+        A flow on day t is weighted (end - t) / (end - start). The weighted flow sum is read from the cumulative sums
+        of the flows and of the flows times their day number, so the period can be any pair of cached dates.
+
+        Args:
+            start: Date the period starts after, first cached date by default
+            end: Last date of the period, last cached date by default
+
+        Returns:
+            Series of returns indexed by series key, NaN when the average capital is not positive
+        """
+        start_index, end_index = self._period(start, end)
+        start_day, end_day = self._day(start_index), self._day(end_index)
+
+        flows = self._row('cumulative_flows', end_index) - self._row('cumulative_flows', start_index)
+        day_weighted_flows = \
+            self._row('cumulative_weighted_flows', end_index) - self._row('cumulative_weighted_flows', start_index)
+        weighted_flows = (end_day * flows - day_weighted_flows) / (end_day - start_day)
+
+        start_value = self._row('market_values', start_index)
+        end_value = self._row('market_values', end_index)
+        capital = start_value + weighted_flows
+        gain = end_value - start_value - flows
+        returns = np.divide(gain, capital, out=np.full_like(gain, np.nan), where=capital > 0)
+        return self._series(returns)
+
+    def irr(self, start: Optional[date] = None, end: Optional[date] = None, annualize: bool = True) -> Series:
+        """
+        Money-weighted return (IRR) of every series over a period
+
+        The cash flows of a series are its start market value and net flows paid in and its end market value paid out.
+        The rates solving NPV(r) = 0 are found by Newton iterations run on all the series at once, starting from the
+        annualized Modified Dietz return.
+
+        Args:
+            start: Date the period starts after, first cached date by default
+            end: Last date of the period, last cached date by default
+            annualize: Return the annual rate, otherwise the rate compounded over the period
+
+        Returns:
+            Series of returns indexed by series key, NaN where the iterations do not converge
+        """
+        start_index, end_index = self._period(start, end)
+        start_day, end_day = self._day(start_index), self._day(end_index)
+        period_years = (end_day - start_day) / DAYS_PER_YEAR
+
+        rows = slice(start_index + 1, end_index + 1)
+        days = (self._dates[rows] - self._origin(self._dates[0])).astype(np.float64)
+        cash_flows = -(self._arrays['inflows'][rows] - self._arrays['outflows'][rows])
+        cash_flows[-1] += self._arrays['market_values'][end_index]
+        cash_flows = np.vstack([-self._row('market_values', start_index)[None, :], cash_flows])
+        years = np.concatenate([[0.0], (days - start_day) / DAYS_PER_YEAR])[:, None]
+
+        guess = self.modified_dietz(start, end).to_numpy()
+        rates = np.where(np.isnan(guess), 0.0, np.power(np.maximum(1.0 + guess, 1e-6), 1.0 / period_years) - 1.0)
+        converged = np.zeros(len(rates), dtype=bool)
+        for _ in range(IRR_MAX_ITERATIONS):
+            discount = np.power(np.maximum(1.0 + rates, 1e-12)[None, :], -years)
+            npv = (cash_flows * discount).sum(axis=0)
+            derivative = (-years * cash_flows * discount).sum(axis=0) / np.maximum(1.0 + rates, 1e-12)
+            step = np.divide(npv, derivative, out=np.zeros_like(npv), where=derivative != 0)
+            rates = np.where(converged, rates, rates - step)
+            converged |= np.abs(step) < IRR_TOLERANCE
+            if converged.all():
+                break
+
+        rates = np.where(converged & (rates > -1.0) & np.any(cash_flows != 0, axis=0), rates, np.nan)
+        if not annualize:
+            rates = np.power(1.0 + rates, period_years) - 1.0
+        return self._series(rates)
+
+    def save(self, path: str):
+        """
+        Save the cached series to a directory, one .npy file per array and a JSON file of the series keys
+
+        Args:
+            path: Directory, created if needed
+        """
+        os.makedirs(path, exist_ok=True)
+        np.save(os.path.join(path, 'dates.npy'), self._dates[:self._size])
+        for name, array in self._arrays.items():
+            np.save(os.path.join(path, f'{name}.npy'), array[:self._size])
+        with open(os.path.join(path, 'keys.json'), 'w') as keys_file:
+            json.dump({'key_columns': self.key_columns, 'keys': [list(key) for key in self.keys]}, keys_file)
+
+    @classmethod
+    def load(cls, path: str) -> 'ReturnsEngine':
+        """
+        Load cached series saved by save
+
+        Args:
+            path: Directory written by save
+
+        Returns:
+            Engine ready to be extended
+        """
+        with open(os.path.join(path, 'keys.json')) as keys_file:
+            saved = json.load(keys_file)
+        dates = np.load(os.path.join(path, 'dates.npy'))
+        engine = cls(saved['key_columns'], capacity=len(dates) + 1)
+        engine.keys = [tuple(key) for key in saved['keys']]
+        engine._column_by_key = {key: column for column, key in enumerate(engine.keys)}
+        engine._size = len(dates)
+        engine._dates[:len(dates)] = dates
+        for name in STATE_ARRAYS:
+            array = np.load(os.path.join(path, f'{name}.npy'))
+            engine._arrays[name] = np.zeros((len(engine._dates), len(engine.keys)))
+            engine._arrays[name][:len(dates)] = array
+        return engine
+
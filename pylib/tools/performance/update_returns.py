@@ -0,0 +1,64 @@
+import os
+from datetime import date
+from typing import Optional
+
+import pandas as pd
+import sqlalchemy.orm as orm
+
+import pylib.library.sql.declarative_base as dec_b
+from pylib.library.config.paths import RETURNS_CACHE_DIR
+from pylib.library.sql.querier_performance import QuerierPerformance
+from pylib.tools.performance.returns import ReturnsEngine
+
+
+def update_returns(
+        session: orm.session.Session,
+        cache_path: str,
+        end_date: date,
+        start_date: Optional[date] = None,
+        bucket_column: Optional[str] = None
+) -> ReturnsEngine:
+    """
+    Extend the cached return series up to end_date, only the dates after the last cached date are queried
+
+    Args:
+        session: SQLAlchemy session object
+        cache_path: Directory of the cached series, created on the first run
+        end_date: Last date to compute
+        start_date: First date of the first run, ignored once the cache exists
+        bucket_column: dim_instrument column to bucket the positions by, portfolio totals by default
+
+    Returns:
+        Extended engine, saved to cache_path
+    """
+    key_columns = ['portfolio_sk'] + ([bucket_column] if bucket_column is not None else [])
+    if os.path.exists(os.path.join(cache_path, 'keys.json')):
+        engine = ReturnsEngine.load(cache_path)
+        start_date = (engine.dates[-1] + pd.Timedelta(days=1)).date()
+    elif start_date is None:
+        raise ValueError("start_date is required to build the first cache")
+    else:
+        engine = ReturnsEngine(key_columns)
+
+    if start_date <= end_date:
+        market_values = QuerierPerformance.get_market_values(session, start_date, end_date, bucket_column)
+        flows = QuerierPerformance.get_trade_flows(session, start_date, end_date, bucket_column)
+        engine.extend(market_values, flows)
+        engine.save(cache_path)
+    return engine
+
+
+def main():
+    declarative_base = dec_b.DeclarativeBase()
+    session = declarative_base.make_session()
+
+    end_date = date.today()
+    engine = update_returns(session, os.path.join(RETURNS_CACHE_DIR, 'portfolio'), end_date, date(end_date.year, 1, 1))
+    print(engine.twr())
+    engine = update_returns(session, os.path.join(RETURNS_CACHE_DIR, 'classification_level_1'), end_date,
+                            date(end_date.year, 1, 1), bucket_column='classification_level_1')
+    print(engine.twr())
+
+
+if __name__ == "__main__":
+    main()
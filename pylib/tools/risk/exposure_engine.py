@@ -0,0 +1,169 @@
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+from pylib.library.contract.contract import Contract
+from pylib.library.portfolio.portfolio import Portfolio
+
+# Attributes exposures can be broken down by, columns of QuerierInstrument.get_instrument_attributes
+EXPOSURE_ATTRIBUTES = (
+    'classification_level_1', 'classification_level_2', 'classification_level_3', 'issuer_sk', 'issuer_name',
+    'sector_name', 'country_code', 'currency_code'
+)
+
+# Category of the instruments without a value for an attribute, or not found in the attribute table
+UNCLASSIFIED = 'Unclassified'
+
+
+class ExposureEngine:
+    """
+    Exposure breakdowns of many portfolios by instrument attributes
+
+    Every attribute is encoded once as an integer category code per instrument, the last code of each attribute being
+    UNCLASSIFIED. The positions of all the portfolios are flattened into (portfolio, instrument, market value)
+    arrays, so that a breakdown is one np.bincount over portfolio * n_categories + category, for any number of
+    portfolios and without any per-position lookup of the reference data.
+    """
+    def __init__(self, attributes: DataFrame, key_column: str = 'instrument_id'):
+        """
+        Encode the instrument attributes
+
+        Args:
+            attributes: One row per instrument with the key column and the EXPOSURE_ATTRIBUTES, e.g.
+                QuerierInstrument.get_instrument_attributes
+            key_column: Column matched against the contracts' instrument_id
+        """
+        keys = attributes[key_column].astype(str).str.lower().to_numpy()
+        self._row_by_key: Dict[str, int] = {key: row for row, key in enumerate(keys)}
+        self._row_by_contract: Dict[Contract, int] = {}
+        self.unclassified_row = len(keys)  # row of the instruments not found, every attribute UNCLASSIFIED
+
+        self.codes: Dict[str, np.ndarray] = {}
+        self.categories: Dict[str, List[str]] = {}
+        for attribute in EXPOSURE_ATTRIBUTES:
+            codes, categories = pd.factorize(attributes[attribute], use_na_sentinel=True)
+            categories = list(categories) + [UNCLASSIFIED]
+            codes = np.where(codes < 0, len(categories) - 1, codes)
+            self.codes[attribute] = np.append(codes, len(categories) - 1).astype(np.int64)
+            self.categories[attribute] = categories
+
+    def row_of_key(self, key: str) -> int:
+        """Attribute row of an instrument key, the unclassified row if it is not in the table"""
+        return self._row_by_key.get(str(key).lower(), self.unclassified_row)
+
+    def row_of(self, contract: Contract) -> int:
+        """Attribute row of a contract, the unclassified row if its instrument is not in the table"""
+        row = self._row_by_contract.get(contract)
+        if row is None:
+            row = self._row_by_contract[contract] = self.row_of_key(contract.instrument_id)
+        return row
+
+    def flatten(
+            self,
+            portfolios: Sequence[Portfolio],
+            prices: Optional[Dict[Contract, float]] = None
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Flatten the positions of the portfolios
+
+        Args:
+            portfolios: Portfolios
+            prices: Price of each contract, the live market values of the position books by default (see
+                Portfolio.apply_price), which then need a live price for every position
+
+        Returns:
+            Portfolio index, attribute row and market value of every position
+
+        Raises:
+            ValueError: If prices are not given and a position has no live price
+        """
+        portfolio_index, rows, values = [], [], []
+        for i, portfolio in enumerate(portfolios):
+            book = portfolio.book
+            held = np.flatnonzero(book.quantities != 0)
+            contracts = book.contracts
+            if prices is None:
+                unpriced = held[np.isnan(book.last_prices[held])]
+                if len(unpriced):
+                    raise ValueError(f"No live price for {len(unpriced)} positions of {portfolio.name}, e.g. "
+                                     f"{contracts[unpriced[0]]}: pass prices or attach a market data manager")
+                market_values = book.live_market_values
+            else:
+                market_values = book.market_values(book.price_vector(prices))
+            portfolio_index.append(np.full(len(held), i, dtype=np.int64))
+            rows.append(np.fromiter((self.row_of(contracts[row]) for row in held.tolist()), dtype=np.int64,
+                                    count=len(held)))
+            values.append(market_values[held])
+        if not portfolios:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0)
+        return np.concatenate(portfolio_index), np.concatenate(rows), np.concatenate(values)
+
+    def _combined_codes(self, attributes: Sequence[str]) -> Tuple[np.ndarray, pd.Index]:
+        """Codes of the combinations of several attributes and their labels"""
+        codes = np.zeros(self.unclassified_row + 1, dtype=np.int64)
+        for attribute in attributes:
+            if attribute not in self.codes:
+                raise ValueError(f"Cannot break down exposures by {attribute}, expected one of {EXPOSURE_ATTRIBUTES}")
+            codes = codes * len(self.categories[attribute]) + self.codes[attribute]
+        labels = pd.MultiIndex.from_product([self.categories[attribute] for attribute in attributes],
+                                            names=list(attributes))
+        return codes, labels if len(attributes) > 1 else labels.get_level_values(0)
+
+    def breakdown(
+            self,
+            portfolios: Sequence[Portfolio],
+            attributes: Union[str, Sequence[str]],
+            prices: Optional[Dict[Contract, float]] = None,
+            normalize: bool = False,
+            flat: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+    ) -> DataFrame:
+        """
+        Exposure of each portfolio to each category of one attribute or combination of attributes
+
+        Args:
+            portfolios: Portfolios
+            attributes: Attribute, or attributes crossed, among EXPOSURE_ATTRIBUTES
+            prices: Price of each contract, the live market values of the position books by default, see flatten
+            normalize: Divide by the total market value of each portfolio
+            flat: Positions already flattened by flatten, to share them between breakdowns
+
+        Returns:
+            DataFrame of portfolios (by name) x categories, categories without exposure are dropped
+
+        Raises:
+            ValueError: If an attribute is not encoded, or prices are not given and a position has no live price
+        """
+        attributes = [attributes] if isinstance(attributes, str) else list(attributes)
+        codes, labels = self._combined_codes(attributes)
+        portfolio_index, rows, values = flat if flat is not None else self.flatten(portfolios, prices)
+
+        n_categories = len(labels)
+        sums = np.bincount(portfolio_index * n_categories + codes[rows], weights=values,
+                           minlength=len(portfolios) * n_categories).reshape(len(portfolios), n_categories)
+        if normalize:
+            totals = sums.sum(axis=1, keepdims=True)
+            sums = np.divide(sums, totals, out=np.zeros_like(sums), where=totals != 0)
+
+        used = np.flatnonzero(np.bincount(codes[rows], minlength=n_categories))
+        return DataFrame(sums[:, used], index=[portfolio.name for portfolio in portfolios], columns=labels[used])
+
+    def breakdowns(
+            self,
+            portfolios: Sequence[Portfolio],
+            attributes: Sequence[str] = EXPOSURE_ATTRIBUTES,
+            prices: Optional[Dict[Contract, float]] = None,
+            normalize: bool = False
+    ) -> Dict[str, DataFrame]:
+        """
+        Breakdowns of the portfolios by several attributes, flattening the positions once
+
+        Returns:
+            Breakdown DataFrame of each attribute
+        """
+        flat = self.flatten(portfolios, prices)
+        return {
+            attribute: self.breakdown(portfolios, attribute, normalize=normalize, flat=flat)
+            for attribute in attributes
+        }
@@ -0,0 +1,223 @@
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from pandas import DataFrame
+
+from pylib.library.config.enumerations import HistoricalSimulationMethod
+from pylib.library.portfolio.portfolio import Portfolio
+from pylib.tools.risk.market_returns import ReturnMatrix
+from pylib.tools.risk.monte_carlo_var import DEFAULT_CONFIDENCE_LEVELS, value_at_risk
+
+DEFAULT_WINDOW = 250
+DEFAULT_EWMA_DECAY = 0.94  # RiskMetrics daily decay of the filtered simulation volatilities
+DEFAULT_AGE_DECAY = 0.98  # decay of the age-weighted simulation scenario weights
+WEIGHT_TOLERANCE = 1e-12  # rounding allowed on cumulated scenario probabilities
+
+
+def weighted_value_at_risk(
+        pnl: np.ndarray,
+        weights: np.ndarray,
+        confidence_levels: Sequence[float]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Value at risk and expected shortfall of scenario P&L with scenario probabilities
+
+    The VaR is the smallest loss whose cumulated tail probability reaches 1 - confidence, the ES the probability
+    weighted average of the losses up to it, the last scenario counting for the part of its weight needed to reach
+    the tail probability.
+
+    Args:
+        pnl: Scenario P&L, scenarios x portfolios
+        weights: Scenario probabilities, summing to 1
+        confidence_levels: Confidence levels, e.g. 0.99
+
+    Returns:
+        VaR and ES, confidence levels x portfolios, as positive losses
+    """
+    order = np.argsort(pnl, axis=0)
+    ordered = np.take_along_axis(pnl, order, axis=0)
+    cumulative_weights = np.cumsum(weights[order], axis=0)
+    columns = np.arange(pnl.shape[1])
+
+    var = np.empty((len(confidence_levels), pnl.shape[1]))
+    es = np.empty_like(var)
+    for i, confidence in enumerate(confidence_levels):
+        tail_probability = 1.0 - confidence
+        last = np.minimum((cumulative_weights < tail_probability - WEIGHT_TOLERANCE).sum(axis=0), len(pnl) - 1)
+        var[i] = -ordered[last, columns]
+        tail_weights = np.where(np.arange(len(pnl))[:, None] < last[None, :], weights[order], 0.0)
+        residual = tail_probability - tail_weights.sum(axis=0)
+        es[i] = -((tail_weights * ordered).sum(axis=0) + residual * ordered[last, columns]) / tail_probability
+    return var, es
+
+
+class HistoricalVaR:
+    """
+    Historical simulation value at risk and expected shortfall over a rolling window of daily returns
+
+    The last window returns of every instrument are held in instruments x window matrices used as ring buffers: the
+    simple returns (full revaluation) and the returns standardized by their EWMA volatility forecast (filtered
+    historical simulation). Appending a day overwrites the oldest column and updates the volatility forecasts, in
+    O(instruments), instead of rebuilding the window.
+
+    The scenario P&L of a set of portfolios is a single product of the exposures with the scenario matrix:
+    - FULL: the historical returns
+    - FILTERED: the standardized returns rescaled by today's volatility forecast, cached until the next append
+    - AGE_WEIGHTED: the historical returns, with scenario probabilities decaying geometrically with their age
+    """
+    def __init__(
+            self,
+            returns: ReturnMatrix,
+            window: int = DEFAULT_WINDOW,
+            ewma_decay: float = DEFAULT_EWMA_DECAY,
+            age_decay: float = DEFAULT_AGE_DECAY
+    ):
+        """
+        Fill the window with the last returns of a close matrix, the whole history seeds the EWMA volatilities
+
+        Args:
+            returns: Aligned close prices of the instruments
+            window: Number of daily scenarios, capped by the number of returns available
+            ewma_decay: Decay of the EWMA variance recursion
+            age_decay: Decay of the age-weighted scenario probabilities
+
+        Raises:
+            ValueError: If there are less than two returns
+        """
+        log_returns = returns.log_returns
+        n_instruments, n_dates = log_returns.shape
+        if n_dates < 2:
+            raise ValueError("At least three close dates are needed for a historical simulation")
+        self.symbols = returns.symbols
+        self.returns = returns
+        self.window = min(window, n_dates)
+        self.ewma_decay = ewma_decay
+        self.age_decay = age_decay
+
+        # Variance forecast of each date from the returns before it, seeded with the variance of the first returns
+        variance = np.var(log_returns[:, :min(n_dates, self.window)], axis=1)
+        variance = np.where(variance > 0, variance, np.finfo(float).tiny)
+        standardized = np.empty_like(log_returns)
+        for t in range(n_dates):
+            standardized[:, t] = log_returns[:, t] / np.sqrt(variance)
+            variance = ewma_decay * variance + (1.0 - ewma_decay) * log_returns[:, t] ** 2
+        self._variance = variance  # forecast for the next date
+
+        self._simple_returns = np.ascontiguousarray(np.expm1(log_returns[:, -self.window:]))
+        self._standardized = np.ascontiguousarray(standardized[:, -self.window:])
+        self._ages = np.arange(self.window - 1, -1, -1)  # age in days of the scenario held in each column
+        self._oldest = 0  # column overwritten by the next append
+        self._filtered_returns: Optional[np.ndarray] = None
+        self.last_closes = returns.last_closes.copy()
+        self.last_date = returns.dates[-1]
+
+    def append(self, closes: np.ndarray, close_date: Optional[np.datetime64] = None):
+        """
+        Roll the window forward by one day
+
+        Args:
+            closes: Closes of the new day, aligned with the symbols
+            close_date: Date of the closes
+        """
+        closes = np.asarray(closes, dtype=np.float64)
+        log_return = np.log(closes / self.last_closes)
+        column = self._oldest
+
+        self._simple_returns[:, column] = np.expm1(log_return)
+        self._standardized[:, column] = log_return / np.sqrt(self._variance)
+        self._variance = self.ewma_decay * self._variance + (1.0 - self.ewma_decay) * log_return ** 2
+        self._ages += 1
+        self._ages[column] = 0
+        self._oldest = (column + 1) % self.window
+        self._filtered_returns = None
+
+        self.last_closes = closes
+        if close_date is not None:
+            self.last_date = close_date
+
+    @property
+    def volatilities(self) -> np.ndarray:
+        """EWMA daily volatility forecast of each instrument"""
+        return np.sqrt(self._variance)
+
+    def scenario_weights(self, method: HistoricalSimulationMethod) -> np.ndarray:
+        """Probability of each scenario column, equal except for the age-weighted simulation"""
+        if method == HistoricalSimulationMethod.AGE_WEIGHTED:
+            weights = self.age_decay ** self._ages.astype(np.float64)
+            return weights / weights.sum()
+        return np.full(self.window, 1.0 / self.window)
+
+    def scenario_returns(self, method: HistoricalSimulationMethod) -> np.ndarray:
+        """Simple returns of every instrument under every scenario, instruments x window"""
+        if method == HistoricalSimulationMethod.FILTERED:
+            if self._filtered_returns is None:
+                self._filtered_returns = np.expm1(self._standardized * self.volatilities[:, None])
+            return self._filtered_returns
+        return self._simple_returns
+
+    def scenario_pnl(
+            self,
+            exposures: np.ndarray,
+            method: HistoricalSimulationMethod = HistoricalSimulationMethod.FULL
+    ) -> np.ndarray:
+        """
+        Scenario P&L of one or several exposure vectors
+
+        Args:
+            exposures: Exposures aligned with the instruments, or instruments x portfolios
+            method: Historical simulation variant
+
+        Returns:
+            Scenario P&L, window x portfolios (a vector for a single exposure vector), in ring buffer column order
+        """
+        return self.scenario_returns(method).T @ np.asarray(exposures, dtype=np.float64)
+
+    def var_es(
+            self,
+            exposures: np.ndarray,
+            confidence_levels: Sequence[float] = DEFAULT_CONFIDENCE_LEVELS,
+            method: HistoricalSimulationMethod = HistoricalSimulationMethod.FULL
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Value at risk and expected shortfall of one or several exposure vectors
+
+        Args:
+            exposures: Exposures aligned with the instruments, or instruments x portfolios
+            confidence_levels: Confidence levels
+            method: Historical simulation variant
+
+        Returns:
+            VaR and ES as positive losses, confidence levels x portfolios
+        """
+        pnl = self.scenario_pnl(exposures, method)
+        pnl = pnl.reshape(len(pnl), -1)
+        if method == HistoricalSimulationMethod.AGE_WEIGHTED:
+            return weighted_value_at_risk(pnl, self.scenario_weights(method), confidence_levels)
+        return value_at_risk(pnl, confidence_levels)
+
+    def portfolio_var(
+            self,
+            portfolios: List[Portfolio],
+            confidence_levels: Sequence[float] = DEFAULT_CONFIDENCE_LEVELS,
+            methods: Sequence[HistoricalSimulationMethod] = tuple(HistoricalSimulationMethod)
+    ) -> DataFrame:
+        """
+        Value at risk and expected shortfall of portfolios valued at the last closes
+
+        Args:
+            portfolios: Portfolios, every held contract needs a close series
+            confidence_levels: Confidence levels
+            methods: Historical simulation variants
+
+        Returns:
+            DataFrame indexed by portfolio name with a <method>_var_<level> and <method>_es_<level> column per
+            method and confidence level
+        """
+        exposures = self.returns.exposure_matrix(portfolios, self.last_closes)
+        columns = {}
+        for method in methods:
+            var, es = self.var_es(exposures, confidence_levels, method)
+            for i, confidence in enumerate(confidence_levels):
+                columns[f'{method.name.lower()}_var_{confidence:g}'] = var[i]
+                columns[f'{method.name.lower()}_es_{confidence:g}'] = es[i]
+        return DataFrame(columns, index=[portfolio.name for portfolio in portfolios])
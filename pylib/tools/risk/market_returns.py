@@ -0,0 +1,124 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from pylib.library.market_data.corporate_actions import AdjustedBarSeries, CorporateActionStore
+from pylib.library.market_data.historical_data import HistoricalBar, HistoricalBarSeries
+from pylib.library.portfolio.portfolio import Portfolio
+
+
+@dataclass
+class ReturnMatrix:
+    """
+    Close prices of a set of instruments aligned on common dates, stored as one instruments x dates matrix
+    """
+    symbols: List[str]
+    dates: np.ndarray  # datetime64 close dates, increasing
+    closes: np.ndarray  # instruments x dates
+
+    def __post_init__(self):
+        self._row_by_symbol = {symbol: row for row, symbol in enumerate(self.symbols)}
+
+    @classmethod
+    def from_bars(
+            cls,
+            bars_by_symbol: Dict[str, List[HistoricalBar]],
+            symbols: Optional[Sequence[str]] = None,
+            corporate_actions: Optional[CorporateActionStore] = None
+    ) -> 'ReturnMatrix':
+        """
+        Align the close prices of historical bars, e.g. IBAPIClient.historical_data
+
+        The close series are joined on the union of their dates and forward filled, so that a missing bar repeats the
+        previous close (a zero return). Dates before every instrument has a first close are dropped.
+
+        Args:
+            bars_by_symbol: Historical bars of each symbol, in time order
+            symbols: Symbols to keep, in row order, all symbols by default
+            corporate_actions: Splits and dividends to back-adjust the raw closes with, closes are used as is if None
+
+        Returns:
+            Aligned close matrix
+        """
+        symbols = list(symbols) if symbols is not None else list(bars_by_symbol)
+        series = []
+        for symbol in symbols:
+            bars = bars_by_symbol[symbol]
+            if corporate_actions is not None:
+                closes = AdjustedBarSeries(symbol, bars, corporate_actions).closes
+            elif isinstance(bars, HistoricalBarSeries):
+                closes = bars.close_prices
+            else:
+                closes = np.fromiter((float(bar.close_price) for bar in bars), dtype=np.float64)
+            if isinstance(bars, HistoricalBarSeries):
+                timestamps = pd.DatetimeIndex(bars.datetimes.astype('datetime64[ns]'))
+            else:
+                timestamps = pd.DatetimeIndex([bar.timestamp for bar in bars])
+            series.append(pd.Series(closes, index=timestamps))
+        closes = pd.concat([
+            closes.groupby(level=0).last() for closes in series
+        ], axis=1, keys=range(len(symbols))).sort_index().ffill().dropna()
+        return cls(symbols, closes.index.to_numpy(), np.ascontiguousarray(closes.to_numpy().T))
+
+    def __len__(self) -> int:
+        return len(self.symbols)
+
+    def row_of(self, symbol: str) -> Optional[int]:
+        """Row of a symbol, None if it is not in the matrix"""
+        return self._row_by_symbol.get(symbol)
+
+    @property
+    def last_closes(self) -> np.ndarray:
+        """Close of each instrument on the last date"""
+        return self.closes[:, -1]
+
+    @property
+    def return_dates(self) -> np.ndarray:
+        """Dates of the returns, every close date but the first"""
+        return self.dates[1:]
+
+    @property
+    def log_returns(self) -> np.ndarray:
+        """Daily log returns, instruments x return dates"""
+        return np.diff(np.log(self.closes), axis=1)
+
+    def exposures(self, portfolio: Portfolio, prices: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Market value of a portfolio's holdings in each instrument, quantity * price * contract multiplier
+
+        Args:
+            portfolio: Portfolio whose position book is read
+            prices: Prices aligned with the symbols, the last closes by default
+
+        Returns:
+            Array aligned with the symbols
+
+        Raises:
+            ValueError: If a held contract has no close series
+        """
+        book = portfolio.book
+        rows, quantities, missing = [], [], []
+        for contract, quantity in zip(book.contracts, book.quantities.tolist()):
+            if contract is None or quantity == 0:
+                continue
+            row = self._row_by_symbol.get(contract.symbol)
+            if row is None:
+                missing.append(contract.symbol)
+                continue
+            rows.append(row)
+            quantities.append(quantity * float(contract.multiplier or 1))
+        if missing:
+            raise ValueError(f"No close series for {missing} held by {portfolio.name}")
+
+        prices = self.last_closes if prices is None else prices
+        exposures = np.zeros(len(self.symbols), dtype=np.float64)
+        np.add.at(exposures, np.array(rows, dtype=np.int64), np.array(quantities) * prices[rows])
+        return exposures
+
+    def exposure_matrix(self, portfolios: Sequence[Portfolio], prices: Optional[np.ndarray] = None) -> np.ndarray:
+        """Exposures of several portfolios, instruments x portfolios, see exposures"""
+        if not portfolios:
+            return np.zeros((len(self.symbols), 0))
+        return np.column_stack([self.exposures(portfolio, prices) for portfolio in portfolios])
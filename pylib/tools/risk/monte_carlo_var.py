@@ -0,0 +1,221 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pandas import DataFrame
+
+from pylib.library.portfolio.portfolio import Portfolio
+from pylib.tools.risk.market_returns import ReturnMatrix
+
+DEFAULT_CONFIDENCE_LEVELS = (0.95, 0.99)
+DEFAULT_MEMORY_BUDGET = 64 * 2 ** 20  # bytes of scenario arrays held at once by each worker
+CHOLESKY_JITTER_TRIES = 10
+
+# Simulation state of a worker process, set once by _init_worker instead of being sent with every block
+_worker_state: Dict[str, np.ndarray] = {}
+
+
+def cholesky_factor(covariance: np.ndarray) -> np.ndarray:
+    """
+    Lower triangular Cholesky factor of a covariance matrix
+
+    A covariance estimated from few dates is only positive semi-definite, in which case an increasing multiple of the
+    average variance is added to the diagonal until the factorization succeeds.
+
+    Args:
+        covariance: Symmetric covariance matrix
+
+    Returns:
+        Lower triangular L with L @ L.T = covariance (+ jitter)
+
+    Raises:
+        np.linalg.LinAlgError: If the matrix is not positive definite even with the largest jitter
+    """
+    try:
+        return np.linalg.cholesky(covariance)
+    except np.linalg.LinAlgError:
+        pass
+    jitter = 1e-10 * max(float(np.mean(np.diag(covariance))), np.finfo(float).tiny)
+    identity = np.eye(len(covariance))
+    for _ in range(CHOLESKY_JITTER_TRIES):
+        try:
+            return np.linalg.cholesky(covariance + jitter * identity)
+        except np.linalg.LinAlgError:
+            jitter *= 10
+    raise np.linalg.LinAlgError("Covariance matrix is not positive definite")
+
+
+def value_at_risk(pnl: np.ndarray, confidence_levels: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Value at risk and expected shortfall of scenario P&L
+
+    Args:
+        pnl: Scenario P&L, scenarios x portfolios
+        confidence_levels: Confidence levels, e.g. 0.99
+
+    Returns:
+        VaR and ES, confidence levels x portfolios, as positive losses
+    """
+    n = len(pnl)
+    ordered = np.sort(pnl, axis=0)
+    var = np.empty((len(confidence_levels), pnl.shape[1]))
+    es = np.empty_like(var)
+    for i, confidence in enumerate(confidence_levels):
+        tail = max(int(math.floor(n * (1.0 - confidence))), 1)
+        var[i] = -ordered[tail - 1]
+        es[i] = -ordered[:tail].mean(axis=0)
+    return var, es
+
+
+def _init_worker(factor: np.ndarray, mean: np.ndarray, exposures: np.ndarray):
+    _worker_state['factor'] = factor
+    _worker_state['mean'] = mean
+    _worker_state['exposures'] = exposures
+
+
+def _simulate_block(seed: np.random.SeedSequence, n_scenarios: int) -> np.ndarray:
+    """Scenario P&L of one block, scenarios x portfolios, from the worker state"""
+    factor = _worker_state['factor']
+    rng = np.random.default_rng(seed)
+    shocks = rng.standard_normal((n_scenarios, factor.shape[1]))
+    returns = shocks @ factor.T
+    returns += _worker_state['mean']
+    np.expm1(returns, out=returns)
+    return returns @ _worker_state['exposures']
+
+
+class MonteCarloVaR:
+    """
+    Monte Carlo value at risk and expected shortfall of linear positions under correlated normal log returns
+
+    The covariance of the daily log returns is factored once: with a Cholesky factor, or with the centered returns
+    themselves when there are fewer return dates than instruments (the covariance is then singular and R R' / (T - 1)
+    already is a factorization of rank T). Scenarios are generated in blocks sized to the memory budget, each block
+    drawing its shocks from its own child seed, so that results only depend on the seed and the memory budget, not on
+    the number of workers. Every position is revalued exactly under each scenario, P&L = exposure * (exp(r) - 1), with
+    one matrix product per block for all the portfolios.
+    """
+    def __init__(
+            self,
+            returns: ReturnMatrix,
+            horizon_days: int = 1,
+            include_mean: bool = False,
+            memory_budget: int = DEFAULT_MEMORY_BUDGET,
+            workers: Optional[int] = None
+    ):
+        """
+        Estimate and factor the covariance of the returns
+
+        Args:
+            returns: Aligned close prices of the instruments
+            horizon_days: Horizon of the scenarios, the daily covariance and mean are scaled by it
+            include_mean: Add the mean daily return to the scenarios, zero mean by default
+            memory_budget: Bytes of scenario arrays held at once by each worker
+            workers: Worker processes, the CPU count by default, 1 simulates in the calling process
+        """
+        self.returns = returns
+        self.horizon_days = horizon_days
+        self.memory_budget = memory_budget
+        self.workers = workers or os.cpu_count() or 1
+
+        log_returns = returns.log_returns
+        n_instruments, n_dates = log_returns.shape
+        if n_dates < 2:
+            raise ValueError("At least three close dates are needed to estimate a covariance")
+        mean = log_returns.mean(axis=1)
+        centered = log_returns - mean[:, None]
+        if n_dates - 1 < n_instruments:
+            factor = centered / math.sqrt(n_dates - 1)
+        else:
+            factor = cholesky_factor(centered @ centered.T / (n_dates - 1))
+
+        self.factor = np.ascontiguousarray(factor * math.sqrt(horizon_days))
+        self.mean = mean * horizon_days if include_mean else np.zeros(n_instruments)
+
+    def block_size(self, n_portfolios: int = 1) -> int:
+        """Scenarios per block so that the shocks, returns and P&L of a block fit in the memory budget"""
+        bytes_per_scenario = 8 * (self.factor.shape[1] + self.factor.shape[0] + n_portfolios)
+        return max(self.memory_budget // bytes_per_scenario, 1)
+
+    def simulate_pnl(self, exposures: np.ndarray, n_scenarios: int = 100_000, seed: Optional[int] = None) -> np.ndarray:
+        """
+        Simulate the P&L of one or several exposure vectors
+
+        Args:
+            exposures: Exposures aligned with the instruments, or instruments x portfolios
+            n_scenarios: Number of scenarios
+            seed: Root seed of the scenario blocks
+
+        Returns:
+            Scenario P&L, scenarios x portfolios (a vector for a single exposure vector)
+        """
+        exposures = np.asarray(exposures, dtype=np.float64)
+        single = exposures.ndim == 1
+        exposures = exposures.reshape(len(exposures), -1)
+
+        block_size = self.block_size(exposures.shape[1])
+        n_blocks, remainder = divmod(n_scenarios, block_size)
+        sizes = [block_size] * n_blocks + ([remainder] if remainder else [])
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+        if self.workers == 1 or len(sizes) == 1:
+            _init_worker(self.factor, self.mean, exposures)
+            blocks = [_simulate_block(block_seed, size) for block_seed, size in zip(seeds, sizes)]
+            _worker_state.clear()
+        else:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(sizes)), initializer=_init_worker,
+                                     initargs=(self.factor, self.mean, exposures)) as executor:
+                blocks = list(executor.map(_simulate_block, seeds, sizes))
+
+        pnl = np.concatenate(blocks) if blocks else np.zeros((0, exposures.shape[1]))
+        return pnl[:, 0] if single else pnl
+
+    def var_es(
+            self,
+            exposures: np.ndarray,
+            n_scenarios: int = 100_000,
+            confidence_levels: Sequence[float] = DEFAULT_CONFIDENCE_LEVELS,
+            seed: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Value at risk and expected shortfall of one or several exposure vectors
+
+        Args:
+            exposures: Exposures aligned with the instruments, or instruments x portfolios
+            n_scenarios: Number of scenarios
+            confidence_levels: Confidence levels
+            seed: Root seed of the scenario blocks
+
+        Returns:
+            VaR and ES as positive losses, confidence levels x portfolios
+        """
+        pnl = self.simulate_pnl(exposures, n_scenarios, seed)
+        return value_at_risk(pnl.reshape(len(pnl), -1), confidence_levels)
+
+    def portfolio_var(
+            self,
+            portfolios: List[Portfolio],
+            n_scenarios: int = 100_000,
+            confidence_levels: Sequence[float] = DEFAULT_CONFIDENCE_LEVELS,
+            seed: Optional[int] = None
+    ) -> DataFrame:
+        """
+        Value at risk and expected shortfall of portfolios, all revalued under the same scenarios
+
+        Args:
+            portfolios: Portfolios, every held contract needs a close series
+            n_scenarios: Number of scenarios
+            confidence_levels: Confidence levels
+            seed: Root seed of the scenario blocks
+
+        Returns:
+            DataFrame indexed by portfolio name with a var_<level> and es_<level> column per confidence level
+        """
+        var, es = self.var_es(self.returns.exposure_matrix(portfolios), n_scenarios, confidence_levels, seed)
+        columns = {}
+        for i, confidence in enumerate(confidence_levels):
+            columns[f'var_{confidence:g}'] = var[i]
+            columns[f'es_{confidence:g}'] = es[i]
+        return DataFrame(columns, index=[portfolio.name for portfolio in portfolios])
@@ -0,0 +1,227 @@
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pandas import DataFrame
+
+from pylib.library.config.enumerations import ShockType
+from pylib.library.contract.contract import Contract
+from pylib.library.portfolio.portfolio import Portfolio
+from pylib.tools.risk.exposure_engine import ExposureEngine
+
+DEFAULT_CACHE_SIZE = 128  # scenario P&L results kept by the engine
+
+
+@dataclass
+class Shock:
+    """
+    Shock of one market factor applied to an instrument or to every instrument of an attribute category
+
+    PRICE and FX shocks are relative changes (-0.2 for -20%), CURVE shocks are yield shifts in decimal (0.01 for
+    +100bp) applied through the modified duration of the instruments. FX shocks target a currency_code category.
+    """
+    shock_type: ShockType
+    value: float
+    attribute: Optional[str] = None  # e.g. classification_level_1, sector_name, country_code, currency_code
+    category: Optional[str] = None
+    instrument_id: Optional[str] = None  # shocks a single instrument instead of a category
+
+
+@dataclass
+class Scenario:
+    """Named set of shocks applied together, the shocks of a same type add up"""
+    name: str
+    shocks: List[Shock] = field(default_factory=list)
+
+
+@dataclass
+class ScenarioSet:
+    """
+    Versioned list of scenarios, the version must change whenever the scenarios change since it keys the cached results
+    """
+    name: str
+    version: int
+    scenarios: List[Scenario]
+
+    @property
+    def key(self) -> Tuple[str, int]:
+        return self.name, self.version
+
+
+@dataclass
+class ScenarioMatrices:
+    """Shocks of a scenario set laid out as scenarios x instrument attribute rows"""
+    price: np.ndarray
+    fx: np.ndarray
+    curve: np.ndarray
+
+    def returns(self, durations: np.ndarray) -> np.ndarray:
+        """Relative change in base currency of every instrument under every scenario"""
+        return (1.0 + self.price - self.curve * durations) * (1.0 + self.fx) - 1.0
+
+
+def portfolio_state_key(portfolio: Portfolio, prices: Optional[Dict[Contract, float]] = None) -> str:
+    """
+    Digest of the positions of a portfolio and of the prices they are valued at, identifying a portfolio snapshot
+
+    Args:
+        portfolio: Portfolio
+        prices: Prices the positions are valued at, the live prices of the position book by default
+
+    Returns:
+        Hexadecimal digest
+    """
+    book = portfolio.book
+    held = np.flatnonzero(book.quantities != 0)
+    contracts = book.contracts
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update('\x1f'.join(str(contracts[row].instrument_id) for row in held.tolist()).encode())
+    digest.update(np.ascontiguousarray(book.quantities[held]).tobytes())
+    if prices is None:
+        digest.update(np.ascontiguousarray(book.live_market_values[held]).tobytes())
+    else:
+        digest.update(np.array([float(prices[contracts[row]]) for row in held.tolist()]).tobytes())
+    return digest.hexdigest()
+
+
+class ScenarioEngine:
+    """
+    Batched stress testing of portfolios under scenario sets
+
+    A scenario set is compiled once into scenarios x instruments matrices of price, FX and curve shocks over the
+    instrument attribute rows of an ExposureEngine: category shocks are broadcast to the instruments through their
+    category codes, instrument shocks are scattered to their rows. The market values of all the portfolios are laid
+    out as an instruments x portfolios exposure matrix, so that the P&L of every scenario and portfolio is a single
+    matrix product, exposures being revalued with first order sensitivities:
+    return = (1 + price shock - modified duration * yield shift) * (1 + FX shock) - 1.
+
+    Compiled matrices are cached by scenario set name and version, P&L results by scenario set and portfolio state
+    (see portfolio_state_key), so that packs re-run on unchanged portfolios are served from the cache.
+    """
+    def __init__(
+            self,
+            exposure_engine: ExposureEngine,
+            durations: Optional[Dict[str, float]] = None,
+            cache_size: int = DEFAULT_CACHE_SIZE
+    ):
+        """
+        Args:
+            exposure_engine: Encoded instrument attributes
+            durations: Modified duration of each instrument id sensitive to the curve, zero for the others
+            cache_size: Number of scenario P&L results kept
+        """
+        self.exposure_engine = exposure_engine
+        self.durations = np.zeros(exposure_engine.unclassified_row + 1, dtype=np.float64)
+        for instrument_id, duration in (durations or {}).items():
+            row = exposure_engine.row_of_key(instrument_id)
+            if row != exposure_engine.unclassified_row:
+                self.durations[row] = duration
+        self.cache_size = cache_size
+        self._matrices: Dict[Tuple[str, int], ScenarioMatrices] = {}
+        self._results: 'OrderedDict[Tuple[str, str, int], np.ndarray]' = OrderedDict()
+
+    def compile(self, scenario_set: ScenarioSet) -> ScenarioMatrices:
+        """
+        Lay the shocks of a scenario set out as scenarios x instruments matrices, cached by name and version
+
+        Raises:
+            ValueError: If a shock targets an attribute that is not encoded
+        """
+        matrices = self._matrices.get(scenario_set.key)
+        if matrices is not None:
+            return matrices
+
+        engine = self.exposure_engine
+        n_scenarios, n_rows = len(scenario_set.scenarios), engine.unclassified_row + 1
+        factors = {shock_type: np.zeros((n_scenarios, n_rows)) for shock_type in ShockType}
+        category_shocks: Dict[Tuple[ShockType, str], np.ndarray] = {}
+        category_codes: Dict[str, Dict[str, int]] = {}
+
+        for i, scenario in enumerate(scenario_set.scenarios):
+            for shock in scenario.shocks:
+                if shock.instrument_id is not None:
+                    row = engine.row_of_key(shock.instrument_id)
+                    if row != engine.unclassified_row:
+                        factors[shock.shock_type][i, row] += shock.value
+                    continue
+                if shock.attribute not in engine.codes:
+                    raise ValueError(f"Cannot shock {shock.attribute}, it is not an encoded instrument attribute")
+                codes = category_codes.get(shock.attribute)
+                if codes is None:
+                    codes = category_codes[shock.attribute] = {
+                        category: code for code, category in enumerate(engine.categories[shock.attribute])}
+                code = codes.get(shock.category)
+                if code is None:
+                    continue  # no instrument in the category
+                shocks = category_shocks.get((shock.shock_type, shock.attribute))
+                if shocks is None:
+                    shocks = category_shocks[shock.shock_type, shock.attribute] = np.zeros((n_scenarios, len(codes)))
+                shocks[i, code] += shock.value
+
+        for (shock_type, attribute), shocks in category_shocks.items():
+            factors[shock_type] += shocks[:, engine.codes[attribute]]
+
+        matrices = self._matrices[scenario_set.key] = ScenarioMatrices(
+            factors[ShockType.PRICE], factors[ShockType.FX], factors[ShockType.CURVE])
+        return matrices
+
+    def exposure_matrix(
+            self,
+            portfolios: Sequence[Portfolio],
+            prices: Optional[Dict[Contract, float]] = None
+    ) -> np.ndarray:
+        """Market value of the portfolios in each instrument attribute row, instruments x portfolios"""
+        portfolio_index, rows, values = self.exposure_engine.flatten(portfolios, prices)
+        n_rows = self.exposure_engine.unclassified_row + 1
+        return np.bincount(rows * len(portfolios) + portfolio_index, weights=values,
+                           minlength=n_rows * len(portfolios)).reshape(n_rows, len(portfolios))
+
+    def scenario_pnl(
+            self,
+            portfolios: Sequence[Portfolio],
+            scenario_set: ScenarioSet,
+            prices: Optional[Dict[Contract, float]] = None
+    ) -> DataFrame:
+        """
+        P&L of portfolios under every scenario of a set
+
+        Args:
+            portfolios: Portfolios
+            scenario_set: Scenarios
+            prices: Price of each contract held, the live market values of the position books by default
+
+        Returns:
+            DataFrame of scenarios (by name) x portfolios (by name)
+
+        Raises:
+            ValueError: If prices are not given and a position has no live price, see ExposureEngine.flatten
+        """
+        set_name, set_version = scenario_set.key
+        keys = [(portfolio_state_key(portfolio, prices), set_name, set_version) for portfolio in portfolios]
+        missing = [i for i, key in enumerate(keys) if key not in self._results]
+
+        if missing:
+            returns = self.compile(scenario_set).returns(self.durations)
+            pnl = returns @ self.exposure_matrix([portfolios[i] for i in missing], prices)
+            for column, i in enumerate(missing):
+                self._results[keys[i]] = pnl[:, column]
+
+        columns = []
+        for key in keys:
+            self._results.move_to_end(key)
+            columns.append(self._results[key])
+        while len(self._results) > self.cache_size:
+            self._results.popitem(last=False)
+
+        return DataFrame(
+            np.column_stack(columns) if columns else np.zeros((len(scenario_set.scenarios), 0)),
+            index=[scenario.name for scenario in scenario_set.scenarios],
+            columns=[portfolio.name for portfolio in portfolios]
+        )
+
+    def clear_cache(self):
+        """Drop the compiled scenario sets and the cached results"""
+        self._matrices.clear()
+        self._results.clear()
@@ -0,0 +1,228 @@
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Union
+
+import numpy as np
+from pandas import DataFrame
+
+from pylib.library.config.enumerations import OrderType
+from pylib.library.contract.contract import Contract
+from pylib.library.order.order import Order
+from pylib.library.portfolio.portfolio import Portfolio
+
+WEIGHT_TOLERANCE = 1e-9  # rounding allowed on the sum of the target weights
+
+
+@dataclass
+class RebalancePlan:
+    """
+    Trades computed for a set of portfolios over a common universe of contracts
+    """
+    portfolio_names: List[str]
+    contracts: List[Contract]
+    prices: np.ndarray  # price of each contract, the limit price of LIMIT orders
+    quantities: np.ndarray  # portfolios x contracts, held before the trades
+    trades: np.ndarray  # portfolios x contracts, signed quantities to trade
+    cash: np.ndarray  # cash of each portfolio after the trades
+    nav: np.ndarray  # net asset value of each portfolio, positions and cash
+
+    def orders(
+            self,
+            order_type: OrderType = OrderType.MARKET,
+            time_in_force: Optional[str] = 'DAY'
+    ) -> Dict[str, List[Order]]:
+        """
+        Orders of each portfolio, sells first so that their proceeds fund the buys
+
+        Args:
+            order_type: Type of the orders, MARKET or LIMIT at the prices the plan was computed with
+            time_in_force: Time in force of the orders
+
+        Returns:
+            Dictionary of portfolio name to orders, portfolios without trade are left out
+
+        Raises:
+            ValueError: If the order type needs prices the plan does not have (stop prices)
+        """
+        if order_type not in (OrderType.MARKET, OrderType.LIMIT):
+            raise ValueError(f"Rebalancing orders can only be MARKET or LIMIT orders, not {order_type.name}")
+
+        orders: Dict[str, List[Order]] = {}
+        portfolio_index, columns = np.nonzero(self.trades)
+        trades = self.trades[portfolio_index, columns]
+        order = np.lexsort((trades > 0, portfolio_index))
+        rows = zip(portfolio_index[order].tolist(), columns[order].tolist(), trades[order].tolist())
+        for i, column, quantity in rows:
+            orders.setdefault(self.portfolio_names[i], []).append(Order(
+                instrument=self.contracts[column],
+                order_type=order_type,
+                side='BUY' if quantity > 0 else 'SELL',
+                quantity=Decimal(repr(abs(quantity))),
+                limit_price=Decimal(repr(float(self.prices[column]))) if order_type == OrderType.LIMIT else None,
+                time_in_force=time_in_force
+            ))
+        return orders
+
+    def to_frame(self) -> DataFrame:
+        """Trades as a DataFrame with one row per portfolio and contract traded"""
+        portfolio_index, columns = np.nonzero(self.trades)
+        return DataFrame({
+            'portfolio_name': np.array(self.portfolio_names, dtype=object)[portfolio_index],
+            'contract': np.array(self.contracts, dtype=object)[columns],
+            'quantity': self.quantities[portfolio_index, columns],
+            'trade_quantity': self.trades[portfolio_index, columns],
+        })
+
+
+class Rebalancer:
+    """
+    Batch rebalancing of portfolios to target weights
+
+    The holdings and target weights of every portfolio are laid out on a portfolios x contracts matrix over the union
+    of the contracts held and targeted, so that a whole rebalancing run is a handful of array operations:
+    - a position is only traded when its weight drifted from its target by more than the drift band, positions whose
+      target is zero are always closed out
+    - target quantities are target weight * NAV / (price * multiplier), trades are rounded towards zero to whole lots,
+      except when a position is closed out
+    - trades whose value is below the minimum trade value are dropped, close-outs excepted
+    - when the buys cost more than the cash plus the sell proceeds (less the cash buffer), every buy of the portfolio
+      is scaled down by the same factor then rounded down to whole lots again
+    """
+    def __init__(
+            self,
+            drift_band: float = 0.0,
+            min_trade_value: float = 0.0,
+            cash_buffer: float = 0.0,
+            lot_sizes: Optional[Dict[Contract, float]] = None,
+            default_lot_size: float = 1.0
+    ):
+        """
+        Args:
+            drift_band: Absolute weight drift tolerated before a position is traded back to its target
+            min_trade_value: Smallest value of a trade, in the portfolio currency
+            cash_buffer: Fraction of the NAV kept in cash
+            lot_sizes: Lot size of the contracts, default_lot_size for the others
+            default_lot_size: Lot size of the contracts without one
+        """
+        self.drift_band = drift_band
+        self.min_trade_value = min_trade_value
+        self.cash_buffer = cash_buffer
+        self.lot_sizes = lot_sizes or {}
+        self.default_lot_size = default_lot_size
+
+    def _universe(self, portfolios: Sequence[Portfolio], target_weights: DataFrame) -> List[Contract]:
+        """Targeted contracts followed by the contracts only held"""
+        contracts = list(target_weights.columns)
+        known = set(contracts)
+        for portfolio in portfolios:
+            for contract, quantity in zip(portfolio.book.contracts, portfolio.book.quantities.tolist()):
+                if contract is not None and quantity != 0 and contract not in known:
+                    known.add(contract)
+                    contracts.append(contract)
+        return contracts
+
+    def plan(
+            self,
+            portfolios: Sequence[Portfolio],
+            target_weights: DataFrame,
+            prices: Dict[Contract, Union[float, Decimal]],
+            cash: Optional[Dict[str, float]] = None
+    ) -> RebalancePlan:
+        """
+        Compute the trades bringing the portfolios to their target weights
+
+        Args:
+            portfolios: Portfolios to rebalance
+            target_weights: Target weight of each contract (columns) for each portfolio name (index), missing or NaN
+                weights are zero, contracts held but not in the columns are closed out
+            prices: Price of each contract held or targeted
+            cash: Cash available in each portfolio, by name, zero by default
+
+        Returns:
+            Rebalancing plan
+
+        Raises:
+            ValueError: If a price is missing or the target weights of a portfolio sum to more than one
+        """
+        names = [portfolio.name for portfolio in portfolios]
+        contracts = self._universe(portfolios, target_weights)
+        column_by_contract = {contract: column for column, contract in enumerate(contracts)}
+
+        missing = [contract for contract in contracts if contract not in prices]
+        if missing:
+            raise ValueError(f"No price provided for {missing}")
+        contract_prices = np.array([float(prices[contract]) for contract in contracts])
+        unit_values = contract_prices * np.array([float(contract.multiplier or 1) for contract in contracts])
+        lots = np.array([float(self.lot_sizes.get(contract, self.default_lot_size)) for contract in contracts])
+
+        quantities = np.zeros((len(portfolios), len(contracts)))
+        for i, portfolio in enumerate(portfolios):
+            book = portfolio.book
+            held = np.flatnonzero(book.quantities != 0)
+            book_contracts = book.contracts
+            quantities[i, [column_by_contract[book_contracts[row]] for row in held.tolist()]] = book.quantities[held]
+
+        weights = np.zeros_like(quantities)
+        weights[:, :target_weights.shape[1]] = np.nan_to_num(
+            target_weights.reindex(index=names).to_numpy(dtype=np.float64))
+        over = weights.sum(axis=1) > 1.0 + WEIGHT_TOLERANCE
+        if over.any():
+            raise ValueError(f"Target weights sum to more than one for {[names[i] for i in np.flatnonzero(over)]}")
+
+        cash_balances = np.array([float((cash or {}).get(name, 0.0)) for name in names])
+        market_values = quantities * unit_values
+        nav = market_values.sum(axis=1) + cash_balances
+        safe_nav = np.where(nav > 0, nav, 1.0)[:, None]
+
+        # Trades to target, restricted to the positions out of their band
+        drift = np.abs(market_values / safe_nav - weights)
+        close_out = (weights == 0) & (quantities != 0)
+        rebalance = (drift > self.drift_band) | close_out
+        trades = np.where(rebalance, weights * safe_nav / unit_values - quantities, 0.0)
+        trades = np.trunc(trades / lots) * lots
+        trades = np.where(close_out, -quantities, trades)
+        trades[(np.abs(trades * unit_values) < self.min_trade_value) & ~close_out] = 0.0
+
+        # Scale the buys down to the cash available
+        available = cash_balances - np.minimum(trades, 0.0) @ unit_values - self.cash_buffer * np.maximum(nav, 0.0)
+        buys = np.maximum(trades, 0.0)
+        cost = buys @ unit_values
+        scale = np.where(cost > available, np.clip(available, 0.0, None) / np.where(cost > 0, cost, 1.0), 1.0)
+        scaled_down = scale < 1.0
+        if scaled_down.any():
+            scaled = np.floor(buys[scaled_down] * scale[scaled_down, None] / lots) * lots
+            scaled[scaled * unit_values < self.min_trade_value] = 0.0
+            trades[scaled_down] = np.where(trades[scaled_down] > 0, scaled, trades[scaled_down])
+
+        return RebalancePlan(names, contracts, contract_prices, quantities, trades, cash_balances - trades @ unit_values, nav)
+
+    def rebalance(
+            self,
+            portfolios: Sequence[Portfolio],
+            target_weights: DataFrame,
+            prices: Dict[Contract, Union[float, Decimal]],
+            cash: Optional[Dict[str, float]] = None,
+            order_type: OrderType = OrderType.MARKET
+    ) -> Dict[str, List[Order]]:
+        """
+        Compute the trades bringing the portfolios to their target weights and add them as orders to the portfolios
+
+        Args:
+            portfolios: Portfolios to rebalance
+            target_weights: Target weight of each contract (columns) for each portfolio name (index)
+            prices: Price of each contract held or targeted
+            cash: Cash available in each portfolio, by name, zero by default
+            order_type: Type of the orders, MARKET or LIMIT at the given prices
+
+        Returns:
+            Dictionary of portfolio name to the orders added
+
+        Raises:
+            ValueError: If a price is missing, the target weights of a portfolio sum to more than one or the order type
+                is neither MARKET nor LIMIT
+        """
+        orders = self.plan(portfolios, target_weights, prices, cash).orders(order_type)
+        for portfolio in portfolios:
+            for order in orders.get(portfolio.name, []):
+                portfolio.add_order(order)
+        return orders